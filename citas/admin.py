@@ -1,12 +1,75 @@
 
 # citas/admin.py
 
+from datetime import timedelta
+
+from django import forms
 from django.contrib import admin
-from .models import Cita # Asegúrate de importar Cita
+
+from usuarios.admin import BusquedaRutMixin
+from .models import Cita, HorarioAtencion, HorarioEspecial, EsperaCupo, OfertaCupo, OcupacionDiaria, OcupacionHorario, CITA_CANCELADA # Asegúrate de importar Cita
+from .reservas import MENSAJE_HORARIO_OCUPADO, granulos_de_intervalo
+
+
+class CitaAdminForm(forms.ModelForm):
+    class Meta:
+        model = Cita
+        fields = '__all__'
+
+    def clean(self):
+        # Cita.save() reserva los gránulos; aquí se avisa del choque como error del formulario
+        datos = super().clean()
+        kinesiologo, inicio = datos.get('kinesiologo'), datos.get('fecha_hora_inicio')
+        duracion, estado = datos.get('duracion_minutos'), datos.get('estado')
+        if kinesiologo and inicio and duracion and estado != CITA_CANCELADA:
+            granulos = granulos_de_intervalo(inicio, inicio + timedelta(minutes=duracion))
+            ocupado = OcupacionHorario.objects.filter(
+                kinesiologo=kinesiologo, granulo__in=granulos,
+            ).exclude(cita_id=self.instance.pk).exists()
+            if ocupado:
+                raise forms.ValidationError(MENSAJE_HORARIO_OCUPADO)
+        return datos
+
 
 @admin.register(Cita)
 class CitaAdmin(admin.ModelAdmin):
+    form = CitaAdminForm
     list_display = ('id', 'fecha_hora_inicio', 'paciente', 'kinesiologo', 'estado')
     list_filter = ('estado', 'kinesiologo')
     search_fields = ('paciente__perfil__nombre', 'kinesiologo__perfil__nombre')
-    date_hierarchy = 'fecha_hora_inicio'
\ No newline at end of file
+    date_hierarchy = 'fecha_hora_inicio'
+
+
+@admin.register(HorarioAtencion)
+class HorarioAtencionAdmin(admin.ModelAdmin):
+    list_display = ('kinesiologo', 'dia_semana', 'hora_inicio', 'hora_fin', 'duracion_cita_minutos')
+    list_filter = ('kinesiologo', 'dia_semana')
+
+
+@admin.register(HorarioEspecial)
+class HorarioEspecialAdmin(admin.ModelAdmin):
+    list_display = ('kinesiologo', 'fecha_desde', 'fecha_hasta', 'hora_inicio', 'hora_fin', 'motivo')
+    list_filter = ('kinesiologo',)
+    date_hierarchy = 'fecha_desde'
+
+
+
+@admin.register(EsperaCupo)
+class EsperaCupoAdmin(BusquedaRutMixin, admin.ModelAdmin):
+    list_display = ('paciente', 'dias_semana', 'hora_desde', 'hora_hasta', 'fecha_desde', 'fecha_hasta', 'activa')
+    list_filter = ('activa',)
+    search_fields = ('paciente__nombre', 'paciente__apellido')
+    campo_rut_normalizado = 'paciente__rut_normalizado'
+
+
+@admin.register(OfertaCupo)
+class OfertaCupoAdmin(admin.ModelAdmin):
+    list_display = ('espera', 'kinesiologo', 'fecha_hora_inicio', 'expira_en', 'estado')
+    list_filter = ('estado', 'kinesiologo')
+
+
+@admin.register(OcupacionDiaria)
+class OcupacionDiariaAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'kinesiologo', 'minutos_jornada', 'minutos_agendados', 'minutos_bloqueados', 'minutos_disponibles')
+    list_filter = ('kinesiologo',)
+    date_hierarchy = 'fecha'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CitasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'citas'
+
+    def ready(self):
+        # Registra los receptores que invalidan la caché de disponibilidad
+        from . import signals  # noqa: F401
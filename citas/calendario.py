@@ -0,0 +1,266 @@
+# citas/calendario.py
+
+"""
+Feeds iCalendar (.ics) de la agenda de cada kinesiólogo y de cada paciente.
+
+Los clientes de calendario consultan el feed muy seguido, así que:
+
+- El acceso es con un token firmado en la URL (sin sesión). El token lleva
+  la generación del enlace del dueño (AccesoCalendario): regenerarlo revoca
+  los enlaces anteriores. La generación vigente se lee de la caché.
+- Cada dueño tiene una versión de agenda en la caché, que cambia al
+  confirmarse cualquier cambio de sus citas o bloqueos. De ella salen el
+  ETag y el Last-Modified: un feed sin cambios responde 304 sin consultar
+  la BD.
+- La versión y la generación expiran de la caché: con una caché por proceso,
+  un proceso que no vio el cambio lo toma a lo más tras ese tiempo.
+- Cuando hay que generarlo, los eventos se transmiten a medida que se leen
+  (StreamingHttpResponse sobre .iterator() por bloques), sin armar el
+  archivo completo en memoria.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    Cita, BloqueoHorario, AccesoCalendario, CITA_PENDIENTE, CITA_CANCELADA,
+    CALENDARIO_KINESIOLOGO, CALENDARIO_PACIENTE,
+)
+from .cambios import VIGENCIA_VERSION, clave_version as clave_version_kinesiologo
+from .disponibilidad import reglas_vigentes
+
+
+SALT_TOKEN = 'citas.calendario.token'
+PREFIJO_CLAVE = 'citas:calendario'
+
+# Tras regenerar un enlace, otro proceso puede aceptar el anterior hasta este tiempo
+VIGENCIA_GENERACION = 300
+
+# Se incluyen las citas desde esta cantidad de días atrás (las futuras, todas)
+DIAS_HISTORIAL = 30
+# Las reglas de bloqueo recurrente (muchas sin término) se expanden hasta esta cantidad de días adelante
+DIAS_REGLAS = 180
+TAMANO_BLOQUE = 500
+
+PRODID = '-//KineGestion//Agenda//ES'
+DOMINIO_UID = 'kinegestion'
+
+
+# ----------------------------------------------------------------------
+# Tokens de acceso
+# ----------------------------------------------------------------------
+
+def clave_generacion(tipo, propietario_id):
+    return f"{PREFIJO_CLAVE}:generacion:{tipo}:{propietario_id}"
+
+
+def _consulta_generacion(tipo, propietario_id):
+    return AccesoCalendario.objects.filter(tipo=tipo, propietario_id=propietario_id).values_list('generacion', flat=True)
+
+
+def generacion_token(tipo, propietario_id):
+    """Generación vigente del enlace del dueño (0 si nunca se regeneró)."""
+    clave = clave_generacion(tipo, propietario_id)
+    generacion = cache.get(clave)
+    if generacion is None:
+        generacion = _consulta_generacion(tipo, propietario_id).first() or 0
+        cache.set(clave, generacion, VIGENCIA_GENERACION)
+    return generacion
+
+
+async def ageneracion_token(tipo, propietario_id):
+    clave = clave_generacion(tipo, propietario_id)
+    generacion = await cache.aget(clave)
+    if generacion is None:
+        generacion = await _consulta_generacion(tipo, propietario_id).afirst() or 0
+        await cache.aset(clave, generacion, VIGENCIA_GENERACION)
+    return generacion
+
+
+def _firmar(tipo, propietario_id, generacion):
+    return signing.dumps([tipo, propietario_id, generacion], salt=SALT_TOKEN, compress=True)
+
+
+def crear_token(tipo, propietario_id):
+    """Token opaco y firmado que identifica el calendario en la URL del feed."""
+    return _firmar(tipo, propietario_id, generacion_token(tipo, propietario_id))
+
+
+async def acrear_token(tipo, propietario_id):
+    return _firmar(tipo, propietario_id, await ageneracion_token(tipo, propietario_id))
+
+
+def regenerar_token(tipo, propietario_id):
+    """
+    Revoca los enlaces anteriores del dueño y retorna el token nuevo. La
+    generación se incrementa en la BD y se borra de la caché al confirmar.
+    """
+    with transaction.atomic():
+        acceso, _ = AccesoCalendario.objects.select_for_update().get_or_create(tipo=tipo, propietario_id=propietario_id)
+        AccesoCalendario.objects.filter(pk=acceso.pk).update(generacion=F('generacion') + 1)
+        generacion = acceso.generacion + 1
+        transaction.on_commit(lambda: cache.set(clave_generacion(tipo, propietario_id), generacion, VIGENCIA_GENERACION))
+    return _firmar(tipo, propietario_id, generacion)
+
+
+def leer_token(token):
+    """Retorna (tipo, propietario_id) del token, o None si no es válido o fue revocado."""
+    try:
+        # Los tokens anteriores a las generaciones (sin el tercer elemento) son la generación 0
+        tipo, propietario_id, *generacion = signing.loads(token, salt=SALT_TOKEN)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if tipo not in (CALENDARIO_KINESIOLOGO, CALENDARIO_PACIENTE) or not isinstance(propietario_id, int):
+        return None
+    if (generacion[0] if generacion else 0) != generacion_token(tipo, propietario_id):
+        return None
+    return tipo, propietario_id
+
+
+# ----------------------------------------------------------------------
+# Versión de la agenda de cada dueño
+# ----------------------------------------------------------------------
+
+def clave_version(tipo, propietario_id):
+    # La del kinesiólogo es la misma versión que publica el feed en vivo del dashboard
+    if tipo == CALENDARIO_KINESIOLOGO:
+        return clave_version_kinesiologo(propietario_id)
+    return f"{PREFIJO_CLAVE}:version:{tipo}:{propietario_id}"
+
+
+def publicar_pacientes(paciente_ids):
+    """Cambia, al confirmar la transacción, la versión del calendario de los pacientes."""
+    claves = [clave_version(CALENDARIO_PACIENTE, paciente_id) for paciente_id in set(paciente_ids) if paciente_id]
+    if claves:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(claves, time.time_ns()), VIGENCIA_VERSION))
+
+
+def version_agenda(tipo, propietario_id):
+    """
+    Versión actual (nanosegundos desde la época) de la agenda del dueño. Si
+    no está en la caché se crea una nueva: el feed se considera modificado.
+    """
+    clave = clave_version(tipo, propietario_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), VIGENCIA_VERSION)
+        version = cache.get(clave)
+    return version
+
+
+def etag_agenda(tipo, propietario_id):
+    return f'"{tipo}{propietario_id}-{version_agenda(tipo, propietario_id)}"'
+
+
+def ultima_modificacion(tipo, propietario_id):
+    return datetime.fromtimestamp(version_agenda(tipo, propietario_id) / 1e9, tz=dt_timezone.utc)
+
+
+# ----------------------------------------------------------------------
+# Generación del feed
+# ----------------------------------------------------------------------
+
+def _texto(valor):
+    """Escapa un texto según RFC 5545 (barra invertida, punto y coma, coma y saltos de línea)."""
+    return (
+        (valor or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fecha(valor):
+    return valor.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _linea(nombre, valor):
+    """Línea de contenido terminada en CRLF, plegada a 75 octetos."""
+    datos = f"{nombre}:{valor}".encode('utf-8')
+    partes = []
+    while len(datos) > 75:
+        corte = 75 if not partes else 74
+        # No se corta en medio de un carácter UTF-8
+        while corte and (datos[corte] & 0xC0) == 0x80:
+            corte -= 1
+        partes.append(datos[:corte])
+        datos = datos[corte:]
+    partes.append(datos)
+    return b'\r\n '.join(partes).decode('utf-8') + '\r\n'
+
+
+def _evento(uid, inicio, fin, resumen, estado, marca, descripcion=''):
+    lineas = [
+        'BEGIN:VEVENT\r\n',
+        _linea('UID', f"{uid}@{DOMINIO_UID}"),
+        _linea('DTSTAMP', _fecha(marca)),
+        _linea('DTSTART', _fecha(inicio)),
+        _linea('DTEND', _fecha(fin)),
+        _linea('SUMMARY', _texto(resumen)),
+        _linea('STATUS', estado),
+    ]
+    if descripcion:
+        lineas.append(_linea('DESCRIPTION', _texto(descripcion)))
+    lineas.append('END:VEVENT\r\n')
+    return ''.join(lineas)
+
+
+ESTADOS_ICS = {CITA_PENDIENTE: 'TENTATIVE', CITA_CANCELADA: 'CANCELLED'}
+
+
+def eventos_calendario(tipo, propietario_id, nombre_calendario):
+    """
+    Generador del contenido .ics: encabezado, un VEVENT por cita (y por
+    bloqueo y por ocurrencia de sus reglas de bloqueo recurrente hasta
+    DIAS_REGLAS adelante, en el calendario del kinesiólogo) y cierre. Las
+    filas se leen por bloques de TAMANO_BLOQUE con .iterator(), solo con
+    las columnas necesarias.
+    """
+    marca = timezone.now()
+    desde = marca - timedelta(days=DIAS_HISTORIAL)
+
+    yield (
+        'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'
+        + _linea('PRODID', PRODID)
+        + 'CALSCALE:GREGORIAN\r\nMETHOD:PUBLISH\r\n'
+        + _linea('X-WR-CALNAME', _texto(nombre_calendario))
+    )
+
+    if tipo == CALENDARIO_KINESIOLOGO:
+        citas = Cita.objects.filter(kinesiologo_id=propietario_id, fecha_hora_fin__gte=desde)
+        contraparte = ('paciente__nombre', 'paciente__apellido')
+    else:
+        citas = Cita.objects.filter(paciente_id=propietario_id, fecha_hora_fin__gte=desde)
+        contraparte = ('kinesiologo__perfil__nombre', 'kinesiologo__perfil__apellido')
+
+    filas = citas.order_by('fecha_hora_inicio').values_list(
+        'pk', 'fecha_hora_inicio', 'fecha_hora_fin', 'estado', 'motivo', 'fecha_creacion', *contraparte
+    ).iterator(chunk_size=TAMANO_BLOQUE)
+    for pk, inicio, fin, estado, motivo, creada, nombre, apellido in filas:
+        yield _evento(
+            f"cita-{pk}", inicio, fin, f"Kinesiología: {nombre} {apellido}",
+            ESTADOS_ICS.get(estado, 'CONFIRMED'), creada, motivo,
+        )
+
+    if tipo == CALENDARIO_KINESIOLOGO:
+        bloqueos = BloqueoHorario.objects.filter(
+            kinesiologo_id=propietario_id, fecha_hora_fin__gte=desde
+        ).order_by('fecha_hora_inicio').values_list(
+            'pk', 'fecha_hora_inicio', 'fecha_hora_fin', 'motivo'
+        ).iterator(chunk_size=TAMANO_BLOQUE)
+        for pk, inicio, fin, motivo in bloqueos:
+            yield _evento(f"bloqueo-{pk}", inicio, fin, f"Bloqueado: {motivo or 'Bloqueo personal'}", 'CONFIRMED', marca)
+
+        hasta = marca + timedelta(days=DIAS_REGLAS)
+        for regla in reglas_vigentes([propietario_id], desde, hasta):
+            for inicio, fin in regla.expandir(desde, hasta):
+                yield _evento(
+                    f"regla-{regla.pk}-{timezone.localtime(inicio):%Y%m%d}", inicio, fin,
+                    f"Bloqueado: {regla.motivo or 'Bloqueo recurrente'}", 'CONFIRMED', marca,
+                )
+
+    yield 'END:VCALENDAR\r\n'
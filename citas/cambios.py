@@ -0,0 +1,203 @@
+# citas/cambios.py
+
+"""
+Feed en vivo de cambios de la agenda de cada kinesiólogo.
+
+Las señales de Cita y BloqueoHorario registran un CambioAgenda por cada
+guardado o eliminación y, al confirmar la transacción, cambian la versión del
+feed del kinesiólogo en la caché. El endpoint de Server-Sent Events revisa
+esa versión (una lectura de caché) y solo consulta la BD cuando cambió, para
+enviar al dashboard los datos de las filas afectadas, no la página completa.
+"""
+
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cita, BloqueoHorario, CambioAgenda, CAMBIO_CITA, CAMBIO_BLOQUEO, CITA_FINALIZADA
+from .disponibilidad import inicio_del_dia
+
+
+PREFIJO_CLAVE = 'citas:cambios_agenda'
+
+# La versión expira: con una caché por proceso (LocMem), un proceso que no vio
+# el cambio vuelve a consultar la BD a lo más tras este tiempo
+VIGENCIA_VERSION = 300
+
+# Una conexión SSE se cierra tras este tiempo; el navegador se reconecta solo
+DURACION_CONEXION = 60
+INTERVALO_REVISION = 1
+INTERVALO_LATIDO = 15
+RECONEXION_MS = 2000
+# Bajo WSGI cada petición responde de inmediato: el navegador vuelve a preguntar tras este tiempo
+RECONEXION_WSGI_MS = 5000
+MAX_CAMBIOS_POR_LECTURA = 200
+
+# Los cambios se conservan un día; se purgan cada PURGA_CADA registros
+RETENCION_CAMBIOS = timedelta(days=1)
+PURGA_CADA = 500
+
+
+# ----------------------------------------------------------------------
+# Registro de cambios
+# ----------------------------------------------------------------------
+
+def clave_version(kinesiologo_id):
+    return f"{PREFIJO_CLAVE}:version:{kinesiologo_id}"
+
+
+def publicar(kinesiologo_id):
+    """Avisa a los feeds abiertos del kinesiólogo que hay cambios nuevos."""
+    cache.set(clave_version(kinesiologo_id), time.time_ns(), VIGENCIA_VERSION)
+
+
+def registrar_cambios(kinesiologo_id, tipo, objeto_ids):
+    """
+    Registra el cambio de uno o varios objetos de la agenda del kinesiólogo.
+    Sirve también para operaciones masivas (bulk_create, update) que no
+    disparan señales.
+    """
+    if not kinesiologo_id or not objeto_ids:
+        return
+    cambios = CambioAgenda.objects.bulk_create([
+        CambioAgenda(kinesiologo_id=kinesiologo_id, tipo=tipo, objeto_id=objeto_id)
+        for objeto_id in objeto_ids
+    ])
+    if any(cambio.pk and cambio.pk % PURGA_CADA == 0 for cambio in cambios):
+        CambioAgenda.objects.filter(fecha__lt=timezone.now() - RETENCION_CAMBIOS).delete()
+    transaction.on_commit(lambda: publicar(kinesiologo_id))
+
+
+def ultimo_cambio(kinesiologo_id):
+    """Id del último cambio registrado del kinesiólogo (cursor inicial del feed)."""
+    ultimo = CambioAgenda.objects.filter(kinesiologo_id=kinesiologo_id).order_by('-id').values_list('id', flat=True).first()
+    return ultimo or 0
+
+
+async def aultimo_cambio(kinesiologo_id):
+    ultimo = await CambioAgenda.objects.filter(kinesiologo_id=kinesiologo_id).order_by('-id').values_list('id', flat=True).afirst()
+    return ultimo or 0
+
+
+# ----------------------------------------------------------------------
+# Lectura del feed
+# ----------------------------------------------------------------------
+
+def datos_cita(cita, desde):
+    """Datos de una fila del dashboard; `visible` indica si la fila debe mostrarse."""
+    return {
+        'id': cita.pk,
+        'inicio': timezone.localtime(cita.fecha_hora_inicio).isoformat(),
+        'estado': cita.estado,
+        'estado_display': cita.get_estado_display(),
+        'paciente': f"{cita.paciente.nombre} {cita.paciente.apellido}",
+        'motivo': cita.motivo or '',
+        'visible': cita.estado != CITA_FINALIZADA and cita.fecha_hora_inicio >= desde,
+    }
+
+
+def datos_bloqueo(bloqueo, desde):
+    return {
+        'id': bloqueo.pk,
+        'inicio': timezone.localtime(bloqueo.fecha_hora_inicio).isoformat(),
+        'fin': timezone.localtime(bloqueo.fecha_hora_fin).isoformat(),
+        'motivo': bloqueo.motivo or '',
+        'visible': bloqueo.fecha_hora_fin > desde,
+    }
+
+
+async def acambios_desde(kinesiologo_id, cursor):
+    """
+    Retorna (eventos, nuevo_cursor, hay_mas) con los cambios posteriores a
+    `cursor`, leyendo a lo más MAX_CAMBIOS_POR_LECTURA.
+    Varios cambios de un mismo objeto se envían como un solo evento con su
+    estado actual; un objeto que ya no existe se envía como eliminado.
+    """
+    ultimos = {}
+    leidos = 0
+    async for cambio_id, tipo, objeto_id in CambioAgenda.objects.filter(
+        kinesiologo_id=kinesiologo_id, pk__gt=cursor
+    ).order_by('id').values_list('id', 'tipo', 'objeto_id')[:MAX_CAMBIOS_POR_LECTURA]:
+        ultimos[(tipo, objeto_id)] = cambio_id
+        cursor = cambio_id
+        leidos += 1
+
+    if not ultimos:
+        return [], cursor, False
+
+    ids_citas = [objeto_id for tipo, objeto_id in ultimos if tipo == CAMBIO_CITA]
+    ids_bloqueos = [objeto_id for tipo, objeto_id in ultimos if tipo == CAMBIO_BLOQUEO]
+    desde = inicio_del_dia(timezone.localdate())
+
+    objetos = {}
+    if ids_citas:
+        async for cita in Cita.objects.filter(pk__in=ids_citas, kinesiologo_id=kinesiologo_id).select_related('paciente'):
+            objetos[(CAMBIO_CITA, cita.pk)] = datos_cita(cita, desde)
+    if ids_bloqueos:
+        async for bloqueo in BloqueoHorario.objects.filter(pk__in=ids_bloqueos, kinesiologo_id=kinesiologo_id):
+            objetos[(CAMBIO_BLOQUEO, bloqueo.pk)] = datos_bloqueo(bloqueo, desde)
+
+    eventos = [
+        {
+            'id': cambio_id,
+            'tipo': tipo,
+            'datos': objetos.get((tipo, objeto_id), {'id': objeto_id, 'visible': False}),
+        }
+        for (tipo, objeto_id), cambio_id in sorted(ultimos.items(), key=lambda item: item[1])
+    ]
+    return eventos, cursor, leidos == MAX_CAMBIOS_POR_LECTURA
+
+
+def formatear_evento(evento):
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento['datos'])}\n\n"
+
+
+async def alote_eventos(kinesiologo_id, cursor):
+    """
+    Cuerpo SSE completo con los cambios posteriores a `cursor`, para WSGI:
+    no espera cambios nuevos (no retiene un worker síncrono) y el campo
+    retry indica al navegador cuándo volver a preguntar. Si quedaron cambios
+    sin leer, pide reconectar de inmediato.
+    """
+    eventos, cursor, hay_mas = await acambios_desde(kinesiologo_id, cursor)
+    reconexion = 0 if hay_mas else RECONEXION_WSGI_MS
+    return f"retry: {reconexion}\n\n" + ''.join(formatear_evento(evento) for evento in eventos)
+
+
+async def eventos_agenda(kinesiologo_id, cursor):
+    """
+    Generador asíncrono de Server-Sent Events con los cambios de la agenda
+    (solo bajo ASGI). Entre revisiones solo lee la versión del feed en la
+    caché; cada evento lleva el id del cambio, así el navegador reanuda con
+    Last-Event-ID.
+    """
+    yield f"retry: {RECONEXION_MS}\n\n"
+
+    version_vista = None
+    fin_conexion = time.monotonic() + DURACION_CONEXION
+    ultimo_envio = time.monotonic()
+    while time.monotonic() < fin_conexion:
+        version = await cache.aget(clave_version(kinesiologo_id))
+        if version is None or version != version_vista:
+            if version is None:
+                # Sin versión en caché (expulsada o reiniciada): se crea una y se consulta la BD
+                await cache.aadd(clave_version(kinesiologo_id), time.time_ns(), VIGENCIA_VERSION)
+                version = await cache.aget(clave_version(kinesiologo_id))
+            eventos, cursor, hay_mas = await acambios_desde(kinesiologo_id, cursor)
+            # Si quedaron cambios sin leer, se vuelve a consultar en la siguiente vuelta
+            version_vista = None if hay_mas else version
+            for evento in eventos:
+                yield formatear_evento(evento)
+            if eventos:
+                ultimo_envio = time.monotonic()
+
+        if time.monotonic() - ultimo_envio >= INTERVALO_LATIDO:
+            # Comentario SSE: mantiene viva la conexión a través de proxies
+            yield ": latido\n\n"
+            ultimo_envio = time.monotonic()
+        await asyncio.sleep(INTERVALO_REVISION)
@@ -0,0 +1,224 @@
+# citas/disponibilidad.py
+
+"""
+Motor de disponibilidad de la agenda.
+
+Las citas y bloqueos de un kinesiólogo se cargan una sola vez, se fusionan en
+una lista ordenada de intervalos ocupados y luego se recorren los huecos libres
+en una única pasada (O(n log n)), en vez de comparar cada horario posible
+contra todas las citas y bloqueos del día.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Cita, BloqueoHorario, ReglaBloqueo, OfertaCupo, CITA_CANCELADA, OFERTA_PENDIENTE
+from .jornadas import DURACION_CITA, obtener_plantillas, turnos_del_dia
+
+
+# ----------------------------------------------------------------------
+# Operaciones sobre intervalos
+# ----------------------------------------------------------------------
+
+def fusionar_intervalos(intervalos):
+    """
+    Ordena y fusiona intervalos (inicio, fin) semiabiertos.
+    Los intervalos que se traslapan o se tocan quedan como uno solo.
+    """
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fin <= inicio:
+            continue
+        if fusionados and inicio <= fusionados[-1][1]:
+            if fin > fusionados[-1][1]:
+                fusionados[-1] = (fusionados[-1][0], fin)
+        else:
+            fusionados.append((inicio, fin))
+    return fusionados
+
+
+def huecos_libres(ocupados, inicio, fin):
+    """
+    Recorre una lista de intervalos ocupados (ya fusionada y ordenada)
+    y retorna los huecos libres dentro de [inicio, fin).
+    """
+    huecos = []
+    cursor = inicio
+    # Al estar fusionados, los fines también quedan ordenados: se salta por
+    # búsqueda binaria a los intervalos que terminan después de `inicio`.
+    primero = bisect_right(ocupados, inicio, key=lambda intervalo: intervalo[1])
+    for ocupado_inicio, ocupado_fin in islice(ocupados, primero, None):
+        if ocupado_inicio >= fin:
+            break
+        if ocupado_inicio > cursor:
+            huecos.append((cursor, ocupado_inicio))
+        cursor = ocupado_fin
+        if cursor >= fin:
+            break
+
+    if cursor < fin:
+        huecos.append((cursor, fin))
+    return huecos
+
+
+def horarios_disponibles(ocupados, inicio, fin, duracion=DURACION_CITA, paso=None):
+    """
+    Retorna los horarios de inicio (alineados a una grilla que parte en `inicio`)
+    en los que cabe una cita de `duracion` minutos sin tocar ningún intervalo ocupado.
+    """
+    duracion = timedelta(minutes=duracion)
+    paso = timedelta(minutes=paso) if paso else duracion
+
+    horarios = []
+    for hueco_inicio, hueco_fin in huecos_libres(ocupados, inicio, fin):
+        # Primer punto de la grilla que cae dentro del hueco (división con techo)
+        saltos = -((inicio - hueco_inicio) // paso)
+        hora_actual = inicio + saltos * paso
+        while hora_actual + duracion <= hueco_fin:
+            horarios.append(hora_actual)
+            hora_actual += paso
+    return horarios
+
+
+def horarios_por_turnos(ocupados, turnos):
+    """Horarios libres de una lista de turnos (inicio, fin, duracion), cada uno con su propia grilla."""
+    horarios = []
+    for turno_inicio, turno_fin, duracion in turnos:
+        horarios.extend(horarios_disponibles(ocupados, turno_inicio, turno_fin, duracion))
+    return horarios
+
+
+# ----------------------------------------------------------------------
+# Carga desde la base de datos
+# ----------------------------------------------------------------------
+
+def inicio_del_dia(fecha):
+    """
+    Retorna la medianoche local (aware) de una fecha. Permite filtrar por día con
+    rangos semiabiertos sobre la columna indexada, en vez de `__date`, que envuelve
+    la columna en una función y anula el índice.
+    """
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def reglas_vigentes(kinesiologo_ids, inicio, fin):
+    """Reglas de bloqueo recurrente de los kinesiólogos cuya vigencia toca la ventana [inicio, fin)."""
+    return ReglaBloqueo.objects.filter(
+        kinesiologo_id__in=kinesiologo_ids,
+        vigente_desde__lte=timezone.localtime(fin).date(),
+    ).filter(
+        Q(vigente_hasta__isnull=True) | Q(vigente_hasta__gte=timezone.localtime(inicio).date())
+    )
+
+
+def obtener_intervalos_ocupados(kinesiologo_id, inicio, fin):
+    """
+    Carga las citas activas, los bloqueos, las reglas de bloqueo recurrente y
+    los cupos retenidos para la lista de espera del kinesiólogo que tocan la
+    ventana [inicio, fin) y los retorna fusionados.
+    Los bloqueos de varios días se incluyen aunque hayan comenzado antes de la ventana.
+    """
+    return obtener_intervalos_ocupados_por_kinesiologo([kinesiologo_id], inicio, fin).get(int(kinesiologo_id), [])
+
+
+def _consultas_ocupados(kinesiologo_ids, inicio, fin):
+    """
+    Consultas (aún sin evaluar) de lo que ocupa tiempo en la ventana [inicio, fin):
+    filas (kinesiologo_id, inicio, fin) de citas activas, bloqueos y cupos
+    retenidos para la lista de espera, más las reglas de bloqueo recurrente.
+    """
+    citas = Cita.objects.filter(
+        kinesiologo_id__in=kinesiologo_ids,
+        fecha_hora_inicio__lt=fin,
+        fecha_hora_fin__gt=inicio,
+    ).exclude(
+        estado=CITA_CANCELADA
+    ).values_list('kinesiologo_id', 'fecha_hora_inicio', 'fecha_hora_fin')
+
+    bloqueos = BloqueoHorario.objects.filter(
+        kinesiologo_id__in=kinesiologo_ids,
+        fecha_hora_inicio__lt=fin,
+        fecha_hora_fin__gt=inicio,
+    ).values_list('kinesiologo_id', 'fecha_hora_inicio', 'fecha_hora_fin')
+
+    # Los cupos ofrecidos a la lista de espera quedan retenidos mientras la oferta esté vigente
+    ofertas = OfertaCupo.objects.filter(
+        kinesiologo_id__in=kinesiologo_ids,
+        estado=OFERTA_PENDIENTE,
+        expira_en__gt=timezone.now(),
+        fecha_hora_inicio__lt=fin,
+        fecha_hora_fin__gt=inicio,
+    ).values_list('kinesiologo_id', 'fecha_hora_inicio', 'fecha_hora_fin')
+
+    return (citas, bloqueos, ofertas), reglas_vigentes(kinesiologo_ids, inicio, fin)
+
+
+def _agrupar_ocupados(kinesiologo_ids, inicio, fin, filas, reglas):
+    intervalos = {kine_id: [] for kine_id in kinesiologo_ids}
+    for kine_id, ocupado_inicio, ocupado_fin in filas:
+        intervalos[kine_id].append((ocupado_inicio, ocupado_fin))
+
+    # Los bloqueos recurrentes se expanden solo para la ventana consultada
+    for regla in reglas:
+        intervalos[regla.kinesiologo_id].extend(regla.expandir(inicio, fin))
+
+    return {kine_id: fusionar_intervalos(lista) for kine_id, lista in intervalos.items()}
+
+
+def obtener_intervalos_ocupados_por_kinesiologo(kinesiologo_ids, inicio, fin):
+    """
+    Igual que `obtener_intervalos_ocupados`, pero para varios kinesiólogos a la vez:
+    siempre son cuatro consultas, sin importar cuántos kinesiólogos o días abarque la ventana.
+    Retorna un diccionario {kinesiologo_id: [intervalos fusionados]}.
+    """
+    kinesiologo_ids = [int(kine_id) for kine_id in kinesiologo_ids]
+    if not kinesiologo_ids:
+        return {}
+
+    consultas, reglas = _consultas_ocupados(kinesiologo_ids, inicio, fin)
+    filas = [fila for consulta in consultas for fila in consulta]
+    return _agrupar_ocupados(kinesiologo_ids, inicio, fin, filas, reglas)
+
+
+async def aobtener_intervalos_ocupados_por_kinesiologo(kinesiologo_ids, inicio, fin):
+    """Versión asíncrona de `obtener_intervalos_ocupados_por_kinesiologo` (ORM asíncrono)."""
+    kinesiologo_ids = [int(kine_id) for kine_id in kinesiologo_ids]
+    if not kinesiologo_ids:
+        return {}
+
+    consultas, reglas = _consultas_ocupados(kinesiologo_ids, inicio, fin)
+    filas = [fila for consulta in consultas async for fila in consulta]
+    return _agrupar_ocupados(kinesiologo_ids, inicio, fin, filas, [regla async for regla in reglas])
+
+
+async def aobtener_intervalos_ocupados(kinesiologo_id, inicio, fin):
+    ocupados = await aobtener_intervalos_ocupados_por_kinesiologo([kinesiologo_id], inicio, fin)
+    return ocupados.get(int(kinesiologo_id), [])
+
+
+def disponibilidad_por_rango(kinesiologo_ids, fecha_desde, fecha_hasta):
+    """
+    Calcula los horarios libres de varios kinesiólogos para cada día entre
+    `fecha_desde` y `fecha_hasta` (ambos incluidos), según los turnos de la
+    plantilla semanal de cada uno.
+    Retorna {kinesiologo_id: {fecha: [horarios]}}.
+    """
+    kinesiologo_ids = [int(kine_id) for kine_id in kinesiologo_ids]
+    inicio_rango = inicio_del_dia(fecha_desde)
+    fin_rango = inicio_del_dia(fecha_hasta + timedelta(days=1))
+    ocupados_por_kine = obtener_intervalos_ocupados_por_kinesiologo(kinesiologo_ids, inicio_rango, fin_rango)
+    plantillas = obtener_plantillas(kinesiologo_ids)
+
+    dias = [fecha_desde + timedelta(days=i) for i in range((fecha_hasta - fecha_desde).days + 1)]
+
+    disponibilidad = {}
+    for kine_id, ocupados in ocupados_por_kine.items():
+        disponibilidad[kine_id] = {
+            dia: horarios_por_turnos(ocupados, turnos_del_dia(plantillas[kine_id], dia))
+            for dia in dias
+        }
+    return disponibilidad
@@ -0,0 +1,257 @@
+# citas/exportaciones.py
+
+"""
+Exportación de citas y de metadatos de notas clínicas a CSV y XLSX.
+
+Las filas se leen con values_list(...).iterator(chunk_size=...) (tuplas,
+sin instanciar modelos ni cargar el queryset completo) y se escriben a
+medida que llegan: tanto el CSV como el XLSX se entregan como un generador
+de bloques de bytes, que sirve igual para una StreamingHttpResponse (el
+primer byte sale de inmediato) como para escribir un archivo desde un
+comando. La memoria usada no depende de la cantidad de filas.
+
+El XLSX se arma directamente como ZIP en modo de escritura secuencial
+(sin seek, con descriptores de datos) y con textos en línea (inlineStr),
+así no hace falta la tabla de textos compartidos ni una librería externa.
+"""
+
+import csv
+import re
+import zipfile
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from usuarios.models import Paciente
+from evaluaciones.models import NotaClinica
+from .models import Cita, ESTADOS_CITA
+from .disponibilidad import inicio_del_dia
+
+
+TAMANO_BLOQUE = 2000
+FORMATO_CSV = 'csv'
+FORMATO_XLSX = 'xlsx'
+FORMATOS = (FORMATO_CSV, FORMATO_XLSX)
+TIPOS_CONTENIDO = {
+    FORMATO_CSV: 'text/csv; charset=utf-8',
+    FORMATO_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+NOMBRES_ESTADO = dict(ESTADOS_CITA)
+NOMBRES_PREVISION = dict(Paciente.PREVISION_CHOICES)
+
+
+# ----------------------------------------------------------------------
+# Filas
+# ----------------------------------------------------------------------
+
+def _rango(queryset, campo, desde=None, hasta=None):
+    """Filtra `campo` entre los días locales `desde` y `hasta` (ambos incluidos)."""
+    if desde:
+        queryset = queryset.filter(**{f"{campo}__gte": inicio_del_dia(desde)})
+    if hasta:
+        queryset = queryset.filter(**{f"{campo}__lt": inicio_del_dia(hasta + timedelta(days=1))})
+    return queryset
+
+
+def _fecha_hora(valor):
+    return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M') if valor else ''
+
+
+ENCABEZADOS_CITAS = (
+    'ID', 'Inicio', 'Fin', 'Estado', 'Kinesiólogo', 'Paciente', 'RUT', 'Previsión', 'Motivo',
+)
+
+
+def filas_citas(desde=None, hasta=None, kinesiologo_id=None):
+    """Citas con paciente, kinesiólogo, estado y previsión, en orden de inicio."""
+    citas = _rango(Cita.objects.all(), 'fecha_hora_inicio', desde, hasta)
+    if kinesiologo_id:
+        citas = citas.filter(kinesiologo_id=kinesiologo_id)
+
+    filas = citas.order_by('fecha_hora_inicio', 'pk').values_list(
+        'pk', 'fecha_hora_inicio', 'fecha_hora_fin', 'estado',
+        'kinesiologo__perfil__nombre', 'kinesiologo__perfil__apellido',
+        'paciente__nombre', 'paciente__apellido', 'paciente__rut', 'paciente__prevision', 'motivo',
+    ).iterator(chunk_size=TAMANO_BLOQUE)
+    for pk, inicio, fin, estado, kine_nombre, kine_apellido, nombre, apellido, rut, prevision, motivo in filas:
+        yield (
+            pk, _fecha_hora(inicio), _fecha_hora(fin), NOMBRES_ESTADO.get(estado, estado),
+            f"{kine_nombre} {kine_apellido}", f"{nombre} {apellido}", rut or '',
+            NOMBRES_PREVISION.get(prevision, prevision), motivo or '',
+        )
+
+
+ENCABEZADOS_NOTAS = (
+    'Cita', 'Fecha de la cita', 'Estado de la cita', 'Nota registrada', 'Kinesiólogo', 'Paciente', 'RUT', 'Previsión',
+)
+
+
+def filas_notas(desde=None, hasta=None, kinesiologo_id=None):
+    """Metadatos de las notas clínicas (sin su contenido SOAP), por fecha de registro."""
+    notas = _rango(NotaClinica.objects.all(), 'fecha_creacion', desde, hasta)
+    if kinesiologo_id:
+        notas = notas.filter(kinesiologo_id=kinesiologo_id)
+
+    filas = notas.order_by('fecha_creacion', 'pk').values_list(
+        'cita_id', 'cita__fecha_hora_inicio', 'cita__estado', 'fecha_creacion',
+        'kinesiologo__perfil__nombre', 'kinesiologo__perfil__apellido',
+        'paciente__nombre', 'paciente__apellido', 'paciente__rut', 'paciente__prevision',
+    ).iterator(chunk_size=TAMANO_BLOQUE)
+    for cita_id, inicio, estado, creada, kine_nombre, kine_apellido, nombre, apellido, rut, prevision in filas:
+        yield (
+            cita_id, _fecha_hora(inicio), NOMBRES_ESTADO.get(estado, estado), _fecha_hora(creada),
+            f"{kine_nombre} {kine_apellido}", f"{nombre} {apellido}", rut or '',
+            NOMBRES_PREVISION.get(prevision, prevision),
+        )
+
+
+EXPORTACIONES = {
+    'citas': (ENCABEZADOS_CITAS, filas_citas),
+    'notas': (ENCABEZADOS_NOTAS, filas_notas),
+}
+
+
+# ----------------------------------------------------------------------
+# Escritores
+# ----------------------------------------------------------------------
+
+class _Bufer:
+    """Salida de solo escritura que acumula lo escrito hasta que se retira."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        datos = b''.join(parte if isinstance(parte, bytes) else parte.encode('utf-8') for parte in self.partes)
+        self.partes = []
+        return datos
+
+
+# Un texto que empieza así se interpreta como fórmula al abrir el CSV en una planilla
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _texto_csv(valor):
+    """Antepone ' a los textos que una planilla ejecutaría como fórmula (inyección de CSV)."""
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def escribir_csv(encabezados, filas, filas_por_bloque=500):
+    """Genera el CSV por bloques de bytes (UTF-8 con BOM, para que Excel reconozca los acentos)."""
+    bufer = _Bufer()
+    escritor = csv.writer(bufer)
+    bufer.write('\ufeff')
+    escritor.writerow(encabezados)
+    for numero, fila in enumerate(filas, 1):
+        escritor.writerow([_texto_csv(valor) for valor in fila])
+        if numero % filas_por_bloque == 0:
+            yield bufer.retirar()
+    yield bufer.retirar()
+
+
+def _columna(indice):
+    """Letra de la columna de Excel (0 -> A, 26 -> AA)."""
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+# Caracteres de control que XML no admite (p. ej. pegados en un motivo)
+CARACTERES_INVALIDOS_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _celda(referencia, valor):
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c r="{referencia}"><v>{valor}</v></c>'
+    texto = escape(CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c r="{referencia}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xml(numero, valores):
+    celdas = ''.join(_celda(f"{_columna(i)}{numero}", valor) for i, valor in enumerate(valores))
+    return f'<row r="{numero}">{celdas}</row>'
+
+
+XLSX_ARCHIVOS_FIJOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def escribir_xlsx(encabezados, filas, hoja='Datos', filas_por_bloque=500):
+    """
+    Genera el XLSX por bloques de bytes. La hoja se escribe fila a fila
+    dentro del ZIP: en memoria solo queda el bloque aún no entregado.
+    """
+    bufer = _Bufer()
+    with zipfile.ZipFile(bufer, 'w', compression=zipfile.ZIP_DEFLATED) as archivo:
+        for nombre, contenido in XLSX_ARCHIVOS_FIJOS.items():
+            archivo.writestr(nombre, contenido)
+        archivo.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(hoja)}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        yield bufer.retirar()
+
+        with archivo.open('xl/worksheets/sheet1.xml', 'w') as hoja_xml:
+            hoja_xml.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                .encode('utf-8')
+            )
+            hoja_xml.write(_fila_xml(1, encabezados).encode('utf-8'))
+            for numero, fila in enumerate(filas, 2):
+                hoja_xml.write(_fila_xml(numero, fila).encode('utf-8'))
+                if numero % filas_por_bloque == 0:
+                    yield bufer.retirar()
+            hoja_xml.write(b'</sheetData></worksheet>')
+    yield bufer.retirar()
+
+
+def exportar(tipo, formato, desde=None, hasta=None, kinesiologo_id=None):
+    """Generador de bytes de la exportación `tipo` ('citas' o 'notas') en `formato`."""
+    encabezados, generador_filas = EXPORTACIONES[tipo]
+    filas = generador_filas(desde, hasta, kinesiologo_id)
+    if formato == FORMATO_XLSX:
+        return escribir_xlsx(encabezados, filas, hoja=tipo.capitalize())
+    return escribir_csv(encabezados, filas)
+
+
+def nombre_archivo(tipo, formato, desde=None, hasta=None):
+    partes = [tipo] + [fecha.isoformat() for fecha in (desde, hasta) if fecha]
+    return f"{'_'.join(partes)}.{formato}"
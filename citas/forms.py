@@ -1,10 +1,15 @@
 # citas/forms.py
 
 from django import forms
-from .models import Cita, BloqueoHorario # <-- BloqueoHorario y Cita importados
+from .models import Cita, BloqueoHorario, ReglaBloqueo, EsperaCupo, DIAS_SEMANA # <-- BloqueoHorario y Cita importados
+from .mapa_disponibilidad import esta_libre
+from .jornadas import turno_de
+from .ocupacion_diaria import AGRUPACIONES, MAX_DIAS_REPORTE
 from usuarios.models import Kinesiologo, Paciente 
+from usuarios.rut import normalizar_rut, formatear_rut, validar_rut
 from django.contrib.auth import get_user_model
 from django.utils import timezone # Necesario para la validación de fecha/hora
+from datetime import datetime, timedelta
 
 
 User = get_user_model()
@@ -35,6 +40,25 @@ class CitaForm(forms.ModelForm):
             'motivo': 'Motivo de la Cita',
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        kinesiologo = cleaned_data.get('kinesiologo')
+        inicio = cleaned_data.get('fecha_hora_inicio')
+
+        if kinesiologo and inicio:
+            # La cita debe caer dentro de un turno de atención y dura lo que indica ese turno
+            turno = turno_de(kinesiologo.pk, inicio)
+            if turno is None or inicio + timedelta(minutes=turno[2]) > turno[1]:
+                raise forms.ValidationError("El horario seleccionado está fuera de la jornada de atención del kinesiólogo.")
+            duracion = turno[2]
+            self.instance.duracion_minutos = duracion
+
+            # Verificación rápida contra el mapa de disponibilidad en caché
+            if not esta_libre(kinesiologo.pk, inicio, duracion):
+                raise forms.ValidationError("El horario seleccionado ya no está disponible. Por favor, elige otro.")
+
+        return cleaned_data
+
 
 class RegistroPacienteForm(forms.ModelForm):
     
@@ -66,14 +90,19 @@ class RegistroPacienteForm(forms.ModelForm):
         }
         
     def clean_rut(self):
-        
-        rut = self.cleaned_data.get('rut')
-        # Limpieza básica para evitar errores de duplicidad antes de la creación del User
-        if User.objects.filter(username=rut).exists():
-             raise forms.ValidationError("Ya existe un usuario con este RUT.")
-        if Paciente.objects.filter(rut=rut).exists():
+        """
+        Valida el RUT (dígito verificador) y lo deja en formato canónico, que
+        también es el nombre de usuario. La duplicidad se revisa con una sola
+        consulta al índice único del RUT normalizado; un usuario tomado por otra
+        cuenta lo detecta la BD al guardar.
+        """
+        normalizado = normalizar_rut(self.cleaned_data.get('rut'))
+        if not normalizado:
+            raise forms.ValidationError("Debe ingresar el RUT.")
+        validar_rut(normalizado)
+        if Paciente.objects.filter(rut_normalizado=normalizado).exists():
             raise forms.ValidationError("Ya existe un paciente registrado con este RUT.")
-        return rut
+        return formatear_rut(normalizado)
 
 
 # >>>>>>>>>>>>>>>>>> FORMULARIO FALTANTE AÑADIDO <<<<<<<<<<<<<<<<<<<<
@@ -108,4 +137,218 @@ class BloqueoHorarioForm(forms.ModelForm):
             # if inicio < timezone.now(): 
             #     raise forms.ValidationError("No se puede bloquear un horario en el pasado.")
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class ReglaBloqueoForm(forms.ModelForm):
+    """
+    Formulario para que el Kinesiólogo cree un bloqueo recurrente
+    (p. ej. colación todos los días hábiles de 13:00 a 14:00).
+    """
+    dias_semana = forms.TypedMultipleChoiceField(
+        choices=DIAS_SEMANA,
+        coerce=int,
+        label="Días de la semana",
+        widget=forms.CheckboxSelectMultiple
+    )
+    excepciones = forms.CharField(
+        required=False,
+        label="Excepciones",
+        help_text="Fechas en que no aplica, separadas por coma (AAAA-MM-DD).",
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: 2025-12-25, 2026-01-01'})
+    )
+
+    class Meta:
+        model = ReglaBloqueo
+        # No incluimos kinesiologo aquí, ya que se asigna automáticamente en la vista.
+        fields = ['dias_semana', 'hora_inicio', 'hora_fin', 'vigente_desde', 'vigente_hasta', 'excepciones', 'motivo']
+        widgets = {
+            'hora_inicio': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'hora_fin': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'vigente_desde': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'vigente_hasta': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'motivo': forms.TextInput(attrs={'placeholder': 'Ej: Colación, Tarde administrativa', 'class': 'form-control'}),
+        }
+        labels = {
+            'hora_inicio': 'Desde las',
+            'hora_fin': 'Hasta las',
+            'vigente_desde': 'Vigente desde',
+            'vigente_hasta': 'Vigente hasta (opcional)',
+        }
+
+    def clean_dias_semana(self):
+        dias = sorted(set(self.cleaned_data.get('dias_semana') or []))
+        return ','.join(str(dia) for dia in dias)
+
+    def clean_excepciones(self):
+        texto = self.cleaned_data.get('excepciones') or ''
+        fechas = []
+        for valor in texto.split(','):
+            valor = valor.strip()
+            if not valor:
+                continue
+            try:
+                fechas.append(datetime.strptime(valor, '%Y-%m-%d').date().isoformat())
+            except ValueError:
+                raise forms.ValidationError(f"Fecha de excepción inválida: {valor}")
+        return sorted(set(fechas))
+
+
+class SerieSesionesForm(forms.Form):
+    """
+    Formulario para agendar una serie de sesiones (p. ej. un plan de 10 sesiones)
+    indicando días de la semana, hora y cantidad de sesiones o fecha de término.
+    """
+    kinesiologo = forms.ModelChoiceField(
+        queryset=Kinesiologo.objects.all(),
+        label="Seleccionar Kinesiólogo",
+        empty_label="--- Seleccione un Kinesiólogo ---",
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    fecha_inicio = forms.DateField(
+        label="Primera sesión desde",
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    dias_semana = forms.TypedMultipleChoiceField(
+        choices=DIAS_SEMANA,
+        coerce=int,
+        label="Días de la semana",
+        widget=forms.CheckboxSelectMultiple
+    )
+    hora = forms.TimeField(
+        label="Hora",
+        widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'})
+    )
+    cantidad = forms.IntegerField(
+        required=False, min_value=1, max_value=40,
+        label="Cantidad de sesiones",
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Ej: 10'})
+    )
+    fecha_fin = forms.DateField(
+        required=False,
+        label="O bien, hasta la fecha",
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    motivo = forms.CharField(
+        required=False,
+        label="Motivo del tratamiento",
+        widget=forms.Textarea(attrs={'rows': 3, 'class': 'form-control'})
+    )
+    omitir_conflictos = forms.BooleanField(
+        required=False,
+        label="Agendar solo las sesiones disponibles (omitir las que tienen conflicto)"
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        fecha_inicio = cleaned_data.get('fecha_inicio')
+        cantidad = cleaned_data.get('cantidad')
+        fecha_fin = cleaned_data.get('fecha_fin')
+
+        if not cantidad and not fecha_fin:
+            raise forms.ValidationError("Indica la cantidad de sesiones o la fecha de término de la serie.")
+        if fecha_inicio and fecha_fin and fecha_fin < fecha_inicio:
+            raise forms.ValidationError("La fecha de término debe ser posterior a la fecha de inicio.")
+        if fecha_inicio and fecha_inicio < timezone.localdate():
+            raise forms.ValidationError("La serie no puede comenzar en el pasado.")
+
+        return cleaned_data
+
+
+class EsperaCupoForm(forms.ModelForm):
+    """
+    Formulario para que el Paciente se inscriba en la lista de espera
+    indicando kinesiólogos preferidos, días, franja horaria y fechas.
+    """
+    kinesiologos = forms.ModelMultipleChoiceField(
+        queryset=Kinesiologo.objects.all(),
+        required=False,
+        label="Kinesiólogos preferidos",
+        help_text="Si no eliges ninguno, se te ofrecerán cupos de cualquier kinesiólogo.",
+        widget=forms.CheckboxSelectMultiple
+    )
+    dias_semana = forms.TypedMultipleChoiceField(
+        choices=DIAS_SEMANA,
+        coerce=int,
+        label="Días de la semana",
+        widget=forms.CheckboxSelectMultiple
+    )
+
+    class Meta:
+        model = EsperaCupo
+        # El paciente se asigna automáticamente en la vista.
+        fields = ['kinesiologos', 'dias_semana', 'hora_desde', 'hora_hasta', 'fecha_desde', 'fecha_hasta']
+        widgets = {
+            'hora_desde': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'hora_hasta': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'fecha_desde': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'fecha_hasta': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        }
+        labels = {
+            'hora_desde': 'Desde las',
+            'hora_hasta': 'Hasta las',
+            'fecha_desde': 'Desde el día',
+            'fecha_hasta': 'Hasta el día',
+        }
+
+    def clean_dias_semana(self):
+        dias = sorted(set(self.cleaned_data.get('dias_semana') or []))
+        return ','.join(str(dia) for dia in dias)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        hora_desde = cleaned_data.get('hora_desde')
+        hora_hasta = cleaned_data.get('hora_hasta')
+        fecha_desde = cleaned_data.get('fecha_desde')
+        fecha_hasta = cleaned_data.get('fecha_hasta')
+
+        if hora_desde and hora_hasta and hora_desde >= hora_hasta:
+            raise forms.ValidationError("La hora de término debe ser posterior a la hora de inicio.")
+        if fecha_desde and fecha_hasta and fecha_hasta < fecha_desde:
+            raise forms.ValidationError("La fecha de término debe ser posterior a la fecha de inicio.")
+        if fecha_hasta and fecha_hasta < timezone.localdate():
+            raise forms.ValidationError("El rango de fechas ya terminó.")
+
+        return cleaned_data
+
+
+class ExportacionForm(forms.Form):
+    """
+    Filtros de la exportación de citas o notas clínicas (se reciben por GET).
+    Todos son opcionales: sin fechas se exporta todo el historial.
+    """
+    desde = forms.DateField(required=False, label="Desde el día", widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    hasta = forms.DateField(required=False, label="Hasta el día", widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    kinesiologo = forms.ModelChoiceField(
+        queryset=Kinesiologo.objects.all(),
+        required=False,
+        label="Kinesiólogo",
+        empty_label="--- Todos ---",
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        desde = cleaned_data.get('desde')
+        hasta = cleaned_data.get('hasta')
+        if desde and hasta and hasta < desde:
+            raise forms.ValidationError("La fecha de término debe ser posterior a la fecha de inicio.")
+        return cleaned_data
+
+
+class OcupacionForm(ExportacionForm):
+    """Filtros del reporte de ocupación: rango, kinesiólogo y agrupación (por día o por semana)."""
+    agrupacion = forms.ChoiceField(
+        choices=AGRUPACIONES,
+        required=False,
+        label="Agrupar",
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Una fecha omitida toma el valor por defecto de la vista (initial)
+        desde = cleaned_data.get('desde') or self.initial.get('desde')
+        hasta = cleaned_data.get('hasta') or self.initial.get('hasta')
+        if desde and hasta and (hasta - desde).days >= MAX_DIAS_REPORTE:
+            raise forms.ValidationError(f"El reporte abarca a lo más {MAX_DIAS_REPORTE} días.")
+        return cleaned_data
@@ -0,0 +1,446 @@
+# citas/importacion.py
+
+"""
+Importación masiva de citas históricas (y de sus pacientes) desde un CSV.
+
+El archivo se procesa por lotes de filas; cada lote:
+
+1. Se valida fila a fila (RUT y dígito verificador, fecha, estado...). Los
+   kinesiólogos se resuelven por licencia y los pacientes por RUT con mapas
+   en memoria: los kinesiólogos se cargan una vez al comenzar y los
+   pacientes con una consulta por lote, y ambos mapas se conservan entre
+   lotes.
+2. Se buscan traslapes con un barrido ordenado (sort-and-sweep) por
+   kinesiólogo, que mezcla las citas del lote con las activas que ya
+   existen en ese rango (una sola consulta). Se compara con los límites
+   redondeados a gránulos de 15 minutos, igual que la reserva de horario
+   (citas/reservas.py), así los gránulos de las citas importadas nunca
+   chocan entre sí.
+3. Se insertan usuarios, perfiles, pacientes nuevos, citas y gránulos con
+   bulk_create por lotes, todo en una transacción por lote: un error deja
+   el lote completo sin guardar (y el mapa de pacientes como estaba). Si
+   una reserva concurrente tomó un horario entre el barrido y la inserción,
+   el lote se reintenta fila a fila y solo se rechazan las que chocan.
+
+Las filas rechazadas se escriben en un CSV aparte con el motivo. Tras
+confirmar cada lote se guarda un punto de control con la última fila
+procesada: si la importación se interrumpe, al volver a ejecutarla
+continúa desde ahí sin duplicar citas.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from usuarios.models import Kinesiologo, Paciente, Perfil, PACIENTE
+from usuarios import lotes_csv
+from usuarios.lotes_csv import FilaInvalida
+from usuarios.rut import normalizar_rut, rut_valido, formatear_rut
+from pacientes.busqueda import indexar_pacientes
+from .models import Cita, OcupacionHorario, ESTADOS_CITA, CITA_PENDIENTE, CITA_FINALIZADA, CITA_CANCELADA
+from .reservas import EPOCA, GRANULO, MENSAJE_HORARIO_OCUPADO, granulos_de_intervalo
+from .mapa_disponibilidad import invalidar_kinesiologo
+from .cambios import publicar
+from .calendario import publicar_pacientes
+from .ocupacion_diaria import fechas_de_intervalo, programar_recalculo
+
+
+User = get_user_model()
+
+TAMANO_LOTE = 1000
+TAMANO_INSERCION = 500
+
+COLUMNAS_OBLIGATORIAS = ('rut', 'licencia', 'fecha_hora_inicio')
+COLUMNAS = (
+    'rut', 'nombre', 'apellido', 'telefono', 'prevision',
+    'licencia', 'fecha_hora_inicio', 'duracion_minutos', 'estado', 'motivo',
+)
+COLUMNAS_RECHAZO = ('fila', 'motivo_rechazo')
+
+FORMATOS_FECHA = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%d-%m-%Y %H:%M', '%d/%m/%Y %H:%M')
+DURACION_MINIMA = 5
+DURACION_MAXIMA = 480
+DURACION_POR_DEFECTO = 60
+
+MOTIVO_TRASLAPE_ARCHIVO = "Se traslapa con otra cita del archivo para el mismo kinesiólogo."
+MOTIVO_TRASLAPE_REGISTRADA = "Se traslapa con una cita ya registrada del mismo kinesiólogo."
+MOTIVO_USUARIO_SIN_FICHA = "El RUT pertenece a un usuario que no tiene ficha de paciente."
+MOTIVO_PACIENTE_SIN_NOMBRE = "El paciente no existe y la fila no trae nombre y apellido para crearlo."
+
+# Se aceptan el código o el nombre del estado y de la previsión, sin importar mayúsculas
+ESTADOS = {clave.lower(): clave for clave, _ in ESTADOS_CITA}
+ESTADOS.update({nombre.lower(): clave for clave, nombre in ESTADOS_CITA})
+PREVISIONES = {clave.lower(): clave for clave, _ in Paciente.PREVISION_CHOICES}
+PREVISIONES.update({nombre.lower(): clave for clave, nombre in Paciente.PREVISION_CHOICES})
+
+
+# ----------------------------------------------------------------------
+# Lectura del archivo y punto de control
+# ----------------------------------------------------------------------
+
+def abrir_lector(archivo, obligatorias=COLUMNAS_OBLIGATORIAS):
+    """usuarios.lotes_csv.abrir_lector con las columnas obligatorias de las citas."""
+    return lotes_csv.abrir_lector(archivo, obligatorias)
+
+
+def leer_lotes(lector, tamano=TAMANO_LOTE, desde_fila=0):
+    """usuarios.lotes_csv.leer_lotes con el tamaño de lote de las citas."""
+    return lotes_csv.leer_lotes(lector, tamano, desde_fila)
+
+
+def ruta_punto_control(ruta_archivo):
+    return f"{ruta_archivo}.punto_control"
+
+
+def leer_punto_control(ruta_archivo):
+    """Retorna el punto de control del archivo, o None si no hay uno válido para su contenido actual."""
+    try:
+        with open(ruta_punto_control(ruta_archivo), encoding='utf-8') as archivo:
+            punto = json.load(archivo)
+    except (OSError, ValueError):
+        return None
+    # Si el archivo cambió desde la importación interrumpida, el número de fila no sirve
+    if punto.get('tamano') != os.path.getsize(ruta_archivo):
+        return None
+    return punto
+
+
+def guardar_punto_control(ruta_archivo, **datos):
+    """Escribe el punto de control de forma atómica (archivo temporal + reemplazo)."""
+    ruta = ruta_punto_control(ruta_archivo)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump({'tamano': os.path.getsize(ruta_archivo), **datos}, archivo)
+    os.replace(temporal, ruta)
+
+
+def borrar_punto_control(ruta_archivo):
+    try:
+        os.remove(ruta_punto_control(ruta_archivo))
+    except FileNotFoundError:
+        pass
+
+
+# ----------------------------------------------------------------------
+# Validación de filas
+# ----------------------------------------------------------------------
+
+def _texto(fila, columna):
+    return (fila.get(columna) or '').strip()
+
+
+def _fecha_hora(valor):
+    for formato in FORMATOS_FECHA:
+        try:
+            fecha = datetime.strptime(valor, formato)
+        except ValueError:
+            continue
+        momento = timezone.make_aware(fecha)
+        # Una hora que se salta el cambio de horario de verano no existe en la zona local
+        if timezone.localtime(momento).replace(tzinfo=None) != fecha:
+            raise FilaInvalida(f"La hora '{valor}' no existe en la zona horaria local (cambio de horario).")
+        return momento
+    raise FilaInvalida(f"Fecha y hora inválida: '{valor}'.")
+
+
+def _granulo_inferior(momento):
+    return EPOCA + ((momento - EPOCA) // GRANULO) * GRANULO
+
+
+def _granulo_superior(momento):
+    inferior = _granulo_inferior(momento)
+    return inferior if inferior == momento else inferior + GRANULO
+
+
+class ImportadorCitas:
+    """
+    Importa los lotes de filas de un CSV. Conserva entre lotes los mapas de
+    kinesiólogos (licencia -> id) y pacientes (RUT -> id) y los totales.
+    """
+
+    def __init__(self):
+        self.kinesiologos = dict(Kinesiologo.objects.values_list('licencia', 'pk'))
+        self.pacientes = {}
+        self.ahora = timezone.now()
+        self.importadas = 0
+        self.rechazadas = 0
+        self.pacientes_creados = 0
+
+    def validar(self, fila):
+        """Retorna los datos limpios de la fila o lanza FilaInvalida."""
+        rut = normalizar_rut(_texto(fila, 'rut'))
+        if not rut_valido(rut):
+            raise FilaInvalida(f"RUT inválido: '{_texto(fila, 'rut')}'.")
+
+        licencia = _texto(fila, 'licencia')
+        kinesiologo_id = self.kinesiologos.get(licencia)
+        if kinesiologo_id is None:
+            raise FilaInvalida(f"No existe un kinesiólogo con la licencia '{licencia}'.")
+
+        inicio = _fecha_hora(_texto(fila, 'fecha_hora_inicio'))
+
+        duracion = _texto(fila, 'duracion_minutos')
+        try:
+            duracion = int(duracion) if duracion else DURACION_POR_DEFECTO
+        except ValueError:
+            raise FilaInvalida(f"Duración inválida: '{duracion}'.")
+        if not DURACION_MINIMA <= duracion <= DURACION_MAXIMA:
+            raise FilaInvalida(f"La duración debe estar entre {DURACION_MINIMA} y {DURACION_MAXIMA} minutos.")
+
+        estado = _texto(fila, 'estado')
+        if estado:
+            if estado.lower() not in ESTADOS:
+                raise FilaInvalida(f"Estado desconocido: '{estado}'.")
+            estado = ESTADOS[estado.lower()]
+        else:
+            # Sin estado, lo ya ocurrido se da por atendido
+            estado = CITA_FINALIZADA if inicio < self.ahora else CITA_PENDIENTE
+
+        prevision = _texto(fila, 'prevision')
+        if prevision and prevision.lower() not in PREVISIONES:
+            raise FilaInvalida(f"Previsión desconocida: '{prevision}'.")
+
+        paciente = {
+            'nombre': _texto(fila, 'nombre')[:100],
+            'apellido': _texto(fila, 'apellido')[:100],
+            'telefono': _texto(fila, 'telefono')[:15],
+            'prevision': PREVISIONES.get(prevision.lower(), 'F'),
+        }
+        fin = inicio + timedelta(minutes=duracion)
+        return {
+            'rut': rut,
+            'paciente': paciente,
+            'kinesiologo_id': kinesiologo_id,
+            'inicio': inicio,
+            'fin': fin,
+            'duracion': duracion,
+            'estado': estado,
+            'motivo': _texto(fila, 'motivo') or None,
+        }
+
+    # --- Traslapes -------------------------------------------------------
+
+    def descartar_traslapes(self, datos):
+        """
+        Retorna (aceptadas, rechazadas) según un barrido por kinesiólogo:
+        las filas activas y las citas activas existentes se ordenan por
+        inicio y se recorren llevando el mayor fin visto. Una fila que empieza
+        antes de ese fin choca con algo anterior; si lo que llega es una cita
+        existente que empieza antes del fin de la última fila aceptada, se
+        rechaza esa fila. `rechazadas` es una lista de (dato, motivo).
+        """
+        activas = [dato for dato in datos if dato['estado'] != CITA_CANCELADA]
+        if not activas:
+            return datos, []
+
+        por_kinesiologo = {}
+        for dato in activas:
+            dato['granulos'] = (_granulo_inferior(dato['inicio']), _granulo_superior(dato['fin']))
+            por_kinesiologo.setdefault(dato['kinesiologo_id'], []).append(dato)
+
+        # Citas activas ya guardadas que tocan el rango del lote (una consulta para todos)
+        desde = min(dato['granulos'][0] for dato in activas)
+        hasta = max(dato['granulos'][1] for dato in activas)
+        existentes = {}
+        for kinesiologo_id, inicio, fin in Cita.objects.filter(
+            kinesiologo_id__in=por_kinesiologo, fecha_hora_inicio__lt=hasta, fecha_hora_fin__gt=desde,
+        ).exclude(estado=CITA_CANCELADA).values_list('kinesiologo_id', 'fecha_hora_inicio', 'fecha_hora_fin'):
+            existentes.setdefault(kinesiologo_id, []).append((_granulo_inferior(inicio), _granulo_superior(fin)))
+
+        motivos = {}
+        for kinesiologo_id, filas in por_kinesiologo.items():
+            # A igual inicio, la existente va primero: la fila es la que sobra
+            eventos = [(inicio, 0, fin, None) for inicio, fin in existentes.get(kinesiologo_id, ())]
+            eventos += [(dato['granulos'][0], 1, dato['granulos'][1], dato) for dato in filas]
+            eventos.sort(key=lambda evento: evento[:2])
+
+            fin_existentes = None
+            ultima_aceptada = None
+            for inicio, _, fin, dato in eventos:
+                if dato is None:
+                    # Las aceptadas no se traslapan entre sí: solo la última puede cubrir este inicio
+                    if ultima_aceptada is not None and ultima_aceptada['granulos'][1] > inicio:
+                        motivos[id(ultima_aceptada)] = MOTIVO_TRASLAPE_REGISTRADA
+                        ultima_aceptada = None
+                    fin_existentes = fin if fin_existentes is None else max(fin_existentes, fin)
+                elif fin_existentes is not None and inicio < fin_existentes:
+                    motivos[id(dato)] = MOTIVO_TRASLAPE_REGISTRADA
+                elif ultima_aceptada is not None and inicio < ultima_aceptada['granulos'][1]:
+                    motivos[id(dato)] = MOTIVO_TRASLAPE_ARCHIVO
+                else:
+                    ultima_aceptada = dato
+
+        aceptadas = [dato for dato in datos if id(dato) not in motivos]
+        rechazadas = [(dato, motivos[id(dato)]) for dato in datos if id(dato) in motivos]
+        return aceptadas, rechazadas
+
+    # --- Pacientes -------------------------------------------------------
+
+    def resolver_pacientes(self, datos):
+        """
+        Completa el mapa RUT -> paciente con los del lote (una consulta) y
+        crea los que faltan. Retorna {rut: motivo} de los RUT que no se
+        pudieron resolver.
+        """
+        ruts = {dato['rut'] for dato in datos} - self.pacientes.keys()
+        if not ruts:
+            return {}
+        self.pacientes.update(
+            Paciente.objects.filter(rut_normalizado__in=ruts).values_list('rut_normalizado', 'pk')
+        )
+
+        nuevos = {}
+        for dato in datos:
+            if dato['rut'] not in self.pacientes:
+                nuevos.setdefault(dato['rut'], dato['paciente'])
+        if not nuevos:
+            return {}
+
+        # El RUT es el nombre de usuario: uno ya tomado por otra cuenta no se reutiliza
+        sin_resolver = dict.fromkeys(
+            (
+                normalizar_rut(username) for username in User.objects.filter(
+                    username__in=[formatear_rut(rut) for rut in nuevos]
+                ).values_list('username', flat=True)
+            ),
+            MOTIVO_USUARIO_SIN_FICHA,
+        )
+        for rut, paciente in nuevos.items():
+            if not paciente['nombre'] or not paciente['apellido']:
+                sin_resolver.setdefault(rut, MOTIVO_PACIENTE_SIN_NOMBRE)
+        nuevos = {rut: paciente for rut, paciente in nuevos.items() if rut not in sin_resolver}
+        if nuevos:
+            self._crear_pacientes(nuevos)
+        return sin_resolver
+
+    def _crear_pacientes(self, nuevos):
+        # El login de pacientes usa el RUT y el teléfono, no la contraseña: se deja inutilizable
+        # (make_password(None) no calcula un hash, a diferencia de create_user)
+        usuarios = User.objects.bulk_create([
+            User(username=formatear_rut(rut), first_name=datos['nombre'], last_name=datos['apellido'], password=make_password(None))
+            for rut, datos in nuevos.items()
+        ], batch_size=TAMANO_INSERCION)
+        perfiles = Perfil.objects.bulk_create([
+            Perfil(
+                user=usuario, nombre=datos['nombre'], apellido=datos['apellido'],
+                rol=PACIENTE, telefono=datos['telefono'] or None,
+            )
+            for usuario, datos in zip(usuarios, nuevos.values())
+        ], batch_size=TAMANO_INSERCION)
+        pacientes = Paciente.objects.bulk_create([
+            Paciente(
+                # bulk_create no pasa por save(): el RUT normalizado se asigna aquí
+                rut=formatear_rut(rut), rut_normalizado=rut, perfil=perfil, nombre=datos['nombre'], apellido=datos['apellido'],
+                telefono=datos['telefono'], prevision=datos['prevision'],
+            )
+            for perfil, (rut, datos) in zip(perfiles, nuevos.items())
+        ], batch_size=TAMANO_INSERCION)
+        # bulk_create tampoco emite post_save: las fichas se agregan aquí al índice de búsqueda
+        indexar_pacientes(pacientes)
+        self.pacientes.update((paciente.rut_normalizado, paciente.pk) for paciente in pacientes)
+        self.pacientes_creados += len(pacientes)
+
+    # --- Lote ------------------------------------------------------------
+
+    def importar_lote(self, lote):
+        """
+        Valida e inserta un lote de (numero, fila) en una transacción.
+        Retorna la lista de rechazos (numero, fila, motivo).
+        """
+        rechazos = []
+        datos = []
+        for numero, fila in lote:
+            try:
+                dato = self.validar(fila)
+            except FilaInvalida as error:
+                rechazos.append((numero, fila, str(error)))
+                continue
+            dato['numero'], dato['fila'] = numero, fila
+            datos.append(dato)
+
+        datos, traslapadas = self.descartar_traslapes(datos)
+        rechazos += [(dato['numero'], dato['fila'], motivo) for dato, motivo in traslapadas]
+
+        # Los pacientes creados en un lote revertido no existen: el mapa vuelve a como estaba
+        pacientes, pacientes_creados = dict(self.pacientes), self.pacientes_creados
+        try:
+            try:
+                with transaction.atomic():
+                    citas, no_guardadas = self.guardar(datos)
+            except IntegrityError:
+                # Una reserva concurrente tomó un horario del lote después del barrido:
+                # se reintenta fila a fila para rechazar solo las que chocan, como Cita.save()
+                self.pacientes, self.pacientes_creados = dict(pacientes), pacientes_creados
+                with transaction.atomic():
+                    citas, no_guardadas = self.guardar(datos, fila_a_fila=True)
+        except BaseException:
+            self.pacientes, self.pacientes_creados = pacientes, pacientes_creados
+            raise
+        rechazos += no_guardadas
+
+        # Disponibilidad en caché y versión de la agenda: una vez por kinesiólogo del lote, no por cita
+        for kinesiologo_id in {cita.kinesiologo_id for cita in citas}:
+            invalidar_kinesiologo(kinesiologo_id)
+            publicar(kinesiologo_id)
+
+        self.importadas += len(citas)
+        self.rechazadas += len(rechazos)
+        rechazos.sort(key=lambda rechazo: rechazo[0])
+        return rechazos
+
+    def guardar(self, datos, fila_a_fila=False):
+        """
+        Inserta pacientes, citas y gránulos de las filas aceptadas dentro de
+        la transacción en curso. Con `fila_a_fila`, cada cita va en su propio
+        punto de guardado y las que chocan con un horario tomado se rechazan.
+        Retorna (citas, rechazos).
+        """
+        sin_paciente = self.resolver_pacientes(datos)
+        rechazos = [
+            (dato['numero'], dato['fila'], sin_paciente[dato['rut']])
+            for dato in datos if dato['rut'] in sin_paciente
+        ]
+        datos = [dato for dato in datos if dato['rut'] not in sin_paciente]
+
+        if fila_a_fila:
+            citas = []
+            for dato in datos:
+                try:
+                    with transaction.atomic():
+                        citas += self.insertar_citas([dato])
+                except IntegrityError:
+                    rechazos.append((dato['numero'], dato['fila'], MENSAJE_HORARIO_OCUPADO))
+        else:
+            citas = self.insertar_citas(datos)
+
+        publicar_pacientes([cita.paciente_id for cita in citas])
+        fechas_por_kinesiologo = {}
+        for cita in citas:
+            fechas_por_kinesiologo.setdefault(cita.kinesiologo_id, set()).update(
+                fechas_de_intervalo(cita.fecha_hora_inicio, cita.fecha_hora_fin)
+            )
+        for kinesiologo_id, fechas in fechas_por_kinesiologo.items():
+            programar_recalculo(kinesiologo_id, fechas)
+        return citas, rechazos
+
+    def insertar_citas(self, datos):
+        # bulk_create no llama a save(): el fin se asigna aquí
+        citas = Cita.objects.bulk_create([
+            Cita(
+                kinesiologo_id=dato['kinesiologo_id'], paciente_id=self.pacientes[dato['rut']],
+                fecha_hora_inicio=dato['inicio'], duracion_minutos=dato['duracion'],
+                fecha_hora_fin=dato['fin'], estado=dato['estado'], motivo=dato['motivo'],
+            )
+            for dato in datos
+        ], batch_size=TAMANO_INSERCION)
+        OcupacionHorario.objects.bulk_create([
+            OcupacionHorario(kinesiologo_id=cita.kinesiologo_id, cita=cita, granulo=granulo)
+            for cita in citas if cita.estado != CITA_CANCELADA
+            for granulo in granulos_de_intervalo(cita.fecha_hora_inicio, cita.fecha_hora_fin)
+        ], batch_size=TAMANO_INSERCION)
+        return citas
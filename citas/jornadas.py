@@ -0,0 +1,176 @@
+# citas/jornadas.py
+
+"""
+Jornadas laborales por kinesiólogo.
+
+Los HorarioAtencion (turnos semanales) y HorarioEspecial (excepciones con
+rango de fechas) de cada kinesiólogo se compilan una vez en una plantilla
+semanal en memoria y se guardan en la caché. Calcular los turnos de un día
+es entonces una búsqueda en un diccionario, sin consultas por petición. Las
+señales de `citas.signals` borran la plantilla cuando se confirma un cambio
+de horario. La plantilla expira a los pocos minutos: con una caché por
+proceso, los demás procesos toman el cambio a lo más tras TIMEOUT_PLANTILLA.
+"""
+
+from datetime import datetime, time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import HorarioAtencion, HorarioEspecial
+
+
+# Jornada por defecto para kinesiólogos sin turnos configurados
+HORA_INICIO_JORNADA = 9
+HORA_FIN_JORNADA = 18
+DURACION_CITA = 60
+
+PREFIJO_CLAVE = 'citas:plantilla_semanal'
+# Cota de lo que otro proceso (o una petición que la recompiló antes del commit)
+# sigue usando una plantilla antigua; además, guarda solo las excepciones vigentes desde hoy
+TIMEOUT_PLANTILLA = 5 * 60
+
+PLANTILLA_POR_DEFECTO = {
+    'semana': {
+        dia: [(time(hour=HORA_INICIO_JORNADA), time(hour=HORA_FIN_JORNADA), DURACION_CITA)]
+        for dia in range(7)
+    },
+    'especiales': [],
+}
+
+
+def clave_plantilla(kinesiologo_id):
+    return f"{PREFIJO_CLAVE}:{kinesiologo_id}"
+
+
+def _consultas_plantillas(kinesiologo_ids):
+    """Consultas (aún sin evaluar) de turnos semanales y horarios especiales vigentes."""
+    turnos = HorarioAtencion.objects.filter(
+        kinesiologo_id__in=kinesiologo_ids
+    ).order_by('hora_inicio').values_list('kinesiologo_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'duracion_cita_minutos')
+
+    especiales = HorarioEspecial.objects.filter(
+        kinesiologo_id__in=kinesiologo_ids,
+        fecha_hasta__gte=timezone.localdate(),
+    ).values_list('kinesiologo_id', 'fecha_desde', 'fecha_hasta', 'hora_inicio', 'hora_fin', 'duracion_cita_minutos')
+    return turnos, especiales
+
+
+def _armar_plantillas(kinesiologo_ids, turnos, especiales):
+    plantillas = {kine_id: {'semana': {}, 'especiales': []} for kine_id in kinesiologo_ids}
+    for kine_id, dia, hora_inicio, hora_fin, duracion in turnos:
+        plantillas[kine_id]['semana'].setdefault(dia, []).append((hora_inicio, hora_fin, duracion))
+    for kine_id, desde, hasta, hora_inicio, hora_fin, duracion in especiales:
+        plantillas[kine_id]['especiales'].append((desde, hasta, hora_inicio, hora_fin, duracion))
+
+    for kine_id, plantilla in plantillas.items():
+        if not plantilla['semana']:
+            plantilla['semana'] = PLANTILLA_POR_DEFECTO['semana']
+    return plantillas
+
+
+def compilar_plantillas(kinesiologo_ids):
+    """
+    Compila las plantillas semanales de varios kinesiólogos con dos consultas.
+    Retorna {kinesiologo_id: {'semana': {dia: [turnos]}, 'especiales': [...]}}.
+    """
+    turnos, especiales = _consultas_plantillas(kinesiologo_ids)
+    return _armar_plantillas(kinesiologo_ids, turnos, especiales)
+
+
+async def acompilar_plantillas(kinesiologo_ids):
+    """Versión asíncrona de `compilar_plantillas`."""
+    turnos, especiales = _consultas_plantillas(kinesiologo_ids)
+    return _armar_plantillas(
+        kinesiologo_ids,
+        [fila async for fila in turnos],
+        [fila async for fila in especiales],
+    )
+
+
+def obtener_plantillas(kinesiologo_ids):
+    """Retorna las plantillas desde la caché, compilando en bloque solo las que faltan."""
+    kinesiologo_ids = [int(kine_id) for kine_id in kinesiologo_ids]
+    claves = {clave_plantilla(kine_id): kine_id for kine_id in kinesiologo_ids}
+    en_cache = cache.get_many(list(claves))
+    plantillas = {claves[clave]: plantilla for clave, plantilla in en_cache.items()}
+
+    faltantes = [kine_id for kine_id in kinesiologo_ids if kine_id not in plantillas]
+    if faltantes:
+        compiladas = compilar_plantillas(faltantes)
+        cache.set_many({clave_plantilla(kine_id): plantilla for kine_id, plantilla in compiladas.items()}, TIMEOUT_PLANTILLA)
+        plantillas.update(compiladas)
+    return plantillas
+
+
+async def aobtener_plantillas(kinesiologo_ids):
+    """Versión asíncrona de `obtener_plantillas`."""
+    kinesiologo_ids = [int(kine_id) for kine_id in kinesiologo_ids]
+    claves = {clave_plantilla(kine_id): kine_id for kine_id in kinesiologo_ids}
+    en_cache = await cache.aget_many(list(claves))
+    plantillas = {claves[clave]: plantilla for clave, plantilla in en_cache.items()}
+
+    faltantes = [kine_id for kine_id in kinesiologo_ids if kine_id not in plantillas]
+    if faltantes:
+        compiladas = await acompilar_plantillas(faltantes)
+        await cache.aset_many({clave_plantilla(kine_id): plantilla for kine_id, plantilla in compiladas.items()}, TIMEOUT_PLANTILLA)
+        plantillas.update(compiladas)
+    return plantillas
+
+
+def obtener_plantilla(kinesiologo_id):
+    return obtener_plantillas([kinesiologo_id])[int(kinesiologo_id)]
+
+
+async def aobtener_plantilla(kinesiologo_id):
+    return (await aobtener_plantillas([kinesiologo_id]))[int(kinesiologo_id)]
+
+
+def invalidar_plantilla(kinesiologo_id):
+    if kinesiologo_id:
+        cache.delete(clave_plantilla(kinesiologo_id))
+
+
+def turnos_del_dia(plantilla, fecha):
+    """
+    Retorna los turnos (inicio, fin, duracion) aware de una fecha.
+    Si algún horario especial cubre la fecha, reemplaza a los turnos semanales.
+    """
+    especiales = [especial for especial in plantilla['especiales'] if especial[0] <= fecha <= especial[1]]
+    if especiales:
+        turnos = [(hora_inicio, hora_fin, duracion) for _, _, hora_inicio, hora_fin, duracion in especiales if hora_inicio is not None]
+        turnos.sort()
+    else:
+        turnos = plantilla['semana'].get(fecha.weekday(), [])
+
+    return [
+        (
+            timezone.make_aware(datetime.combine(fecha, hora_inicio)),
+            timezone.make_aware(datetime.combine(fecha, hora_fin)),
+            duracion,
+        )
+        for hora_inicio, hora_fin, duracion in turnos
+    ]
+
+
+def turno_de(kinesiologo_id, inicio):
+    """Retorna el turno (inicio, fin, duracion) que contiene `inicio`, o None si cae fuera de la jornada."""
+    fecha = timezone.localtime(inicio).date()
+    for turno in turnos_del_dia(obtener_plantilla(kinesiologo_id), fecha):
+        if turno[0] <= inicio < turno[1]:
+            return turno
+    return None
+
+
+def duracion_para(kinesiologo_id, inicio):
+    """Duración de cita del turno que contiene `inicio`; la duración por defecto si no cae en ninguno."""
+    turno = turno_de(kinesiologo_id, inicio)
+    return turno[2] if turno else DURACION_CITA
+
+
+def limites_del_dia(plantilla, fecha):
+    """Inicio del primer turno y fin del último turno de la fecha, o None si no atiende."""
+    turnos = turnos_del_dia(plantilla, fecha)
+    if not turnos:
+        return None
+    return turnos[0][0], max(fin for _, fin, _ in turnos)
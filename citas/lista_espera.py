@@ -0,0 +1,198 @@
+# citas/lista_espera.py
+
+"""
+Lista de espera de cupos liberados.
+
+Cada inscripción se indexa en IndiceEspera con una fila por (kinesiólogo,
+día de la semana, hora) que cubre su franja. Cuando una cita se cancela, los
+candidatos se obtienen con una sola consulta sobre ese índice (día y hora de
+la cita, kinesiólogo de la cita o "cualquiera"), en vez de recorrer toda la
+lista de espera. Al primer candidato (por orden de inscripción) se le ofrece
+el cupo, que queda retenido para él durante MINUTOS_RETENCION_OFERTA.
+"""
+
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    Cita, IndiceEspera, OcupacionHorario, OfertaCupo, CITA_PENDIENTE,
+    OFERTA_PENDIENTE, OFERTA_ACEPTADA, OFERTA_RECHAZADA, OFERTA_EXPIRADA,
+)
+from .mapa_disponibilidad import invalidar_dias
+from .reservas import granulos_de_intervalo, guardar_cita_con_reserva
+
+
+# Tiempo que el cupo queda retenido para el paciente al que se le ofrece
+MINUTOS_RETENCION_OFERTA = 30
+# Candidatos que se leen del índice por cada cupo liberado
+MAX_CANDIDATOS = 20
+
+
+# ----------------------------------------------------------------------
+# Índice de la lista de espera
+# ----------------------------------------------------------------------
+
+def horas_de_franja(hora_desde, hora_hasta):
+    """Horas (0-23) que toca la franja [hora_desde, hora_hasta)."""
+    ultima = hora_hasta.hour if hora_hasta.minute or hora_hasta.second else hora_hasta.hour - 1
+    return range(hora_desde.hour, ultima + 1)
+
+
+def indexar_espera(espera):
+    """
+    Reconstruye las filas de IndiceEspera de una inscripción. Se debe llamar
+    después de guardar la espera y asignar sus kinesiólogos preferidos.
+    """
+    IndiceEspera.objects.filter(espera=espera).delete()
+    if not espera.activa:
+        return
+
+    kinesiologo_ids = list(espera.kinesiologos.values_list('pk', flat=True)) or [None]
+    IndiceEspera.objects.bulk_create([
+        IndiceEspera(espera=espera, kinesiologo_id=kine_id, dia_semana=dia, hora=hora)
+        for kine_id in kinesiologo_ids
+        for dia in espera.dias_semana_lista
+        for hora in horas_de_franja(espera.hora_desde, espera.hora_hasta)
+    ])
+
+
+def dar_de_baja_espera(espera):
+    """Desactiva la inscripción y la saca del índice."""
+    espera.activa = False
+    espera.save(update_fields=['activa'])
+    IndiceEspera.objects.filter(espera=espera).delete()
+
+
+def candidatos_para(kinesiologo_id, inicio, fin, excluir_esperas=(), excluir_paciente_id=None):
+    """
+    Esperas activas que calzan con el cupo [inicio, fin) del kinesiólogo,
+    en orden de inscripción. Usa el índice (dia_semana, hora, kinesiologo).
+    Todas las condiciones de EsperaCupo.acepta (fechas, día y franja) y las
+    exclusiones van en la consulta: el límite MAX_CANDIDATOS se aplica
+    sobre esperas que sí calzan, no sobre las más antiguas del índice.
+    """
+    inicio_local = timezone.localtime(inicio)
+    fin_local = timezone.localtime(fin)
+    fecha = inicio_local.date()
+    if fin_local.date() != fecha:
+        # Ninguna franja cruza la medianoche
+        return []
+
+    indices = IndiceEspera.objects.filter(
+        Q(kinesiologo_id=kinesiologo_id) | Q(kinesiologo__isnull=True),
+        dia_semana=inicio_local.weekday(),
+        hora=inicio_local.hour,
+        espera__activa=True,
+        espera__fecha_desde__lte=fecha,
+        espera__fecha_hasta__gte=fecha,
+        espera__hora_desde__lte=inicio_local.time(),
+        espera__hora_hasta__gte=fin_local.time(),
+    )
+    if excluir_esperas:
+        indices = indices.exclude(espera_id__in=excluir_esperas)
+    if excluir_paciente_id:
+        indices = indices.exclude(espera__paciente_id=excluir_paciente_id)
+    indices = indices.select_related('espera').order_by('espera__fecha_creacion')[:MAX_CANDIDATOS]
+
+    candidatos, vistos = [], set()
+    for indice in indices:
+        espera = indice.espera
+        if espera.pk not in vistos and espera.acepta(inicio, fin):
+            vistos.add(espera.pk)
+            candidatos.append(espera)
+    return candidatos
+
+
+# ----------------------------------------------------------------------
+# Ofertas de cupos liberados
+# ----------------------------------------------------------------------
+
+def ofrecer_cupo(kinesiologo_id, inicio, fin, excluir_paciente_id=None):
+    """
+    Ofrece el cupo [inicio, fin) al primer candidato de la lista de espera que
+    aún no lo haya recibido. Retorna la OfertaCupo creada o None.
+    """
+    ahora = timezone.now()
+    if inicio <= ahora:
+        return None
+    # El cupo pudo haberse agendado de nuevo antes de ofrecerlo
+    if OcupacionHorario.objects.filter(kinesiologo_id=kinesiologo_id, granulo__in=granulos_de_intervalo(inicio, fin)).exists():
+        return None
+
+    ofertas_previas = OfertaCupo.objects.filter(kinesiologo_id=kinesiologo_id, fecha_hora_inicio=inicio)
+    if ofertas_previas.filter(estado=OFERTA_PENDIENTE, expira_en__gt=ahora).exists():
+        return None
+    ya_ofrecidas = set(ofertas_previas.values_list('espera_id', flat=True))
+
+    candidatos = candidatos_para(kinesiologo_id, inicio, fin, ya_ofrecidas, excluir_paciente_id)
+    if not candidatos:
+        return None
+    return OfertaCupo.objects.create(
+        espera=candidatos[0],
+        kinesiologo_id=kinesiologo_id,
+        fecha_hora_inicio=inicio,
+        fecha_hora_fin=fin,
+        expira_en=min(ahora + timedelta(minutes=MINUTOS_RETENCION_OFERTA), inicio),
+    )
+
+
+def ofrecer_cupo_de_cita(cita):
+    """Ofrece el horario de una cita cancelada una vez confirmada la transacción."""
+    kinesiologo_id, inicio, fin, paciente_id = cita.kinesiologo_id, cita.fecha_hora_inicio, cita.fecha_hora_fin, cita.paciente_id
+    transaction.on_commit(lambda: ofrecer_cupo(kinesiologo_id, inicio, fin, excluir_paciente_id=paciente_id))
+
+
+def aceptar_oferta(oferta):
+    """
+    Agenda la cita ofrecida a nombre del paciente en espera y cierra su
+    inscripción. Lanza ValidationError si la oferta ya no está vigente.
+    """
+    with transaction.atomic():
+        oferta = OfertaCupo.objects.select_for_update().select_related('espera').get(pk=oferta.pk)
+        if not oferta.vigente:
+            raise ValidationError("La oferta ya no está vigente.")
+
+        cita = Cita(
+            kinesiologo_id=oferta.kinesiologo_id,
+            paciente_id=oferta.espera.paciente_id,
+            fecha_hora_inicio=oferta.fecha_hora_inicio,
+            duracion_minutos=int((oferta.fecha_hora_fin - oferta.fecha_hora_inicio).total_seconds() // 60),
+            motivo="Cupo liberado (lista de espera)",
+            estado=CITA_PENDIENTE,
+        )
+        guardar_cita_con_reserva(cita)
+
+        oferta.estado = OFERTA_ACEPTADA
+        oferta.cita = cita
+        oferta.save(update_fields=['estado', 'cita'])
+        dar_de_baja_espera(oferta.espera)
+    return cita
+
+
+def rechazar_oferta(oferta):
+    """Libera la retención y ofrece el cupo al siguiente de la lista."""
+    with transaction.atomic():
+        actualizadas = OfertaCupo.objects.filter(pk=oferta.pk, estado=OFERTA_PENDIENTE).update(estado=OFERTA_RECHAZADA)
+        if actualizadas:
+            _liberar_retencion(oferta)
+            transaction.on_commit(lambda: ofrecer_cupo(oferta.kinesiologo_id, oferta.fecha_hora_inicio, oferta.fecha_hora_fin))
+    return bool(actualizadas)
+
+
+def expirar_ofertas():
+    """Marca como expiradas las ofertas vencidas y reofrece sus cupos. Retorna cuántas expiraron."""
+    vencidas = list(OfertaCupo.objects.filter(estado=OFERTA_PENDIENTE, expira_en__lte=timezone.now()))
+    for oferta in vencidas:
+        if OfertaCupo.objects.filter(pk=oferta.pk, estado=OFERTA_PENDIENTE).update(estado=OFERTA_EXPIRADA):
+            _liberar_retencion(oferta)
+            ofrecer_cupo(oferta.kinesiologo_id, oferta.fecha_hora_inicio, oferta.fecha_hora_fin)
+    return len(vencidas)
+
+
+def _liberar_retencion(oferta):
+    # .update() no dispara señales: se invalida a mano el mapa de esos días (al confirmar)
+    transaction.on_commit(lambda: invalidar_dias(oferta.kinesiologo_id, oferta.fecha_hora_inicio, oferta.fecha_hora_fin))
@@ -0,0 +1,88 @@
+# citas/management/commands/benchmark_asgi.py
+
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from usuarios.models import Kinesiologo
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el rendimiento con peticiones concurrentes de un endpoint servido por el "
+        "manejador WSGI (un hilo por petición) y por el manejador ASGI (event loop). "
+        "Por defecto mide la API de horarios disponibles del primer kinesiólogo para hoy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Ruta a medir (por defecto, /citas/api/horarios/ del primer kinesiólogo).")
+        parser.add_argument('--peticiones', type=int, default=200, help="Peticiones por cada manejador.")
+        parser.add_argument('--concurrencia', type=int, default=20, help="Peticiones simultáneas.")
+
+    def handle(self, *args, **options):
+        url = options['url'] or self.url_por_defecto()
+        peticiones = options['peticiones']
+        concurrencia = options['concurrencia']
+        if peticiones < 1 or concurrencia < 1:
+            raise CommandError("--peticiones y --concurrencia deben ser mayores que 0.")
+
+        self.stdout.write(f"Midiendo {url} ({peticiones} peticiones, concurrencia {concurrencia})")
+
+        # Una petición previa deja las plantillas y los mapas de disponibilidad en caché
+        Client(headers={'host': 'localhost'}).get(url)
+
+        for nombre, medir in (('WSGI', self.medir_wsgi), ('ASGI', self.medir_asgi)):
+            duracion, latencias, estados = medir(url, peticiones, concurrencia)
+            self.informar(nombre, duracion, latencias, estados)
+
+    def url_por_defecto(self):
+        kine = Kinesiologo.objects.order_by('pk').first()
+        if kine is None:
+            raise CommandError("No hay kinesiólogos registrados: indica una ruta con --url.")
+        return f"{reverse('citas:api_horarios')}?kinesiologo_id={kine.pk}&fecha={timezone.localdate().isoformat()}"
+
+    def medir_wsgi(self, url, peticiones, concurrencia):
+        def pedir(_):
+            comienzo = time.perf_counter()
+            respuesta = Client(headers={'host': 'localhost'}).get(url)
+            connection.close()
+            return time.perf_counter() - comienzo, respuesta.status_code
+
+        comienzo = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+            resultados = list(ejecutor.map(pedir, range(peticiones)))
+        return time.perf_counter() - comienzo, [r[0] for r in resultados], [r[1] for r in resultados]
+
+    def medir_asgi(self, url, peticiones, concurrencia):
+        async def medir():
+            semaforo = asyncio.Semaphore(concurrencia)
+            cliente = AsyncClient(headers={'host': 'localhost'})
+
+            async def pedir():
+                async with semaforo:
+                    comienzo = time.perf_counter()
+                    respuesta = await cliente.get(url)
+                    return time.perf_counter() - comienzo, respuesta.status_code
+
+            comienzo = time.perf_counter()
+            resultados = await asyncio.gather(*(pedir() for _ in range(peticiones)))
+            return time.perf_counter() - comienzo, [r[0] for r in resultados], [r[1] for r in resultados]
+
+        return asyncio.run(medir())
+
+    def informar(self, nombre, duracion, latencias, estados):
+        latencias = sorted(latencias)
+        p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+        errores = sum(1 for estado in estados if estado >= 400)
+        self.stdout.write(
+            f"{nombre}: {len(latencias) / duracion:8.1f} pet/s | "
+            f"p50 {statistics.median(latencias) * 1000:7.1f} ms | "
+            f"p95 {p95 * 1000:7.1f} ms | errores {errores}"
+        )
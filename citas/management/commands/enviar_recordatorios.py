@@ -0,0 +1,34 @@
+# citas/management/commands/enviar_recordatorios.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.recordatorios import HORAS_ANTICIPACION, TAMANO_LOTE, enviar_recordatorios
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía por correo el recordatorio de las citas pendientes o confirmadas que comienzan "
+        "en las próximas horas. Cada cita se recuerda una sola vez, aunque corran varios "
+        "procesos a la vez. Pensado para ejecutarse periódicamente (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=int, default=HORAS_ANTICIPACION,
+            help="Anticipación: se recuerdan las citas que comienzan dentro de este plazo.",
+        )
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Citas por lote.")
+
+    def handle(self, *args, **options):
+        if options['horas'] < 1 or options['lote'] < 1:
+            raise CommandError("--horas y --lote deben ser mayores que cero.")
+
+        inicio = time.monotonic()
+        totales = enviar_recordatorios(options['horas'], options['lote'])
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{totales['enviados']} recordatorio(s) enviado(s) en {segundos:.1f} s; "
+            f"{totales['sin_correo']} cita(s) de pacientes sin correo, {totales['fallidos']} fallido(s)."
+        ))
@@ -0,0 +1,58 @@
+# citas/management/commands/exportar_datos.py
+
+import sys
+from argparse import ArgumentTypeError
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.models import Kinesiologo
+from citas.exportaciones import EXPORTACIONES, FORMATOS, FORMATO_CSV, exportar, nombre_archivo
+
+
+def fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ArgumentTypeError(f"fecha inválida: {valor} (formato AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta citas o metadatos de notas clínicas a CSV o XLSX. Las filas se leen por "
+        "bloques y se escriben a medida que llegan: la memoria no crece con el rango exportado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(EXPORTACIONES), help="Qué exportar.")
+        parser.add_argument('--formato', choices=FORMATOS, default=FORMATO_CSV)
+        parser.add_argument('--desde', type=fecha, help="Primer día (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=fecha, help="Último día, incluido (AAAA-MM-DD).")
+        parser.add_argument('--kinesiologo', type=int, help="Id del kinesiólogo (por defecto, todos).")
+        parser.add_argument(
+            '--salida',
+            help="Archivo de destino ('-' para la salida estándar). Por defecto, un nombre según el tipo y las fechas.",
+        )
+
+    def handle(self, *args, **options):
+        tipo, formato = options['tipo'], options['formato']
+        desde, hasta = options['desde'], options['hasta']
+        if desde and hasta and hasta < desde:
+            raise CommandError("--hasta debe ser posterior a --desde.")
+        if options['kinesiologo'] and not Kinesiologo.objects.filter(pk=options['kinesiologo']).exists():
+            raise CommandError(f"No existe el kinesiólogo {options['kinesiologo']}.")
+
+        bloques = exportar(tipo, formato, desde, hasta, options['kinesiologo'])
+        salida = options['salida'] or nombre_archivo(tipo, formato, desde, hasta)
+        if salida == '-':
+            for bloque in bloques:
+                sys.stdout.buffer.write(bloque)
+            sys.stdout.buffer.flush()
+            return
+
+        escritos = 0
+        with open(salida, 'wb') as archivo:
+            for bloque in bloques:
+                archivo.write(bloque)
+                escritos += len(bloque)
+        self.stderr.write(self.style.SUCCESS(f"Exportación guardada en {salida} ({escritos} bytes)."))
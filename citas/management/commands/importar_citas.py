@@ -0,0 +1,98 @@
+# citas/management/commands/importar_citas.py
+
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.importacion import (
+    COLUMNAS, COLUMNAS_RECHAZO, TAMANO_LOTE, ImportadorCitas,
+    abrir_lector, leer_lotes, leer_punto_control, guardar_punto_control, borrar_punto_control,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa citas históricas (y crea los pacientes que falten) desde un CSV con las columnas "
+        f"{', '.join(COLUMNAS)}. Se procesa por lotes, cada uno en su transacción; las filas "
+        "rechazadas van a un CSV con el motivo y, si se interrumpe, la siguiente ejecución "
+        "continúa desde el último lote confirmado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="CSV a importar (UTF-8, con encabezado).")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Filas por lote y transacción.")
+        parser.add_argument(
+            '--rechazos',
+            help="CSV donde se escriben las filas rechazadas. Por defecto, <archivo>.rechazos.csv.",
+        )
+        parser.add_argument(
+            '--reiniciar', action='store_true',
+            help="Ignora el punto de control y procesa el archivo desde la primera fila.",
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        if not os.path.isfile(ruta):
+            raise CommandError(f"No existe el archivo {ruta}.")
+        if options['lote'] < 1:
+            raise CommandError("--lote debe ser mayor que cero.")
+        ruta_rechazos = options['rechazos'] or f"{ruta}.rechazos.csv"
+
+        punto = None if options['reiniciar'] else leer_punto_control(ruta)
+        desde_fila = punto['fila'] if punto else 0
+        if punto:
+            self.stdout.write(f"Continuando desde la fila {desde_fila + 1} (punto de control).")
+
+        importador = ImportadorCitas()
+        if punto:
+            importador.importadas = punto.get('importadas', 0)
+            importador.rechazadas = punto.get('rechazadas', 0)
+            importador.pacientes_creados = punto.get('pacientes_creados', 0)
+
+        inicio = time.monotonic()
+        procesadas = 0
+        # utf-8-sig: acepta el BOM que agregan Excel y la exportación de citas
+        with open(ruta, newline='', encoding='utf-8-sig') as archivo, \
+                open(ruta_rechazos, 'a' if punto else 'w', newline='', encoding='utf-8') as salida_rechazos:
+            try:
+                lector = abrir_lector(archivo)
+            except ValueError as error:
+                raise CommandError(str(error))
+
+            rechazos_csv = csv.writer(salida_rechazos)
+            if salida_rechazos.tell() == 0:
+                rechazos_csv.writerow(COLUMNAS_RECHAZO + tuple(lector.fieldnames))
+
+            for lote in leer_lotes(lector, options['lote'], desde_fila):
+                rechazos = importador.importar_lote(lote)
+                for numero, fila, motivo in rechazos:
+                    rechazos_csv.writerow([numero, motivo, *(fila.get(columna) for columna in lector.fieldnames)])
+                salida_rechazos.flush()
+
+                ultima_fila = lote[-1][0]
+                guardar_punto_control(
+                    ruta, fila=ultima_fila, importadas=importador.importadas,
+                    rechazadas=importador.rechazadas, pacientes_creados=importador.pacientes_creados,
+                )
+                procesadas += len(lote)
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f"Fila {ultima_fila}: {importador.importadas} importadas, "
+                        f"{importador.rechazadas} rechazadas ({self._ritmo(procesadas, inicio)} filas/s)."
+                    )
+
+        borrar_punto_control(ruta)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{importador.importadas} citas importadas, {importador.pacientes_creados} pacientes creados, "
+            f"{importador.rechazadas} filas rechazadas. {procesadas} filas en "
+            f"{time.monotonic() - inicio:.1f} s ({self._ritmo(procesadas, inicio)} filas/s)."
+        ))
+        if importador.rechazadas:
+            self.stdout.write(f"Filas rechazadas en {ruta_rechazos}.")
+
+    def _ritmo(self, filas, inicio):
+        segundos = time.monotonic() - inicio
+        return round(filas / segundos) if segundos else filas
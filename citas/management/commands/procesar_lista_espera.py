@@ -0,0 +1,13 @@
+# citas/management/commands/procesar_lista_espera.py
+
+from django.core.management.base import BaseCommand
+
+from citas.lista_espera import expirar_ofertas
+
+
+class Command(BaseCommand):
+    help = "Expira las ofertas de la lista de espera vencidas y ofrece esos cupos al siguiente paciente. Pensado para ejecutarse cada pocos minutos (cron)."
+
+    def handle(self, *args, **options):
+        expiradas = expirar_ofertas()
+        self.stdout.write(self.style.SUCCESS(f"{expiradas} oferta(s) expirada(s) y reofrecida(s)."))
@@ -0,0 +1,52 @@
+# citas/management/commands/reconstruir_ocupacion.py
+
+import time
+from argparse import ArgumentTypeError
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.models import Kinesiologo
+from citas.ocupacion_diaria import reconstruir_ocupacion
+
+
+def fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ArgumentTypeError(f"fecha inválida: {valor} (formato AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el resumen de ocupación diaria (carga inicial o corrección). Sin fechas "
+        "se recalcula todo el historial de cada kinesiólogo y se borran las filas sobrantes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=fecha, help="Primer día (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=fecha, help="Último día, incluido (AAAA-MM-DD).")
+        parser.add_argument('--kinesiologo', type=int, help="Id del kinesiólogo (por defecto, todos).")
+
+    def handle(self, *args, **options):
+        desde, hasta = options['desde'], options['hasta']
+        if desde and hasta and hasta < desde:
+            raise CommandError("--hasta debe ser posterior a --desde.")
+
+        kinesiologos = Kinesiologo.objects.order_by('pk').values_list('pk', flat=True)
+        if options['kinesiologo']:
+            kinesiologos = kinesiologos.filter(pk=options['kinesiologo'])
+            if not kinesiologos.exists():
+                raise CommandError(f"No existe el kinesiólogo {options['kinesiologo']}.")
+
+        inicio = time.monotonic()
+        total = 0
+        for kinesiologo_id in kinesiologos:
+            dias = reconstruir_ocupacion(kinesiologo_id, desde, hasta)
+            total += dias
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Kinesiólogo {kinesiologo_id}: {dias} días.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ocupación diaria recalculada: {total} días en {time.monotonic() - inicio:.1f} s."
+        ))
@@ -0,0 +1,195 @@
+# citas/mapa_disponibilidad.py
+
+"""
+Caché de disponibilidad diaria por kinesiólogo.
+
+Cada día de un kinesiólogo se guarda como un entero que actúa de mapa de bits:
+el bit `i` vale 1 si el gránulo de 15 minutos `i` (contado desde la medianoche
+local) está ocupado por una cita activa o un bloqueo. El mapa se construye de
+forma perezosa la primera vez que se consulta y las señales de `citas.signals`
+lo invalidan cuando cambia una Cita o un BloqueoHorario de ese día.
+
+Saber si un horario está libre es entonces un AND de bits, sin consultar la BD.
+Funciona con cualquier backend de caché de Django (memoria local o archivos).
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .disponibilidad import DURACION_CITA, inicio_del_dia, obtener_intervalos_ocupados, aobtener_intervalos_ocupados
+from .jornadas import obtener_plantilla, aobtener_plantilla, turnos_del_dia
+
+
+GRANULO_MINUTOS = 15
+GRANULO = timedelta(minutes=GRANULO_MINUTOS)
+
+# Tiempo máximo de vida de un mapa (las señales lo invalidan antes si cambia)
+TIMEOUT_MAPA = 10 * 60
+# La versión también expira: con una caché por proceso, otro proceso que no vio
+# invalidar_kinesiologo deja de usar los mapas anteriores a lo más tras este tiempo
+VIGENCIA_VERSION = 5 * 60
+PREFIJO_CLAVE = 'citas:mapa_dia'
+
+
+# ----------------------------------------------------------------------
+# Operaciones de bits
+# ----------------------------------------------------------------------
+
+def mascara_intervalo(medianoche, inicio, fin):
+    """
+    Retorna la máscara de los gránulos del día (que parte en `medianoche`)
+    tocados por el intervalo [inicio, fin). Los extremos se redondean hacia
+    afuera, así un intervalo que cubre parte de un gránulo lo marca completo.
+    """
+    primero = max((inicio - medianoche) // GRANULO, 0)
+    ultimo = -((medianoche - fin) // GRANULO)  # división con techo
+    if ultimo <= primero:
+        return 0
+    return ((1 << (ultimo - primero)) - 1) << primero
+
+
+def construir_mapa(ocupados, medianoche):
+    """Convierte una lista de intervalos ocupados en el mapa de bits del día."""
+    manana = medianoche + timedelta(days=1)
+    mapa = 0
+    for inicio, fin in ocupados:
+        if fin <= medianoche or inicio >= manana:
+            continue
+        mapa |= mascara_intervalo(medianoche, max(inicio, medianoche), min(fin, manana))
+    return mapa
+
+
+# ----------------------------------------------------------------------
+# Acceso a la caché
+# ----------------------------------------------------------------------
+
+def clave_version(kinesiologo_id):
+    return f"{PREFIJO_CLAVE}:version:{kinesiologo_id}"
+
+
+def version_kinesiologo(kinesiologo_id):
+    """
+    Versión vigente de los mapas del kinesiólogo. Cambiarla invalida de una vez
+    todos sus días (p. ej. al editar una regla de bloqueo recurrente). Si la
+    versión se perdió de la caché (o expiró) se genera una nueva, así nunca se
+    reutiliza un mapa antiguo.
+    """
+    clave = clave_version(kinesiologo_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), VIGENCIA_VERSION)
+        version = cache.get(clave)
+    return version
+
+
+async def aversion_kinesiologo(kinesiologo_id):
+    clave = clave_version(kinesiologo_id)
+    version = await cache.aget(clave)
+    if version is None:
+        await cache.aadd(clave, time.time_ns(), VIGENCIA_VERSION)
+        version = await cache.aget(clave)
+    return version
+
+
+def clave_mapa(kinesiologo_id, fecha, version=None):
+    if version is None:
+        version = version_kinesiologo(kinesiologo_id)
+    return f"{PREFIJO_CLAVE}:{kinesiologo_id}:{version}:{fecha.isoformat()}"
+
+
+def obtener_mapa_dia(kinesiologo_id, fecha):
+    """Retorna el mapa de bits del día; si no está en caché, lo construye desde la BD."""
+    clave = clave_mapa(kinesiologo_id, fecha)
+    mapa = cache.get(clave)
+    if mapa is None:
+        medianoche = inicio_del_dia(fecha)
+        ocupados = obtener_intervalos_ocupados(kinesiologo_id, medianoche, inicio_del_dia(fecha + timedelta(days=1)))
+        mapa = construir_mapa(ocupados, medianoche)
+        cache.set(clave, mapa, TIMEOUT_MAPA)
+    return mapa
+
+
+async def aobtener_mapa_dia(kinesiologo_id, fecha):
+    """Versión asíncrona de `obtener_mapa_dia`."""
+    clave = clave_mapa(kinesiologo_id, fecha, await aversion_kinesiologo(kinesiologo_id))
+    mapa = await cache.aget(clave)
+    if mapa is None:
+        medianoche = inicio_del_dia(fecha)
+        ocupados = await aobtener_intervalos_ocupados(kinesiologo_id, medianoche, inicio_del_dia(fecha + timedelta(days=1)))
+        mapa = construir_mapa(ocupados, medianoche)
+        await cache.aset(clave, mapa, TIMEOUT_MAPA)
+    return mapa
+
+
+def invalidar_kinesiologo(kinesiologo_id):
+    """Invalida todos los días en caché del kinesiólogo cambiando su versión."""
+    if kinesiologo_id:
+        cache.set(clave_version(kinesiologo_id), time.time_ns(), VIGENCIA_VERSION)
+
+
+def invalidar_dias(kinesiologo_id, inicio, fin):
+    """Elimina de la caché los mapas de todos los días que toca el intervalo [inicio, fin)."""
+    if not kinesiologo_id or inicio is None or fin is None:
+        return
+    # Se usa la fecha local de inicio y fin para cubrir bloqueos de varios días
+    fecha = timezone.localtime(inicio).date()
+    ultima = timezone.localtime(fin - timedelta(microseconds=1)).date()
+    version = version_kinesiologo(kinesiologo_id)
+    claves = []
+    while fecha <= ultima:
+        claves.append(clave_mapa(kinesiologo_id, fecha, version))
+        fecha += timedelta(days=1)
+    cache.delete_many(claves)
+
+
+# ----------------------------------------------------------------------
+# Consultas de disponibilidad
+# ----------------------------------------------------------------------
+
+def esta_libre(kinesiologo_id, inicio, duracion=DURACION_CITA):
+    """Indica si el kinesiólogo tiene libre el intervalo que parte en `inicio`."""
+    fin = inicio + timedelta(minutes=duracion)
+    fecha = timezone.localtime(inicio).date()
+    ultima = timezone.localtime(fin - timedelta(microseconds=1)).date()
+    while fecha <= ultima:
+        medianoche = inicio_del_dia(fecha)
+        if obtener_mapa_dia(kinesiologo_id, fecha) & mascara_intervalo(medianoche, inicio, fin):
+            return False
+        fecha += timedelta(days=1)
+    return True
+
+
+def horarios_libres_en_turnos(turnos, mapa, medianoche):
+    """Horarios de inicio de los turnos cuyo intervalo no toca ningún bit ocupado del mapa."""
+    horarios = []
+    for turno_inicio, turno_fin, duracion in turnos:
+        largo = timedelta(minutes=duracion)
+        hora_actual = turno_inicio
+        while hora_actual + largo <= turno_fin:
+            if not mapa & mascara_intervalo(medianoche, hora_actual, hora_actual + largo):
+                horarios.append(hora_actual)
+            hora_actual += largo
+    return horarios
+
+
+def horarios_libres_dia(kinesiologo_id, fecha):
+    """
+    Retorna los horarios de inicio libres de los turnos de `fecha` (según la
+    plantilla semanal del kinesiólogo), resolviendo cada uno con una operación
+    de bits sobre el mapa del día.
+    """
+    turnos = turnos_del_dia(obtener_plantilla(kinesiologo_id), fecha)
+    if not turnos:
+        return []
+    return horarios_libres_en_turnos(turnos, obtener_mapa_dia(kinesiologo_id, fecha), inicio_del_dia(fecha))
+
+
+async def ahorarios_libres_dia(kinesiologo_id, fecha):
+    """Versión asíncrona de `horarios_libres_dia`, para las vistas servidas por ASGI."""
+    turnos = turnos_del_dia(await aobtener_plantilla(kinesiologo_id), fecha)
+    if not turnos:
+        return []
+    return horarios_libres_en_turnos(turnos, await aobtener_mapa_dia(kinesiologo_id, fecha), inicio_del_dia(fecha))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-18 10:00
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+# Duración con que se reparan las citas antiguas sin duración válida (el default del campo)
+DURACION_POR_DEFECTO = 60
+
+
+def calcular_fecha_hora_fin(apps, schema_editor):
+    """
+    Rellena la hora de fin persistida de las citas existentes. Una cita con
+    duración 0 (o negativa) quedaría con fin <= inicio y la restricción
+    cita_fin_posterior_inicio abortaría la migración: se le asigna la
+    duración por defecto.
+    """
+    Cita = apps.get_model('citas', 'Cita')
+    citas = Cita.objects.only('pk', 'fecha_hora_inicio', 'duracion_minutos')
+    lote = []
+    for cita in citas.iterator(chunk_size=2000):
+        if cita.duracion_minutos is None or cita.duracion_minutos < 1:
+            cita.duracion_minutos = DURACION_POR_DEFECTO
+        cita.fecha_hora_fin = cita.fecha_hora_inicio + timedelta(minutes=cita.duracion_minutos)
+        lote.append(cita)
+        if len(lote) >= 2000:
+            Cita.objects.bulk_update(lote, ['duracion_minutos', 'fecha_hora_fin'])
+            lote = []
+    if lote:
+        Cita.objects.bulk_update(lote, ['duracion_minutos', 'fecha_hora_fin'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0002_alter_cita_options_alter_cita_estado_bloqueohorario'),
+        ('usuarios', '0004_alter_paciente_rut'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='fecha_hora_fin',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(calcular_fecha_hora_fin, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cita',
+            name='fecha_hora_fin',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['kinesiologo', 'fecha_hora_inicio', 'estado'], name='cita_kine_inicio_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['kinesiologo', 'fecha_hora_inicio', 'fecha_hora_fin'], name='cita_kine_inicio_fin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloqueohorario',
+            index=models.Index(fields=['kinesiologo', 'fecha_hora_inicio', 'fecha_hora_fin'], name='bloqueo_kine_inicio_fin_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.CheckConstraint(condition=models.Q(('fecha_hora_fin__gt', models.F('fecha_hora_inicio'))), name='cita_fin_posterior_inicio'),
+        ),
+    ]
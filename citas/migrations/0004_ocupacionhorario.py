@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 11:00
+
+from datetime import datetime, timedelta, timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+GRANULO = timedelta(minutes=15)
+EPOCA = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def reservar_citas_activas(apps, schema_editor):
+    """Ocupa los gránulos de las citas activas existentes (las que ya se traslapan se ignoran)."""
+    Cita = apps.get_model('citas', 'Cita')
+    OcupacionHorario = apps.get_model('citas', 'OcupacionHorario')
+
+    lote = []
+    citas = Cita.objects.exclude(estado='CANCELADA').values_list('pk', 'kinesiologo_id', 'fecha_hora_inicio', 'fecha_hora_fin')
+    for cita_id, kinesiologo_id, inicio, fin in citas.iterator(chunk_size=2000):
+        granulo = EPOCA + ((inicio - EPOCA) // GRANULO) * GRANULO
+        while granulo < fin:
+            lote.append(OcupacionHorario(kinesiologo_id=kinesiologo_id, cita_id=cita_id, granulo=granulo))
+            granulo += GRANULO
+        if len(lote) >= 2000:
+            OcupacionHorario.objects.bulk_create(lote, ignore_conflicts=True)
+            lote = []
+    if lote:
+        OcupacionHorario.objects.bulk_create(lote, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0003_cita_fecha_hora_fin_indices'),
+        ('usuarios', '0004_alter_paciente_rut'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granulo', models.DateTimeField()),
+                ('cita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones', to='citas.cita')),
+                ('kinesiologo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones', to='usuarios.kinesiologo')),
+            ],
+            options={
+                'verbose_name': 'Ocupación de Horario',
+                'verbose_name_plural': 'Ocupaciones de Horario',
+                'constraints': [models.UniqueConstraint(fields=('kinesiologo', 'granulo'), name='ocupacion_kine_granulo_unica')],
+            },
+        ),
+        migrations.RunPython(reservar_citas_activas, migrations.RunPython.noop),
+    ]
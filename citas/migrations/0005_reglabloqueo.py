@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 13:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0004_ocupacionhorario'),
+        ('usuarios', '0004_alter_paciente_rut'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReglaBloqueo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias_semana', models.CharField(max_length=13)),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('vigente_desde', models.DateField()),
+                ('vigente_hasta', models.DateField(blank=True, null=True)),
+                ('excepciones', models.JSONField(blank=True, default=list)),
+                ('motivo', models.CharField(blank=True, help_text='Ej. Colación, Tarde administrativa.', max_length=255, null=True)),
+                ('kinesiologo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reglas_bloqueo', to='usuarios.kinesiologo')),
+            ],
+            options={
+                'verbose_name': 'Regla de Bloqueo',
+                'verbose_name_plural': 'Reglas de Bloqueo',
+                'ordering': ['vigente_desde', 'hora_inicio'],
+                'indexes': [models.Index(fields=['kinesiologo', 'vigente_desde', 'vigente_hasta'], name='regla_kine_vigencia_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0005_reglabloqueo'),
+        ('usuarios', '0004_alter_paciente_rut'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioAtencion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('duracion_cita_minutos', models.PositiveSmallIntegerField(default=60)),
+                ('kinesiologo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horarios_atencion', to='usuarios.kinesiologo')),
+            ],
+            options={
+                'verbose_name': 'Horario de Atención',
+                'verbose_name_plural': 'Horarios de Atención',
+                'ordering': ['kinesiologo', 'dia_semana', 'hora_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HorarioEspecial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_desde', models.DateField()),
+                ('fecha_hasta', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, null=True)),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('duracion_cita_minutos', models.PositiveSmallIntegerField(default=60)),
+                ('motivo', models.CharField(blank=True, max_length=255, null=True)),
+                ('kinesiologo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horarios_especiales', to='usuarios.kinesiologo')),
+            ],
+            options={
+                'verbose_name': 'Horario Especial',
+                'verbose_name_plural': 'Horarios Especiales',
+                'ordering': ['kinesiologo', 'fecha_desde', 'hora_inicio'],
+            },
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 5.2 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0006_horarios_atencion'),
+        ('usuarios', '0004_alter_paciente_rut'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EsperaCupo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias_semana', models.CharField(max_length=13)),
+                ('hora_desde', models.TimeField()),
+                ('hora_hasta', models.TimeField()),
+                ('fecha_desde', models.DateField()),
+                ('fecha_hasta', models.DateField()),
+                ('activa', models.BooleanField(default=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Espera de Cupo',
+                'verbose_name_plural': 'Lista de Espera',
+                'ordering': ['fecha_creacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IndiceEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('hora', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Índice de Espera',
+                'verbose_name_plural': 'Índices de Espera',
+            },
+        ),
+        migrations.CreateModel(
+            name='OfertaCupo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_hora_inicio', models.DateTimeField()),
+                ('fecha_hora_fin', models.DateTimeField()),
+                ('expira_en', models.DateTimeField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ACEPTADA', 'Aceptada'), ('RECHAZADA', 'Rechazada'), ('EXPIRADA', 'Expirada')], default='PENDIENTE', max_length=10)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Oferta de Cupo',
+                'verbose_name_plural': 'Ofertas de Cupo',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='cita',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'CANCELADA'), _negated=True), fields=('kinesiologo', 'fecha_hora_inicio'), name='cita_kine_inicio_activa_unica'),
+        ),
+        migrations.AddField(
+            model_name='esperacupo',
+            name='kinesiologos',
+            field=models.ManyToManyField(blank=True, related_name='esperas', to='usuarios.kinesiologo'),
+        ),
+        migrations.AddField(
+            model_name='esperacupo',
+            name='paciente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='usuarios.paciente'),
+        ),
+        migrations.AddField(
+            model_name='indiceespera',
+            name='espera',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indices', to='citas.esperacupo'),
+        ),
+        migrations.AddField(
+            model_name='indiceespera',
+            name='kinesiologo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='usuarios.kinesiologo'),
+        ),
+        migrations.AddField(
+            model_name='ofertacupo',
+            name='cita',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='oferta_origen', to='citas.cita'),
+        ),
+        migrations.AddField(
+            model_name='ofertacupo',
+            name='espera',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ofertas', to='citas.esperacupo'),
+        ),
+        migrations.AddField(
+            model_name='ofertacupo',
+            name='kinesiologo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ofertas_cupo', to='usuarios.kinesiologo'),
+        ),
+        migrations.AddIndex(
+            model_name='indiceespera',
+            index=models.Index(fields=['dia_semana', 'hora', 'kinesiologo'], name='indice_espera_franja_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ofertacupo',
+            index=models.Index(fields=['kinesiologo', 'estado', 'fecha_hora_inicio', 'fecha_hora_fin'], name='oferta_kine_estado_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0007_lista_espera'),
+        ('usuarios', '0004_alter_paciente_rut'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cita', 'Cita'), ('bloqueo', 'Bloqueo')], max_length=10)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('kinesiologo', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='usuarios.kinesiologo')),
+            ],
+            options={
+                'verbose_name': 'Cambio de Agenda',
+                'verbose_name_plural': 'Cambios de Agenda',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['kinesiologo', 'id'], name='cambio_kine_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0008_cambio_agenda'),
+        ('usuarios', '0005_paginacion_indices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['paciente', 'fecha_hora_inicio', 'id'], name='cita_paciente_inicio_idx'),
+        ),
+    ]
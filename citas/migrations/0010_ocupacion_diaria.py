@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 17:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0009_paginacion_indices'),
+        ('usuarios', '0005_paginacion_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('minutos_jornada', models.PositiveIntegerField(default=0)),
+                ('minutos_agendados', models.PositiveIntegerField(default=0)),
+                ('minutos_bloqueados', models.PositiveIntegerField(default=0)),
+                ('minutos_disponibles', models.PositiveIntegerField(default=0)),
+                ('citas_pendientes', models.PositiveIntegerField(default=0)),
+                ('citas_confirmadas', models.PositiveIntegerField(default=0)),
+                ('citas_finalizadas', models.PositiveIntegerField(default=0)),
+                ('citas_canceladas', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('kinesiologo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacion_diaria', to='usuarios.kinesiologo')),
+            ],
+            options={
+                'verbose_name': 'Ocupación Diaria',
+                'verbose_name_plural': 'Ocupación Diaria',
+                'ordering': ['fecha'],
+                'indexes': [models.Index(fields=['fecha', 'kinesiologo'], name='ocupacion_diaria_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kinesiologo', 'fecha'), name='ocupacion_diaria_kine_fecha_unica')],
+            },
+        ),
+    ]
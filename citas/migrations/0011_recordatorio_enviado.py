@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0010_ocupacion_diaria'),
+        ('usuarios', '0005_paginacion_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='recordatorio_enviado',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(condition=models.Q(('estado__in', ['PENDIENTE', 'CONFIRMADA']), ('recordatorio_enviado__isnull', True)), fields=['fecha_hora_inicio', 'id'], name='cita_recordatorio_pend_idx'),
+        ),
+    ]
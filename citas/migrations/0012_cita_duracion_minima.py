@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 19:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0011_recordatorio_enviado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cita',
+            name='duracion_minutos',
+            field=models.PositiveSmallIntegerField(default=60, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
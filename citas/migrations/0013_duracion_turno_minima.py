@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 19:20
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0012_cita_duracion_minima'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='horarioatencion',
+            name='duracion_cita_minutos',
+            field=models.PositiveSmallIntegerField(default=60, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='horarioespecial',
+            name='duracion_cita_minutos',
+            field=models.PositiveSmallIntegerField(default=60, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
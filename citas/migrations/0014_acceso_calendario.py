@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0013_duracion_turno_minima'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccesoCalendario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('k', 'Kinesiólogo'), ('p', 'Paciente')], max_length=1)),
+                ('propietario_id', models.PositiveBigIntegerField()),
+                ('generacion', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Acceso a Calendario',
+                'verbose_name_plural': 'Accesos a Calendario',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'propietario_id'), name='acceso_calendario_propietario_unico')],
+            },
+        ),
+    ]
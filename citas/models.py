@@ -1,6 +1,9 @@
 # citas/models.py
 
-from django.db import models
+from datetime import datetime, timedelta
+
+from django.core.validators import MinValueValidator
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from usuarios.models import Kinesiologo, Paciente 
@@ -22,6 +25,16 @@ ESTADOS_CITA = [
     (CITA_CANCELADA, 'Cancelada'),
 ]
 
+DIAS_SEMANA = [
+    (0, 'Lunes'),
+    (1, 'Martes'),
+    (2, 'Miércoles'),
+    (3, 'Jueves'),
+    (4, 'Viernes'),
+    (5, 'Sábado'),
+    (6, 'Domingo'),
+]
+
 # -----------------------------------------------------------
 # MODELO CITA (Con ajustes de constantes)
 # -----------------------------------------------------------
@@ -33,7 +46,10 @@ class Cita(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.PROTECT, related_name='citas_solicitadas')
     
     fecha_hora_inicio = models.DateTimeField() 
-    duracion_minutos = models.PositiveSmallIntegerField(default=60) 
+    # Al menos un minuto: con 0 el fin coincide con el inicio y la restricción cita_fin_posterior_inicio falla
+    duracion_minutos = models.PositiveSmallIntegerField(default=60, validators=[MinValueValidator(1)])
+    # Se persiste (y recalcula en save) para poder filtrar traslapes con índices
+    fecha_hora_fin = models.DateTimeField(editable=False)
     motivo = models.TextField(blank=True, null=True)
     
     estado = models.CharField(
@@ -43,22 +59,120 @@ class Cita(models.Model):
     )
     
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Momento en que un proceso tomó la cita para enviarle el recordatorio (citas/recordatorios.py)
+    recordatorio_enviado = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
-        unique_together = ('kinesiologo', 'fecha_hora_inicio') 
         ordering = ['fecha_hora_inicio']
         verbose_name = "Cita"
         verbose_name_plural = "Citas"
+        indexes = [
+            models.Index(fields=['kinesiologo', 'fecha_hora_inicio', 'estado'], name='cita_kine_inicio_estado_idx'),
+            models.Index(fields=['kinesiologo', 'fecha_hora_inicio', 'fecha_hora_fin'], name='cita_kine_inicio_fin_idx'),
+            # Agenda del paciente paginada por (fecha_hora_inicio, id)
+            models.Index(fields=['paciente', 'fecha_hora_inicio', 'id'], name='cita_paciente_inicio_idx'),
+            # Índice parcial: solo las citas activas que aún esperan su recordatorio
+            models.Index(
+                fields=['fecha_hora_inicio', 'id'],
+                name='cita_recordatorio_pend_idx',
+                condition=models.Q(recordatorio_enviado__isnull=True, estado__in=[CITA_PENDIENTE, CITA_CONFIRMADA]),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(fecha_hora_fin__gt=models.F('fecha_hora_inicio')),
+                name='cita_fin_posterior_inicio',
+            ),
+            # Solo las citas activas toman el horario: uno cancelado se puede volver a agendar
+            models.UniqueConstraint(
+                fields=['kinesiologo', 'fecha_hora_inicio'],
+                condition=~models.Q(estado=CITA_CANCELADA),
+                name='cita_kine_inicio_activa_unica',
+            ),
+        ]
 
     def __str__(self):
         # Usar timezone.localtime para mostrar la hora en la zona local si aplica
         local_time = timezone.localtime(self.fecha_hora_inicio)
         return f"Cita de {self.paciente} con {self.kinesiologo} el {local_time.strftime('%d-%m-%Y %H:%M')}"
         
-    @property
-    def fecha_hora_fin(self):
-        """Calcula la hora de fin de la cita."""
-        return self.fecha_hora_inicio + timezone.timedelta(minutes=self.duracion_minutos)
+    def calcular_fecha_hora_fin(self):
+        """Calcula la hora de fin de la cita a partir del inicio y la duración."""
+        return self.fecha_hora_inicio + timedelta(minutes=self.duracion_minutos)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._reserva_original = instancia._datos_reserva()
+        return instancia
+
+    def _datos_reserva(self):
+        # Lo que determina los gránulos ocupados; se lee desde __dict__ para no cargar campos diferidos
+        datos = vars(self)
+        return (
+            datos.get('kinesiologo_id'), datos.get('fecha_hora_inicio'),
+            datos.get('duracion_minutos'), datos.get('estado') == CITA_CANCELADA,
+        )
+
+    def _reiniciar_recordatorio(self, update_fields):
+        """
+        Una cita que cambia de hora de inicio vuelve a quedar pendiente de
+        recordatorio. Retorna True si lo reinició.
+        """
+        original = getattr(self, '_reserva_original', None)
+        if self._state.adding or original is None or original[1] is None or original[1] == self.fecha_hora_inicio:
+            return False
+        if update_fields is not None and 'fecha_hora_inicio' not in update_fields:
+            return False
+        self.recordatorio_enviado = None
+        return True
+
+    def save(self, *args, **kwargs):
+        """
+        Guarda la cita y, en la misma transacción, ocupa (o libera) sus
+        gránulos de OcupacionHorario (citas/reservas.py) si es nueva o cambió
+        de kinesiólogo, horario, duración o pasó a/desde cancelada. Lanza
+        ValidationError si el horario ya está tomado por otra cita.
+        """
+        from .reservas import MENSAJE_HORARIO_OCUPADO, reservar_horario  # reservas importa este módulo
+
+        if not self.duracion_minutos or self.duracion_minutos < 1:
+            # Error de validación en vez del IntegrityError de la restricción
+            raise ValidationError({'duracion_minutos': "La cita debe durar al menos un minuto."})
+        # Mantener siempre consistente la hora de fin persistida
+        self.fecha_hora_fin = self.calcular_fecha_hora_fin()
+        update_fields = kwargs.get('update_fields')
+        reiniciar = self._reiniciar_recordatorio(update_fields)
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'fecha_hora_inicio', 'duracion_minutos'} & update_fields:
+                update_fields.add('fecha_hora_fin')
+            if reiniciar:
+                update_fields.add('recordatorio_enviado')
+            kwargs['update_fields'] = update_fields
+        elif not self._state.adding and not reiniciar and not kwargs.get('force_insert'):
+            # Un guardado completo no escribe recordatorio_enviado: una instancia cargada
+            # antes pisaría con NULL la marca que puso el proceso de recordatorios
+            diferidos = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.attname not in diferidos and campo.name != 'recordatorio_enviado'
+            ]
+
+        era_nueva = self._state.adding
+        reservar = era_nueva or getattr(self, '_reserva_original', None) != self._datos_reserva()
+        try:
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+                if reservar:
+                    reservar_horario(self, era_nueva)
+        except IntegrityError:
+            # La transacción se revirtió completa: la cita nueva no quedó guardada
+            if era_nueva:
+                self.pk = None
+                self._state.adding = True
+            raise ValidationError(MENSAJE_HORARIO_OCUPADO)
+        self._reserva_original = self._datos_reserva()
 
 
 # -----------------------------------------------------------
@@ -79,6 +193,9 @@ class BloqueoHorario(models.Model):
         verbose_name = "Bloqueo de Horario"
         verbose_name_plural = "Bloqueos de Horarios"
         ordering = ['fecha_hora_inicio']
+        indexes = [
+            models.Index(fields=['kinesiologo', 'fecha_hora_inicio', 'fecha_hora_fin'], name='bloqueo_kine_inicio_fin_idx'),
+        ]
         
     def __str__(self):
         # Muestra el rango de fechas en la zona horaria del usuario
@@ -91,22 +208,430 @@ class BloqueoHorario(models.Model):
         if self.fecha_hora_inicio >= self.fecha_hora_fin:
             raise ValidationError({'fecha_hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
         
-        # Validación: Bloqueo no debe traslaparse con citas existentes
-        if self.kinesiologo:
+        # Validación: Bloqueo no debe traslaparse con citas existentes.
+        # Traslape semiabierto: la cita empieza antes del fin y termina después del inicio.
+        if self.kinesiologo_id:
             traslape_citas = Cita.objects.filter(
-                kinesiologo=self.kinesiologo,
+                kinesiologo_id=self.kinesiologo_id,
                 fecha_hora_inicio__lt=self.fecha_hora_fin,
-                fecha_hora_inicio__gte=self.fecha_hora_inicio, # Citas que inician durante el bloqueo
-                estado__in=[CITA_PENDIENTE, CITA_CONFIRMADA]
-            )
-            # También verificar citas que terminan durante el bloqueo
-            traslape_citas_fin = Cita.objects.filter(
-                kinesiologo=self.kinesiologo,
-                fecha_hora_inicio__lt=self.fecha_hora_inicio,
-                fecha_hora_inicio__range=[self.fecha_hora_inicio - timezone.timedelta(minutes=1), self.fecha_hora_fin],
+                fecha_hora_fin__gt=self.fecha_hora_inicio,
                 estado__in=[CITA_PENDIENTE, CITA_CONFIRMADA]
             )
             
-            if traslape_citas.exists() or traslape_citas_fin.exists():
-                 # Una validación más simple para evitar complejidad excesiva aquí
+            if traslape_citas.exists():
                  raise ValidationError("El bloqueo se traslapa con citas ya agendadas (PENDIENTES o CONFIRMADAS).")
+
+
+# -----------------------------------------------------------
+# MODELO REGLA DE BLOQUEO (Bloqueos recurrentes)
+# -----------------------------------------------------------
+
+class ReglaBloqueo(models.Model):
+    """
+    Bloqueo recurrente guardado como regla (estilo RRULE): días de la semana,
+    franja horaria, rango de vigencia y fechas de excepción. No se materializa
+    en filas de BloqueoHorario; se expande solo para la ventana consultada.
+    """
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, related_name='reglas_bloqueo')
+    # Días de la semana separados por coma (0 = lunes ... 6 = domingo)
+    dias_semana = models.CharField(max_length=13)
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    vigente_desde = models.DateField()
+    vigente_hasta = models.DateField(blank=True, null=True)
+    # Fechas ISO (AAAA-MM-DD) en que la regla no aplica
+    excepciones = models.JSONField(default=list, blank=True)
+    motivo = models.CharField(max_length=255, blank=True, null=True,
+                              help_text="Ej. Colación, Tarde administrativa.")
+
+    class Meta:
+        verbose_name = "Regla de Bloqueo"
+        verbose_name_plural = "Reglas de Bloqueo"
+        ordering = ['vigente_desde', 'hora_inicio']
+        indexes = [
+            models.Index(fields=['kinesiologo', 'vigente_desde', 'vigente_hasta'], name='regla_kine_vigencia_idx'),
+        ]
+
+    def __str__(self):
+        return f"Bloqueo recurrente de {self.kinesiologo} ({self.dias_semana_display} {self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M})"
+
+    @property
+    def dias_semana_lista(self):
+        return [int(dia) for dia in self.dias_semana.split(',') if dia != '']
+
+    @property
+    def dias_semana_display(self):
+        """Días abreviados, p. ej. 'Lun, Mié, Vie'."""
+        nombres = dict(DIAS_SEMANA)
+        return ', '.join(nombres[dia][:3] for dia in self.dias_semana_lista)
+
+    def clean(self):
+        if self.hora_inicio and self.hora_fin and self.hora_inicio >= self.hora_fin:
+            raise ValidationError({'hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
+        if self.vigente_desde and self.vigente_hasta and self.vigente_hasta < self.vigente_desde:
+            raise ValidationError({'vigente_hasta': 'La vigencia debe terminar después de su inicio.'})
+        if not self.dias_semana_lista:
+            raise ValidationError({'dias_semana': 'Selecciona al menos un día de la semana.'})
+
+    def expandir(self, inicio, fin):
+        """Retorna los intervalos (inicio, fin) concretos de la regla que tocan la ventana [inicio, fin)."""
+        desde = max(timezone.localtime(inicio).date(), self.vigente_desde)
+        hasta = timezone.localtime(fin).date()
+        if self.vigente_hasta:
+            hasta = min(hasta, self.vigente_hasta)
+
+        dias = set(self.dias_semana_lista)
+        excepciones = set(self.excepciones or [])
+        intervalos = []
+        fecha = desde
+        while fecha <= hasta:
+            if fecha.weekday() in dias and fecha.isoformat() not in excepciones:
+                bloqueo_inicio = timezone.make_aware(datetime.combine(fecha, self.hora_inicio))
+                bloqueo_fin = timezone.make_aware(datetime.combine(fecha, self.hora_fin))
+                if bloqueo_inicio < fin and bloqueo_fin > inicio:
+                    intervalos.append((bloqueo_inicio, bloqueo_fin))
+            fecha += timedelta(days=1)
+        return intervalos
+
+    def aplica_a(self, inicio, fin):
+        """Indica si el intervalo [inicio, fin) choca con alguna ocurrencia de la regla."""
+        return bool(self.expandir(inicio, fin))
+
+    def citas_en_conflicto(self):
+        """Citas activas del kinesiólogo dentro de la vigencia que chocan con la regla."""
+        desde = max(self.vigente_desde, timezone.localdate())
+        citas = Cita.objects.filter(
+            kinesiologo_id=self.kinesiologo_id,
+            fecha_hora_fin__gt=timezone.make_aware(datetime.combine(desde, datetime.min.time())),
+            estado__in=[CITA_PENDIENTE, CITA_CONFIRMADA],
+        )
+        if self.vigente_hasta:
+            citas = citas.filter(
+                fecha_hora_inicio__lt=timezone.make_aware(datetime.combine(self.vigente_hasta + timedelta(days=1), datetime.min.time()))
+            )
+        return [cita for cita in citas if self.aplica_a(cita.fecha_hora_inicio, cita.fecha_hora_fin)]
+
+
+# -----------------------------------------------------------
+# MODELO OCUPACIÓN DE HORARIO (Reserva de gránulos)
+# -----------------------------------------------------------
+
+class OcupacionHorario(models.Model):
+    """
+    Una fila por kinesiólogo y gránulo de 15 minutos ocupado por una cita activa.
+    La restricción única hace que dos citas traslapadas no puedan guardarse
+    aunque se agenden al mismo tiempo: el segundo INSERT falla dentro de la
+    misma transacción que la Cita (ver citas/reservas.py).
+    """
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, related_name='ocupaciones')
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, related_name='ocupaciones')
+    granulo = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Ocupación de Horario"
+        verbose_name_plural = "Ocupaciones de Horario"
+        constraints = [
+            models.UniqueConstraint(fields=['kinesiologo', 'granulo'], name='ocupacion_kine_granulo_unica'),
+        ]
+
+    def __str__(self):
+        return f"Ocupación de {self.kinesiologo} ({timezone.localtime(self.granulo).strftime('%Y-%m-%d %H:%M')})"
+
+
+# -----------------------------------------------------------
+# MODELOS DE JORNADA LABORAL (Horarios de atención por Kinesiólogo)
+# -----------------------------------------------------------
+
+class HorarioAtencion(models.Model):
+    """
+    Turno semanal de atención de un kinesiólogo. Un mismo día puede tener
+    varios turnos (p. ej. 09:00-13:00 y 15:00-19:00), cada uno con su propia
+    duración de cita. Si un kinesiólogo no tiene turnos se usa la jornada por
+    defecto de citas.disponibilidad.
+    """
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, related_name='horarios_atencion')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    duracion_cita_minutos = models.PositiveSmallIntegerField(default=60, validators=[MinValueValidator(1)])
+
+    class Meta:
+        verbose_name = "Horario de Atención"
+        verbose_name_plural = "Horarios de Atención"
+        ordering = ['kinesiologo', 'dia_semana', 'hora_inicio']
+
+    def __str__(self):
+        return f"{self.kinesiologo} - {self.get_dia_semana_display()} {self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M}"
+
+    def clean(self):
+        if self.hora_inicio and self.hora_fin and self.hora_inicio >= self.hora_fin:
+            raise ValidationError({'hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
+
+
+class HorarioEspecial(models.Model):
+    """
+    Excepción con rango de fechas a los turnos semanales (p. ej. horario de
+    verano o una semana de media jornada). Para los días dentro del rango,
+    todos los HorarioEspecial que los cubren reemplazan a los turnos semanales;
+    sin horas indicadas, el kinesiólogo no atiende esos días.
+    """
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, related_name='horarios_especiales')
+    fecha_desde = models.DateField()
+    fecha_hasta = models.DateField()
+    hora_inicio = models.TimeField(blank=True, null=True)
+    hora_fin = models.TimeField(blank=True, null=True)
+    duracion_cita_minutos = models.PositiveSmallIntegerField(default=60, validators=[MinValueValidator(1)])
+    motivo = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Horario Especial"
+        verbose_name_plural = "Horarios Especiales"
+        ordering = ['kinesiologo', 'fecha_desde', 'hora_inicio']
+
+    def __str__(self):
+        if self.hora_inicio is None:
+            return f"{self.kinesiologo} - sin atención del {self.fecha_desde} al {self.fecha_hasta}"
+        return f"{self.kinesiologo} - {self.fecha_desde} al {self.fecha_hasta} {self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M}"
+
+    def clean(self):
+        if self.fecha_desde and self.fecha_hasta and self.fecha_hasta < self.fecha_desde:
+            raise ValidationError({'fecha_hasta': 'La fecha de término debe ser posterior a la de inicio.'})
+        if (self.hora_inicio is None) != (self.hora_fin is None):
+            raise ValidationError('Indica ambas horas, o ninguna para marcar los días sin atención.')
+        if self.hora_inicio and self.hora_fin and self.hora_inicio >= self.hora_fin:
+            raise ValidationError({'hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
+
+
+# -----------------------------------------------------------
+# MODELOS DE LISTA DE ESPERA
+# -----------------------------------------------------------
+
+class EsperaCupo(models.Model):
+    """
+    Inscripción de un paciente en la lista de espera: kinesiólogos preferidos
+    (ninguno = cualquiera), días de la semana, franja horaria y rango de fechas
+    en que le sirve una hora que se libere.
+    """
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='esperas')
+    kinesiologos = models.ManyToManyField(Kinesiologo, blank=True, related_name='esperas')
+    # Días de la semana separados por coma (0 = lunes ... 6 = domingo)
+    dias_semana = models.CharField(max_length=13)
+    hora_desde = models.TimeField()
+    hora_hasta = models.TimeField()
+    fecha_desde = models.DateField()
+    fecha_hasta = models.DateField()
+    activa = models.BooleanField(default=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Espera de Cupo"
+        verbose_name_plural = "Lista de Espera"
+        ordering = ['fecha_creacion']
+
+    def __str__(self):
+        return f"Espera de {self.paciente} ({self.fecha_desde} al {self.fecha_hasta}, {self.hora_desde:%H:%M}-{self.hora_hasta:%H:%M})"
+
+    @property
+    def dias_semana_lista(self):
+        return [int(dia) for dia in self.dias_semana.split(',') if dia != '']
+
+    @property
+    def dias_semana_display(self):
+        nombres = dict(DIAS_SEMANA)
+        return ', '.join(nombres[dia][:3] for dia in self.dias_semana_lista)
+
+    def acepta(self, inicio, fin):
+        """Indica si el horario [inicio, fin) calza con la franja, días y fechas de la espera."""
+        inicio_local = timezone.localtime(inicio)
+        fin_local = timezone.localtime(fin)
+        return (
+            self.fecha_desde <= inicio_local.date() <= self.fecha_hasta
+            and inicio_local.weekday() in self.dias_semana_lista
+            and inicio_local.date() == fin_local.date()
+            and self.hora_desde <= inicio_local.time()
+            and fin_local.time() <= self.hora_hasta
+        )
+
+
+class IndiceEspera(models.Model):
+    """
+    Índice de la lista de espera por kinesiólogo, día de la semana y hora.
+    Cada espera tiene una fila por cada (kinesiólogo, día, hora) que cubre;
+    `kinesiologo` nulo significa "cualquier kinesiólogo". Al liberarse un cupo
+    se buscan candidatos con una consulta indexada, sin recorrer toda la lista.
+    """
+    espera = models.ForeignKey(EsperaCupo, on_delete=models.CASCADE, related_name='indices')
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    hora = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Índice de Espera"
+        verbose_name_plural = "Índices de Espera"
+        indexes = [
+            models.Index(fields=['dia_semana', 'hora', 'kinesiologo'], name='indice_espera_franja_idx'),
+        ]
+
+
+OFERTA_PENDIENTE = 'PENDIENTE'
+OFERTA_ACEPTADA = 'ACEPTADA'
+OFERTA_RECHAZADA = 'RECHAZADA'
+OFERTA_EXPIRADA = 'EXPIRADA'
+
+ESTADOS_OFERTA = [
+    (OFERTA_PENDIENTE, 'Pendiente'),
+    (OFERTA_ACEPTADA, 'Aceptada'),
+    (OFERTA_RECHAZADA, 'Rechazada'),
+    (OFERTA_EXPIRADA, 'Expirada'),
+]
+
+
+class OfertaCupo(models.Model):
+    """
+    Cupo liberado ofrecido a un paciente de la lista de espera. Mientras está
+    pendiente y no expira, el horario queda retenido para ese paciente (cuenta
+    como ocupado en la disponibilidad pública).
+    """
+    espera = models.ForeignKey(EsperaCupo, on_delete=models.CASCADE, related_name='ofertas')
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, related_name='ofertas_cupo')
+    fecha_hora_inicio = models.DateTimeField()
+    fecha_hora_fin = models.DateTimeField()
+    expira_en = models.DateTimeField()
+    estado = models.CharField(max_length=10, choices=ESTADOS_OFERTA, default=OFERTA_PENDIENTE)
+    cita = models.OneToOneField(Cita, on_delete=models.SET_NULL, blank=True, null=True, related_name='oferta_origen')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Oferta de Cupo"
+        verbose_name_plural = "Ofertas de Cupo"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['kinesiologo', 'estado', 'fecha_hora_inicio', 'fecha_hora_fin'], name='oferta_kine_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Oferta a {self.espera.paciente} ({timezone.localtime(self.fecha_hora_inicio).strftime('%d-%m-%Y %H:%M')})"
+
+    @property
+    def vigente(self):
+        return self.estado == OFERTA_PENDIENTE and self.expira_en > timezone.now()
+
+
+# -----------------------------------------------------------
+# MODELO DE CAMBIOS DE AGENDA (FEED EN VIVO)
+# -----------------------------------------------------------
+
+CAMBIO_CITA = 'cita'
+CAMBIO_BLOQUEO = 'bloqueo'
+
+TIPOS_CAMBIO = [
+    (CAMBIO_CITA, 'Cita'),
+    (CAMBIO_BLOQUEO, 'Bloqueo'),
+]
+
+
+class CambioAgenda(models.Model):
+    """
+    Registro de cada cambio (guardado o eliminación) de una Cita o un
+    BloqueoHorario en la agenda de un kinesiólogo. El id autoincremental
+    sirve de cursor del feed en vivo del dashboard.
+    """
+    # Sin restricción en la BD: al borrar un kinesiólogo, las señales de sus citas
+    # borradas en cascada aún registran cambios; esas filas se purgan por antigüedad.
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    tipo = models.CharField(max_length=10, choices=TIPOS_CAMBIO)
+    objeto_id = models.PositiveBigIntegerField()
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Cambio de Agenda"
+        verbose_name_plural = "Cambios de Agenda"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['kinesiologo', 'id'], name='cambio_kine_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.objeto_id} ({self.fecha:%d-%m-%Y %H:%M})"
+
+
+# -----------------------------------------------------------
+# MODELO DE ACCESO AL CALENDARIO (.ics)
+# -----------------------------------------------------------
+
+CALENDARIO_KINESIOLOGO = 'k'
+CALENDARIO_PACIENTE = 'p'
+
+TIPOS_CALENDARIO = [
+    (CALENDARIO_KINESIOLOGO, 'Kinesiólogo'),
+    (CALENDARIO_PACIENTE, 'Paciente'),
+]
+
+
+class AccesoCalendario(models.Model):
+    """
+    Generación vigente del enlace al feed .ics de un kinesiólogo o paciente.
+    El token de la URL lleva la generación con que se creó; regenerar el
+    enlace la incrementa y los tokens anteriores dejan de ser válidos. Sin
+    fila, la generación es 0.
+    """
+    tipo = models.CharField(max_length=1, choices=TIPOS_CALENDARIO)
+    propietario_id = models.PositiveBigIntegerField()
+    generacion = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Acceso a Calendario"
+        verbose_name_plural = "Accesos a Calendario"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'propietario_id'], name='acceso_calendario_propietario_unico'),
+        ]
+
+    def __str__(self):
+        return f"Calendario {self.get_tipo_display()} #{self.propietario_id} (generación {self.generacion})"
+
+
+# -----------------------------------------------------------
+# MODELO DE OCUPACIÓN DIARIA (Resumen precalculado)
+# -----------------------------------------------------------
+
+class OcupacionDiaria(models.Model):
+    """
+    Resumen de capacidad de un día de la agenda de un kinesiólogo: minutos
+    de jornada, agendados, bloqueados y disponibles, y citas por estado.
+    Las señales (y las operaciones masivas) recalculan solo los días que
+    tocan, así los reportes leen filas ya calculadas en vez de recorrer el
+    historial de citas (ver citas/ocupacion_diaria.py).
+    """
+    kinesiologo = models.ForeignKey(Kinesiologo, on_delete=models.CASCADE, related_name='ocupacion_diaria')
+    fecha = models.DateField()
+    minutos_jornada = models.PositiveIntegerField(default=0)
+    minutos_agendados = models.PositiveIntegerField(default=0)
+    minutos_bloqueados = models.PositiveIntegerField(default=0)
+    minutos_disponibles = models.PositiveIntegerField(default=0)
+    citas_pendientes = models.PositiveIntegerField(default=0)
+    citas_confirmadas = models.PositiveIntegerField(default=0)
+    citas_finalizadas = models.PositiveIntegerField(default=0)
+    citas_canceladas = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Ocupación Diaria"
+        verbose_name_plural = "Ocupación Diaria"
+        ordering = ['fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['kinesiologo', 'fecha'], name='ocupacion_diaria_kine_fecha_unica'),
+        ]
+        indexes = [
+            # Reportes de todos los kinesiólogos por rango de fechas
+            models.Index(fields=['fecha', 'kinesiologo'], name='ocupacion_diaria_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ocupación de {self.kinesiologo} el {self.fecha:%d-%m-%Y}"
+
+    @property
+    def porcentaje_ocupacion(self):
+        """Porcentaje de la jornada que no quedó disponible (agendado o bloqueado)."""
+        if not self.minutos_jornada:
+            return 0
+        return round(100 * (self.minutos_jornada - self.minutos_disponibles) / self.minutos_jornada)
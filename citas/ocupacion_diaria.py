@@ -0,0 +1,275 @@
+# citas/ocupacion_diaria.py
+
+"""
+Resumen diario de ocupación por kinesiólogo (modelo OcupacionDiaria).
+
+Cada fila guarda los minutos de jornada, agendados, bloqueados y
+disponibles de un día, y las citas por estado. Cuando cambia una Cita o un
+BloqueoHorario, las señales (y las operaciones masivas que no las disparan)
+recalculan, al confirmar la transacción, solo los días que tocó el cambio:
+el costo depende de las citas de esos días, no del tamaño del historial.
+Los reportes suman filas ya calculadas; antes calculan y guardan los días
+del rango que aún no tienen fila (un día sin cambios igual tiene jornada).
+
+Los cambios de turnos y reglas de bloqueo recalculan las filas desde hoy;
+los días pasados conservan la jornada con que se registraron. El comando
+`reconstruir_ocupacion` recalcula cualquier rango (carga inicial o
+corrección).
+"""
+
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Min, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from usuarios.models import Kinesiologo
+from .models import (
+    Cita, BloqueoHorario, OcupacionDiaria,
+    CITA_PENDIENTE, CITA_CONFIRMADA, CITA_FINALIZADA, CITA_CANCELADA,
+)
+from .disponibilidad import inicio_del_dia, fusionar_intervalos, huecos_libres, reglas_vigentes
+from .jornadas import obtener_plantilla, turnos_del_dia
+
+
+# Días que se calculan con un mismo juego de consultas
+DIAS_POR_VENTANA = 31
+# Rango máximo de un reporte, y de los días que un reporte completa por su cuenta
+# (una carga mayor es para el comando reconstruir_ocupacion)
+MAX_DIAS_REPORTE = 366
+
+CONTADORES_ESTADO = {
+    CITA_PENDIENTE: 'citas_pendientes',
+    CITA_CONFIRMADA: 'citas_confirmadas',
+    CITA_FINALIZADA: 'citas_finalizadas',
+    CITA_CANCELADA: 'citas_canceladas',
+}
+CAMPOS_MINUTOS = ('minutos_jornada', 'minutos_agendados', 'minutos_bloqueados', 'minutos_disponibles')
+CAMPOS_RESUMEN = CAMPOS_MINUTOS + tuple(CONTADORES_ESTADO.values()) + ('actualizado',)
+
+AGRUPACION_DIA = 'dia'
+AGRUPACION_SEMANA = 'semana'
+AGRUPACIONES = [
+    (AGRUPACION_SEMANA, 'Por semana'),
+    (AGRUPACION_DIA, 'Por día'),
+]
+
+
+# ----------------------------------------------------------------------
+# Cálculo
+# ----------------------------------------------------------------------
+
+def fechas_de_intervalo(inicio, fin):
+    """Fechas locales que toca el intervalo [inicio, fin)."""
+    if inicio is None or fin is None or fin <= inicio:
+        return []
+    fecha = timezone.localtime(inicio).date()
+    ultima = timezone.localtime(fin - timedelta(microseconds=1)).date()
+    fechas = []
+    while fecha <= ultima:
+        fechas.append(fecha)
+        fecha += timedelta(days=1)
+    return fechas
+
+
+def _ventanas(fechas):
+    """Agrupa las fechas (ordenadas, sin repetir) en ventanas de a lo más DIAS_POR_VENTANA días."""
+    ventana = []
+    for fecha in sorted(set(fechas)):
+        if ventana and (fecha - ventana[0]).days >= DIAS_POR_VENTANA:
+            yield ventana
+            ventana = []
+        ventana.append(fecha)
+    if ventana:
+        yield ventana
+
+
+def _minutos(intervalos):
+    return int(sum((fin - inicio for inicio, fin in intervalos), timedelta()).total_seconds() // 60)
+
+
+def _recortar(intervalos, inicio, fin):
+    return [(max(a, inicio), min(b, fin)) for a, b in intervalos if a < fin and b > inicio]
+
+
+def calcular_dias(kinesiologo_id, fechas, plantilla=None):
+    """
+    Retorna los OcupacionDiaria (sin guardar) de `fechas`, que deben caber en
+    una ventana. Son tres consultas (citas, bloqueos y reglas de la ventana)
+    sin importar cuántos días se calculen.
+    """
+    if plantilla is None:
+        plantilla = obtener_plantilla(kinesiologo_id)
+    desde = inicio_del_dia(fechas[0])
+    hasta = inicio_del_dia(fechas[-1] + timedelta(days=1))
+
+    citas = list(Cita.objects.filter(
+        kinesiologo_id=kinesiologo_id, fecha_hora_inicio__lt=hasta, fecha_hora_fin__gt=desde,
+    ).values_list('fecha_hora_inicio', 'fecha_hora_fin', 'estado'))
+    bloqueos = list(BloqueoHorario.objects.filter(
+        kinesiologo_id=kinesiologo_id, fecha_hora_inicio__lt=hasta, fecha_hora_fin__gt=desde,
+    ).values_list('fecha_hora_inicio', 'fecha_hora_fin'))
+    for regla in reglas_vigentes([kinesiologo_id], desde, hasta):
+        bloqueos.extend(regla.expandir(desde, hasta))
+
+    agendados = fusionar_intervalos([(inicio, fin) for inicio, fin, estado in citas if estado != CITA_CANCELADA])
+    bloqueos = fusionar_intervalos(bloqueos)
+    ocupados = fusionar_intervalos(agendados + bloqueos)
+
+    # Las citas se cuentan en el día (local) en que comienzan
+    por_dia_y_estado = {}
+    for inicio, _, estado in citas:
+        clave = (timezone.localtime(inicio).date(), estado)
+        por_dia_y_estado[clave] = por_dia_y_estado.get(clave, 0) + 1
+
+    resumenes = []
+    for fecha in fechas:
+        medianoche = inicio_del_dia(fecha)
+        manana = inicio_del_dia(fecha + timedelta(days=1))
+        jornada = fusionar_intervalos([(inicio, fin) for inicio, fin, _ in turnos_del_dia(plantilla, fecha)])
+        resumen = OcupacionDiaria(
+            kinesiologo_id=kinesiologo_id,
+            fecha=fecha,
+            minutos_jornada=_minutos(jornada),
+            minutos_agendados=_minutos(_recortar(agendados, medianoche, manana)),
+            # Solo cuenta lo bloqueado dentro de la jornada: fuera de ella no se pierde capacidad
+            minutos_bloqueados=sum(_minutos(_recortar(bloqueos, inicio, fin)) for inicio, fin in jornada),
+            minutos_disponibles=sum(_minutos(huecos_libres(ocupados, inicio, fin)) for inicio, fin in jornada),
+        )
+        for estado, campo in CONTADORES_ESTADO.items():
+            setattr(resumen, campo, por_dia_y_estado.get((fecha, estado), 0))
+        resumenes.append(resumen)
+    return resumenes
+
+
+def recalcular_dias(kinesiologo_id, fechas):
+    """Recalcula y guarda (insert o update en una sentencia por ventana) los días indicados."""
+    plantilla = obtener_plantilla(kinesiologo_id)
+    total = 0
+    for ventana in _ventanas(fechas):
+        try:
+            with transaction.atomic():
+                OcupacionDiaria.objects.bulk_create(
+                    calcular_dias(kinesiologo_id, ventana, plantilla),
+                    update_conflicts=True,
+                    unique_fields=['kinesiologo', 'fecha'],
+                    update_fields=CAMPOS_RESUMEN,
+                )
+        except IntegrityError:
+            # El kinesiólogo se eliminó (sus bloqueos se borran en cascada y avisan igual)
+            return total
+        total += len(ventana)
+    return total
+
+
+def programar_recalculo(kinesiologo_id, fechas):
+    """
+    Recalcula los días al confirmar la transacción en curso (de inmediato si
+    no hay una). Un error al recalcular se registra en el log sin afectar el
+    cambio que ya se confirmó; `reconstruir_ocupacion` lo corrige.
+    """
+    fechas = set(fechas)
+    if kinesiologo_id and fechas:
+        transaction.on_commit(lambda: recalcular_dias(kinesiologo_id, fechas), robust=True)
+
+
+def programar_recalculo_futuro(kinesiologo_id):
+    """
+    Tras cambiar la jornada o una regla de bloqueo: recalcula las filas ya
+    existentes desde hoy (los días pasados no cambian de jornada).
+    """
+    if not kinesiologo_id:
+        return
+
+    def recalcular():
+        fechas = OcupacionDiaria.objects.filter(
+            kinesiologo_id=kinesiologo_id, fecha__gte=timezone.localdate(),
+        ).values_list('fecha', flat=True)
+        recalcular_dias(kinesiologo_id, list(fechas))
+
+    transaction.on_commit(recalcular, robust=True)
+
+
+def reconstruir_ocupacion(kinesiologo_id, desde=None, hasta=None):
+    """
+    Recalcula todos los días del rango (por defecto, desde la primera hasta
+    la última cita o bloqueo del kinesiólogo). Sin rango explícito, borra
+    además las filas que quedaron fuera. Retorna la cantidad de días.
+    """
+    rango_completo = desde is None and hasta is None
+    if desde is None or hasta is None:
+        limites = [
+            modelo.objects.filter(kinesiologo_id=kinesiologo_id).aggregate(
+                primero=Min('fecha_hora_inicio'), ultimo=Max('fecha_hora_fin'),
+            )
+            for modelo in (Cita, BloqueoHorario)
+        ]
+        primeros = [timezone.localtime(limite['primero']).date() for limite in limites if limite['primero']]
+        ultimos = [timezone.localtime(limite['ultimo']).date() for limite in limites if limite['ultimo']]
+        desde = desde or (min(primeros) if primeros else None)
+        hasta = hasta or (max(ultimos) if ultimos else None)
+
+    if desde is None or hasta is None or hasta < desde:
+        if rango_completo:
+            OcupacionDiaria.objects.filter(kinesiologo_id=kinesiologo_id).delete()
+        return 0
+    if rango_completo:
+        OcupacionDiaria.objects.filter(kinesiologo_id=kinesiologo_id).exclude(fecha__range=(desde, hasta)).delete()
+    return recalcular_dias(kinesiologo_id, [desde + timedelta(days=dias) for dias in range((hasta - desde).days + 1)])
+
+
+# ----------------------------------------------------------------------
+# Reportes
+# ----------------------------------------------------------------------
+
+def completar_dias(desde, hasta, kinesiologo_id=None):
+    """
+    Calcula y guarda los días del rango que no tienen fila (de un
+    kinesiólogo o de todos). Las señales solo crean las filas de los días que
+    tocó algún cambio; sin las demás, el reporte no sumaría la jornada de los
+    días sin citas y sobrestimaría la ocupación. Retorna los días agregados.
+
+    Completa a lo más los últimos MAX_DIAS_REPORTE días del rango: los
+    anteriores quedan para `reconstruir_ocupacion`.
+    """
+    desde = max(desde, hasta - timedelta(days=MAX_DIAS_REPORTE - 1))
+    kinesiologos = [kinesiologo_id] if kinesiologo_id else list(Kinesiologo.objects.values_list('pk', flat=True))
+    existentes = OcupacionDiaria.objects.filter(fecha__range=(desde, hasta))
+    if kinesiologo_id:
+        existentes = existentes.filter(kinesiologo_id=kinesiologo_id)
+    existentes = set(existentes.values_list('kinesiologo_id', 'fecha'))
+
+    fechas = [desde + timedelta(days=dias) for dias in range((hasta - desde).days + 1)]
+    total = 0
+    for kine_id in kinesiologos:
+        faltantes = [fecha for fecha in fechas if (kine_id, fecha) not in existentes]
+        if faltantes:
+            total += recalcular_dias(kine_id, faltantes)
+    return total
+
+
+def resumen_ocupacion(desde, hasta, kinesiologo_id=None, agrupacion=AGRUPACION_SEMANA):
+    """
+    Totales por kinesiólogo y período (día o semana) entre `desde` y `hasta`,
+    sumados en la BD a partir de las filas precalculadas (completando antes
+    los días que falten).
+    """
+    completar_dias(desde, hasta, kinesiologo_id)
+    filas = OcupacionDiaria.objects.filter(fecha__range=(desde, hasta))
+    if kinesiologo_id:
+        filas = filas.filter(kinesiologo_id=kinesiologo_id)
+    periodo = TruncWeek('fecha') if agrupacion == AGRUPACION_SEMANA else F('fecha')
+
+    resumen = filas.annotate(
+        periodo=periodo,
+        nombre=F('kinesiologo__perfil__nombre'),
+        apellido=F('kinesiologo__perfil__apellido'),
+    ).values('periodo', 'kinesiologo_id', 'nombre', 'apellido').annotate(
+        **{campo: Sum(campo) for campo in CAMPOS_MINUTOS + tuple(CONTADORES_ESTADO.values())},
+    ).order_by('periodo', 'apellido', 'kinesiologo_id')
+
+    for fila in resumen:
+        jornada = fila['minutos_jornada']
+        fila['porcentaje_ocupacion'] = round(100 * (jornada - fila['minutos_disponibles']) / jornada) if jornada else 0
+        yield fila
@@ -0,0 +1,216 @@
+# citas/paginacion.py
+
+"""
+Paginación por cursor (keyset) para los listados de la aplicación.
+
+En vez de OFFSET, cada página se pide "después de" (o "antes de") la clave de
+orden de la última fila vista, p. ej. (fecha_hora_inicio, id) o (apellido, id).
+La BD salta directo a esa posición usando el índice, así el costo de una
+página es el mismo aunque se haya avanzado mucho en el historial.
+
+Los cursores viajan como tokens opacos y firmados (django.core.signing): el
+cliente no puede fabricarlos ni alterar sus valores. Con el encabezado
+X-Requested-With las vistas responden solo las filas ("cargar más").
+"""
+
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.shortcuts import render
+
+
+TAMANO_PAGINA = 20
+PARAMETRO_CURSOR = 'cursor'
+SALT_CURSOR = 'citas.paginacion.cursor'
+# Encabezado con la URL de la página siguiente en las respuestas de fragmento
+ENCABEZADO_SIGUIENTE = 'X-Pagina-Siguiente'
+# Encabezado con el id de la lista que pide filas, para páginas con más de un listado
+ENCABEZADO_DESTINO = 'X-Pagina-Destino'
+
+SIGUIENTE = 'sig'
+ANTERIOR = 'ant'
+
+
+def es_fragmento(request, destino=None):
+    """
+    Indica si la petición pide solo las filas de la página (botón "cargar más").
+    Con `destino` se exige además que las filas sean para esa lista.
+    """
+    if request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        return False
+    return destino is None or request.headers.get(ENCABEZADO_DESTINO) == destino
+
+
+class Pagina:
+    """Una página de resultados con los tokens para avanzar y retroceder."""
+
+    def __init__(self, items, siguiente=None, anterior=None, querydict=None, parametro=PARAMETRO_CURSOR):
+        self.items = items
+        self.siguiente = siguiente
+        self.anterior = anterior
+        self.querydict = querydict
+        self.parametro = parametro
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _url(self, token):
+        if token is None:
+            return None
+        parametros = self.querydict.copy()
+        parametros[self.parametro] = token
+        return '?' + parametros.urlencode()
+
+    @property
+    def url_siguiente(self):
+        return self._url(self.siguiente)
+
+    @property
+    def url_anterior(self):
+        return self._url(self.anterior)
+
+
+class PaginadorKeyset:
+    """
+    Pagina un queryset según `orden` (p. ej. ('fecha_hora_inicio', 'id') o
+    ('-fecha_creacion', '-pk')). El último campo debe ser único para que la
+    clave no se repita entre filas.
+
+    Uso en dos pasos, para poder incrustar la consulta en otra (subconsulta)
+    o evaluarla con el ORM asíncrono:
+
+        paginador = PaginadorKeyset(request, ('fecha_hora_inicio', 'id'))
+        pagina = paginador.pagina(list(paginador.consulta(queryset)))
+    """
+
+    def __init__(self, request, orden, tamano=TAMANO_PAGINA, parametro=PARAMETRO_CURSOR):
+        self.querydict = request.GET
+        self.token = request.GET.get(parametro)
+        self.orden = orden
+        self.tamano = tamano
+        self.parametro = parametro
+        self.modelo = None
+        self.campos = None
+        self.valores = None
+        self.direccion = SIGUIENTE
+
+    # --- Cursores --------------------------------------------------------
+
+    def _campo(self, ruta):
+        modelo = self.modelo
+        partes = ruta.split(LOOKUP_SEP)
+        for parte in partes[:-1]:
+            modelo = modelo._meta.get_field(parte).related_model
+        campo = modelo._meta.get_field(partes[-1])
+        return campo.target_field if campo.is_relation else campo
+
+    def _valor(self, objeto, ruta):
+        if isinstance(objeto, dict):
+            return objeto[ruta]
+        for parte in ruta.split(LOOKUP_SEP):
+            objeto = getattr(objeto, parte)
+        return objeto
+
+    def _crear_token(self, objeto, direccion):
+        valores = []
+        for campo, _ in self.campos:
+            valor = self._valor(objeto, campo)
+            valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else valor)
+        return signing.dumps({'v': valores, 'd': direccion}, salt=SALT_CURSOR, compress=True)
+
+    def _leer_token(self):
+        """Lee el cursor recibido; uno ausente o alterado vuelve a la primera página."""
+        if not self.token:
+            return
+        try:
+            datos = signing.loads(self.token, salt=SALT_CURSOR)
+            self.valores = [
+                self._campo(campo).to_python(valor)
+                for (campo, _), valor in zip(self.campos, datos['v'], strict=True)
+            ]
+            self.direccion = ANTERIOR if datos.get('d') == ANTERIOR else SIGUIENTE
+        except (signing.BadSignature, ValidationError, KeyError, TypeError, ValueError):
+            self.valores = None
+            self.direccion = SIGUIENTE
+
+    # --- Consulta --------------------------------------------------------
+
+    def _filtro(self):
+        """Filas estrictamente después (o antes) de la clave del cursor, según el orden."""
+        condiciones, iguales = [], Q()
+        for (campo, descendente), valor in zip(self.campos, self.valores):
+            operador = 'gt' if descendente == (self.direccion == ANTERIOR) else 'lt'
+            condiciones.append(iguales & Q(**{f"{campo}__{operador}": valor}))
+            iguales &= Q(**{campo: valor})
+        return reduce(or_, condiciones)
+
+    def _orden_consulta(self):
+        invertir = self.direccion == ANTERIOR
+        return [('-' if descendente != invertir else '') + campo for campo, descendente in self.campos]
+
+    def consulta(self, queryset):
+        """Retorna el queryset filtrado por el cursor, ordenado y limitado a tamano + 1 filas."""
+        self.modelo = queryset.model
+        # Lista de (campo, descendente); 'pk' se traduce a la columna de la clave primaria
+        self.campos = []
+        for campo in self.orden:
+            nombre = campo.lstrip('-')
+            self.campos.append((self.modelo._meta.pk.attname if nombre == 'pk' else nombre, campo.startswith('-')))
+        self._leer_token()
+        if self.valores is not None:
+            queryset = queryset.filter(self._filtro())
+        return queryset.order_by(*self._orden_consulta())[:self.tamano + 1]
+
+    def pagina(self, objetos):
+        """Arma la Pagina a partir de las filas obtenidas con `consulta`."""
+        objetos = list(objetos)
+        # Se ordena en el orden de la consulta por si las filas vinieron de otra consulta (subconsulta)
+        invertir = self.direccion == ANTERIOR
+        for campo, descendente in reversed(self.campos):
+            objetos.sort(key=lambda objeto: self._valor(objeto, campo), reverse=descendente != invertir)
+
+        hay_mas = len(objetos) > self.tamano
+        objetos = objetos[:self.tamano]
+        if invertir:
+            objetos.reverse()
+            hay_anterior, hay_siguiente = hay_mas, True
+        else:
+            hay_anterior, hay_siguiente = self.valores is not None, hay_mas
+
+        return Pagina(
+            objetos,
+            siguiente=self._crear_token(objetos[-1], SIGUIENTE) if objetos and hay_siguiente else None,
+            anterior=self._crear_token(objetos[0], ANTERIOR) if objetos and hay_anterior else None,
+            querydict=self.querydict,
+            parametro=self.parametro,
+        )
+
+
+def paginar(request, queryset, orden, tamano=TAMANO_PAGINA, parametro=PARAMETRO_CURSOR):
+    """Retorna la Pagina de `queryset` que corresponde al cursor de la petición."""
+    paginador = PaginadorKeyset(request, orden, tamano, parametro)
+    return paginador.pagina(paginador.consulta(queryset))
+
+
+async def apaginar(request, queryset, orden, tamano=TAMANO_PAGINA, parametro=PARAMETRO_CURSOR):
+    """Versión asíncrona de `paginar` (ORM asíncrono)."""
+    paginador = PaginadorKeyset(request, orden, tamano, parametro)
+    return paginador.pagina([objeto async for objeto in paginador.consulta(queryset)])
+
+
+def respuesta_fragmento(request, plantilla, context, pagina):
+    """Renderiza solo las filas e informa la URL de la página siguiente en un encabezado."""
+    respuesta = render(request, plantilla, context)
+    if pagina.url_siguiente:
+        respuesta[ENCABEZADO_SIGUIENTE] = pagina.url_siguiente
+    return respuesta
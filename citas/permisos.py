@@ -0,0 +1,66 @@
+# citas/permisos.py
+
+"""
+Permisos por objeto para las vistas de detalle de citas y notas clínicas.
+
+`con_permiso` carga el objeto con una sola consulta (con los select_related
+que necesite la vista) y decide el acceso comparando sus columnas
+paciente_id y kinesiologo_id con el actor de la petición, que ya viene de la
+sesión (usuarios/actor.py): no se recorre cita.paciente.perfil.user ni
+cita.kinesiologo.perfil.user. Si el objeto no existe responde 404; si
+existe y no es del usuario, 403.
+"""
+
+from functools import wraps
+
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404
+
+
+ACCESO_PACIENTE = 'paciente'
+ACCESO_KINESIOLOGO = 'kinesiologo'
+ACCESO_ADMINISTRADOR = 'administrador'
+
+
+def acceso_a(request, objeto, accesos, campo_paciente='paciente_id', campo_kinesiologo='kinesiologo_id'):
+    """Retorna por cuál de los `accesos` el usuario puede ver el objeto, o None."""
+    actor = request.actor
+    if ACCESO_PACIENTE in accesos and actor.paciente is not None \
+            and getattr(objeto, campo_paciente) == actor.paciente.pk:
+        return ACCESO_PACIENTE
+    if ACCESO_KINESIOLOGO in accesos and actor.es_kinesiologo and actor.kinesiologo is not None \
+            and getattr(objeto, campo_kinesiologo) == actor.kinesiologo.pk:
+        return ACCESO_KINESIOLOGO
+    if ACCESO_ADMINISTRADOR in accesos and request.user.is_superuser:
+        return ACCESO_ADMINISTRADOR
+    return None
+
+
+def obtener_con_permiso(request, queryset, accesos, **filtros):
+    """
+    Retorna el objeto de `queryset` que cumple `filtros` si el usuario tiene
+    alguno de los `accesos`; si no existe lanza Http404 y si no es suyo,
+    PermissionDenied. El acceso concedido queda en request.acceso.
+    """
+    objeto = get_object_or_404(queryset, **filtros)
+    request.acceso = acceso_a(request, objeto, accesos)
+    if request.acceso is None:
+        raise PermissionDenied("No tienes acceso a este registro.")
+    return objeto
+
+
+def con_permiso(queryset, accesos, parametro='pk', campo='pk'):
+    """
+    Decorador de vistas: reemplaza el argumento de la URL `parametro` por el
+    objeto autorizado, buscado por `campo`.
+
+        @con_permiso(Cita.objects.select_related('kinesiologo__perfil'), [ACCESO_PACIENTE])
+        def detalle_cita(request, cita): ...
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            objeto = obtener_con_permiso(request, queryset, accesos, **{campo: kwargs.pop(parametro)})
+            return vista(request, objeto, *args, **kwargs)
+        return envoltura
+    return decorador
@@ -0,0 +1,148 @@
+# citas/recordatorios.py
+
+"""
+Recordatorios por correo de las citas próximas (PENDIENTES o CONFIRMADAS).
+
+El despachador recorre la ventana [ahora, ahora + horas) por lotes en orden
+de (fecha_hora_inicio, id), sobre un índice parcial que solo contiene las
+citas activas sin recordatorio. Cada lote se reclama en una transacción que
+bloquea las filas aún sin tomar (recordatorio_enviado IS NULL), lee sus ids
+y las marca: si dos procesos corren a la vez, cada cita la toma uno solo y
+nunca se envía dos veces. Los correos del lote se renderizan con plantillas
+cargadas una vez y se envían por una única conexión del backend de correo,
+abierta para toda la ejecución. La memoria usada depende del tamaño del
+lote, no de la cantidad de recordatorios.
+
+Un correo que falla libera su cita para la próxima ejecución. Si el proceso
+se cae entre reclamar y enviar, esas citas quedan sin recordatorio: se
+prefiere no enviar antes que enviar dos veces.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Cita, CITA_PENDIENTE, CITA_CONFIRMADA
+from .transiciones import update_retornando_ids
+
+
+HORAS_ANTICIPACION = 24
+TAMANO_LOTE = 500
+ESTADOS_RECORDATORIO = (CITA_PENDIENTE, CITA_CONFIRMADA)
+
+PLANTILLA_ASUNTO = 'correo_recordatorio_asunto.txt'
+PLANTILLA_TEXTO = 'correo_recordatorio.txt'
+PLANTILLA_HTML = 'correo_recordatorio.html'
+
+
+def citas_por_recordar(desde, hasta):
+    """Citas activas sin recordatorio que comienzan en [desde, hasta) (usa el índice parcial)."""
+    return Cita.objects.filter(
+        recordatorio_enviado__isnull=True,
+        estado__in=ESTADOS_RECORDATORIO,
+        fecha_hora_inicio__gte=desde,
+        fecha_hora_inicio__lt=hasta,
+    )
+
+
+def reclamar(cita_ids, marca):
+    """
+    Marca como tomadas las citas que nadie ha tomado aún y retorna sus ids.
+    Las filas quedan bloqueadas entre la lectura y la marca: entre procesos
+    concurrentes, cada cita queda para uno solo.
+    """
+    return update_retornando_ids(
+        Cita.objects.filter(pk__in=cita_ids, recordatorio_enviado__isnull=True, estado__in=ESTADOS_RECORDATORIO),
+        recordatorio_enviado=marca,
+    )
+
+
+def liberar(cita_ids, marca):
+    """Devuelve a pendientes las citas tomadas con `marca` cuyo correo no salió."""
+    if cita_ids:
+        Cita.objects.filter(pk__in=cita_ids, recordatorio_enviado=marca).update(recordatorio_enviado=None)
+
+
+def _filas_reclamadas(cita_ids):
+    return Cita.objects.filter(pk__in=cita_ids).order_by('fecha_hora_inicio', 'pk').values(
+        'pk', 'fecha_hora_inicio', 'duracion_minutos', 'estado', 'motivo',
+        'paciente__nombre', 'paciente__apellido', 'paciente__perfil__user__email',
+        'kinesiologo__perfil__nombre', 'kinesiologo__perfil__apellido',
+    )
+
+
+def _mensaje(fila, plantillas):
+    contexto = {
+        'paciente': f"{fila['paciente__nombre']} {fila['paciente__apellido']}",
+        'kinesiologo': f"{fila['kinesiologo__perfil__nombre']} {fila['kinesiologo__perfil__apellido']}",
+        'inicio': timezone.localtime(fila['fecha_hora_inicio']),
+        'duracion': fila['duracion_minutos'],
+        'motivo': fila['motivo'],
+        'por_confirmar': fila['estado'] == CITA_PENDIENTE,
+    }
+    asunto = ' '.join(plantillas['asunto'].render(contexto).split())
+    mensaje = EmailMultiAlternatives(
+        asunto, plantillas['texto'].render(contexto), settings.DEFAULT_FROM_EMAIL,
+        [fila['paciente__perfil__user__email']],
+    )
+    mensaje.attach_alternative(plantillas['html'].render(contexto), 'text/html')
+    return mensaje
+
+
+def enviar_recordatorios(horas=HORAS_ANTICIPACION, tamano_lote=TAMANO_LOTE, ahora=None, conexion=None):
+    """
+    Envía los recordatorios de las citas que comienzan en las próximas
+    `horas`. Retorna un dict con los totales: enviados, sin_correo (citas
+    cuyo paciente no tiene correo; quedan marcadas) y fallidos (liberadas).
+    """
+    ahora = ahora or timezone.now()
+    hasta = ahora + timedelta(hours=horas)
+    plantillas = {
+        'asunto': get_template(PLANTILLA_ASUNTO),
+        'texto': get_template(PLANTILLA_TEXTO),
+        'html': get_template(PLANTILLA_HTML),
+    }
+    totales = {'enviados': 0, 'sin_correo': 0, 'fallidos': 0}
+
+    cursor = None
+    # Una sola conexión (p. ej. SMTP) para todos los lotes: se abre y se cierra una vez
+    with (conexion or get_connection()) as conexion:
+        while True:
+            candidatas = citas_por_recordar(ahora, hasta)
+            if cursor:
+                candidatas = candidatas.filter(
+                    Q(fecha_hora_inicio__gt=cursor[0]) | Q(fecha_hora_inicio=cursor[0], pk__gt=cursor[1])
+                )
+            lote = list(candidatas.order_by('fecha_hora_inicio', 'pk').values_list('fecha_hora_inicio', 'pk')[:tamano_lote])
+            if not lote:
+                break
+            cursor = lote[-1]
+
+            marca = timezone.now()
+            reclamadas = reclamar([pk for _, pk in lote], marca)
+            mensajes = []
+            for fila in _filas_reclamadas(reclamadas) if reclamadas else ():
+                if fila['paciente__perfil__user__email']:
+                    mensajes.append((fila['pk'], _mensaje(fila, plantillas)))
+                else:
+                    totales['sin_correo'] += 1
+
+            # Se envían de a uno por la misma conexión para saber exactamente cuáles salieron
+            fallidas = []
+            for cita_id, mensaje in mensajes:
+                try:
+                    conexion.send_messages([mensaje])
+                except Exception:
+                    # El servidor rechazó el correo o se cortó la conexión: se reintentará en otra ejecución
+                    fallidas.append(cita_id)
+            liberar(fallidas, marca)
+            totales['enviados'] += len(mensajes) - len(fallidas)
+            totales['fallidos'] += len(fallidas)
+
+            if len(lote) < tamano_lote:
+                break
+    return totales
@@ -0,0 +1,66 @@
+# citas/reservas.py
+
+"""
+Reserva de horarios sin condiciones de carrera.
+
+Al guardar una cita (Cita.save(): desde las vistas, el admin o al moverla)
+se inserta, en la misma transacción, una fila de OcupacionHorario por cada
+gránulo de 15 minutos que cubre. La restricción
+única (kinesiologo, granulo) convierte la verificación de traslape en un
+único INSERT: si otra cita ya ocupa algún gránulo, la BD lo rechaza y la
+transacción completa se revierte, sin la carrera de "leer y luego escribir".
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from .models import OcupacionHorario, CITA_CANCELADA
+from .mapa_disponibilidad import GRANULO
+
+
+MENSAJE_HORARIO_OCUPADO = "El horario seleccionado ya no está disponible. Por favor, elige otro."
+
+# Los gránulos se alinean contra una época fija en UTC, independiente de la zona horaria
+EPOCA = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def granulos_de_intervalo(inicio, fin):
+    """Retorna el inicio (UTC) de cada gránulo tocado por el intervalo [inicio, fin)."""
+    granulo = EPOCA + ((inicio - EPOCA) // GRANULO) * GRANULO
+    granulos = []
+    while granulo < fin:
+        granulos.append(granulo)
+        granulo += GRANULO
+    return granulos
+
+
+def ocupaciones_de_cita(cita):
+    return [
+        OcupacionHorario(kinesiologo_id=cita.kinesiologo_id, cita=cita, granulo=granulo)
+        for granulo in granulos_de_intervalo(cita.fecha_hora_inicio, cita.calcular_fecha_hora_fin())
+    ]
+
+
+def reservar_horario(cita, era_nueva):
+    """
+    Ocupa los gránulos de la cita (liberando antes los que tenía, si no es
+    nueva). Lo llama Cita.save() dentro de su transacción: si algún gránulo
+    ya está tomado, el INSERT lanza IntegrityError y se revierte todo.
+    """
+    if not era_nueva:
+        liberar_horario(cita)
+    if cita.estado != CITA_CANCELADA:
+        OcupacionHorario.objects.bulk_create(ocupaciones_de_cita(cita))
+
+
+def guardar_cita_con_reserva(cita):
+    """
+    Guarda la cita con sus gránulos (Cita.save() ya reserva el horario).
+    Lanza ValidationError si algún gránulo ya está tomado por otra cita.
+    """
+    cita.save()
+    return cita
+
+
+def liberar_horario(cita):
+    """Libera los gránulos de una cita (p. ej. al cancelarla)."""
+    OcupacionHorario.objects.filter(cita_id=cita.pk).delete()
@@ -0,0 +1,166 @@
+# citas/series.py
+
+"""
+Series de sesiones (planes de tratamiento de 10-20 citas).
+
+Se generan todas las ocurrencias de la recurrencia, se verifican en una sola
+pasada contra los intervalos ocupados del kinesiólogo (cuatro consultas para toda
+la serie) y luego se insertan con `bulk_create` en una única transacción,
+junto con sus gránulos de OcupacionHorario.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Cita, OcupacionHorario, CITA_PENDIENTE, CAMBIO_CITA
+from .disponibilidad import (
+    DURACION_CITA, inicio_del_dia, obtener_intervalos_ocupados,
+    fusionar_intervalos, horarios_por_turnos,
+)
+from .jornadas import obtener_plantilla, turnos_del_dia
+from .mapa_disponibilidad import invalidar_dias
+from .reservas import MENSAJE_HORARIO_OCUPADO, ocupaciones_de_cita
+from .cambios import registrar_cambios
+from .calendario import publicar_pacientes
+from .ocupacion_diaria import fechas_de_intervalo, programar_recalculo
+
+
+MAX_SESIONES_SERIE = 40
+# Días hacia adelante en que se buscan alternativas para una sesión en conflicto
+DIAS_BUSQUEDA_ALTERNATIVA = 14
+MAX_ALTERNATIVAS = 3
+
+
+def generar_ocurrencias(fecha_inicio, dias_semana, hora, cantidad=None, fecha_fin=None):
+    """
+    Retorna los inicios (aware) de la serie: cada día de `dias_semana`
+    (0 = lunes) a la `hora` indicada, desde `fecha_inicio` hasta completar
+    `cantidad` sesiones o llegar a `fecha_fin`.
+    """
+    dias_semana = set(dias_semana)
+    if not dias_semana or (not cantidad and not fecha_fin):
+        return []
+
+    limite = cantidad or MAX_SESIONES_SERIE
+    ocurrencias = []
+    fecha = fecha_inicio
+    while len(ocurrencias) < limite and (fecha_fin is None or fecha <= fecha_fin):
+        if fecha.weekday() in dias_semana:
+            ocurrencias.append(timezone.make_aware(datetime.combine(fecha, hora)))
+        fecha += timedelta(days=1)
+    return ocurrencias
+
+
+def _traslapa(ocupados, inicio, fin):
+    """Indica si [inicio, fin) toca algún intervalo de una lista fusionada y ordenada."""
+    indice = bisect_right(ocupados, inicio, key=lambda intervalo: intervalo[1])
+    return indice < len(ocupados) and ocupados[indice][0] < fin
+
+
+def verificar_serie(kinesiologo_id, ocurrencias, duracion=DURACION_CITA):
+    """
+    Verifica toda la serie en una pasada.
+    Retorna (disponibles, conflictos), donde `conflictos` es una lista de
+    diccionarios {'inicio': datetime, 'alternativas': [datetime, ...]}.
+    """
+    if not ocurrencias:
+        return [], []
+
+    largo = timedelta(minutes=duracion)
+    inicio_ventana = inicio_del_dia(timezone.localtime(ocurrencias[0]).date())
+    fin_ventana = ocurrencias[-1] + largo + timedelta(days=DIAS_BUSQUEDA_ALTERNATIVA + 1)
+    ocupados = obtener_intervalos_ocupados(kinesiologo_id, inicio_ventana, fin_ventana)
+
+    plantilla = obtener_plantilla(kinesiologo_id)
+
+    disponibles, conflictivas = [], []
+    for inicio in ocurrencias:
+        if not _dentro_de_turno(plantilla, inicio, inicio + largo) or _traslapa(ocupados, inicio, inicio + largo):
+            conflictivas.append(inicio)
+        else:
+            disponibles.append(inicio)
+
+    # Las sesiones aceptadas también ocupan tiempo al buscar alternativas
+    ocupados = fusionar_intervalos(ocupados + [(inicio, inicio + largo) for inicio in disponibles])
+
+    conflictos = []
+    for inicio in conflictivas:
+        alternativas = buscar_alternativas(ocupados, plantilla, inicio, duracion)
+        conflictos.append({'inicio': inicio, 'alternativas': alternativas})
+    return disponibles, conflictos
+
+
+def _dentro_de_turno(plantilla, inicio, fin):
+    """Indica si [inicio, fin) cae completo dentro de algún turno de atención del día."""
+    fecha = timezone.localtime(inicio).date()
+    return any(
+        turno_inicio <= inicio and fin <= turno_fin
+        for turno_inicio, turno_fin, _ in turnos_del_dia(plantilla, fecha)
+    )
+
+
+def buscar_alternativas(ocupados, plantilla, inicio, duracion=DURACION_CITA):
+    """
+    Propone horarios libres cercanos a una sesión en conflicto: primero otro
+    horario el mismo día y luego la misma hora en los días siguientes.
+    """
+    largo = timedelta(minutes=duracion)
+    fecha = timezone.localtime(inicio).date()
+    alternativas = []
+
+    mismo_dia = horarios_por_turnos(ocupados, turnos_del_dia(plantilla, fecha))
+    if mismo_dia:
+        alternativas.append(min(mismo_dia, key=lambda hora: abs(hora - inicio)))
+
+    for dias in range(1, DIAS_BUSQUEDA_ALTERNATIVA + 1):
+        if len(alternativas) >= MAX_ALTERNATIVAS:
+            break
+        candidato = inicio + timedelta(days=dias)
+        fin_candidato = candidato + largo
+        if _dentro_de_turno(plantilla, candidato, fin_candidato) and not _traslapa(ocupados, candidato, fin_candidato):
+            alternativas.append(candidato)
+    return alternativas
+
+
+def crear_serie(kinesiologo, paciente, ocurrencias, duracion=DURACION_CITA, motivo=None):
+    """
+    Inserta toda la serie con `bulk_create` en una sola transacción, junto con
+    sus gránulos de ocupación. Si alguna sesión fue tomada entre la verificación
+    y la inserción, se revierte todo y se lanza ValidationError.
+    """
+    citas = []
+    for inicio in ocurrencias:
+        cita = Cita(
+            kinesiologo=kinesiologo,
+            paciente=paciente,
+            fecha_hora_inicio=inicio,
+            duracion_minutos=duracion,
+            motivo=motivo,
+            estado=CITA_PENDIENTE,
+        )
+        # bulk_create no llama a save(): la hora de fin se calcula aquí
+        cita.fecha_hora_fin = cita.calcular_fecha_hora_fin()
+        citas.append(cita)
+
+    try:
+        with transaction.atomic():
+            Cita.objects.bulk_create(citas)
+            OcupacionHorario.objects.bulk_create(
+                [ocupacion for cita in citas for ocupacion in ocupaciones_de_cita(cita)]
+            )
+            # bulk_create tampoco dispara señales: se registra el cambio y se invalida la caché al confirmar
+            registrar_cambios(kinesiologo.pk, CAMBIO_CITA, [cita.pk for cita in citas])
+            publicar_pacientes([paciente.pk])
+            programar_recalculo(kinesiologo.pk, [
+                fecha for cita in citas for fecha in fechas_de_intervalo(cita.fecha_hora_inicio, cita.fecha_hora_fin)
+            ])
+            transaction.on_commit(lambda: [
+                invalidar_dias(kinesiologo.pk, cita.fecha_hora_inicio, cita.fecha_hora_fin) for cita in citas
+            ])
+    except IntegrityError:
+        raise ValidationError(MENSAJE_HORARIO_OCUPADO)
+    return citas
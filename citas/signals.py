@@ -0,0 +1,105 @@
+# citas/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Cita, BloqueoHorario, ReglaBloqueo, HorarioAtencion, HorarioEspecial, OfertaCupo,
+    CAMBIO_CITA, CAMBIO_BLOQUEO,
+)
+from .mapa_disponibilidad import invalidar_dias, invalidar_kinesiologo
+from .jornadas import invalidar_plantilla
+from .cambios import publicar, registrar_cambios
+from .calendario import publicar_pacientes
+from .ocupacion_diaria import fechas_de_intervalo, programar_recalculo, programar_recalculo_futuro
+
+
+# ----------------------------------------------------------------------
+# Invalidación de la caché de disponibilidad diaria
+# ----------------------------------------------------------------------
+
+@receiver(post_init, sender=Cita)
+@receiver(post_init, sender=BloqueoHorario)
+def recordar_intervalo_original(sender, instance, **kwargs):
+    """Guarda el intervalo con que se cargó la instancia para invalidar también los días antiguos si se mueve."""
+    # Se lee desde __dict__ para no disparar consultas sobre campos diferidos (.only/.defer)
+    datos = vars(instance)
+    instance._intervalo_original = (datos.get('kinesiologo_id'), datos.get('fecha_hora_inicio'), datos.get('fecha_hora_fin'))
+
+
+@receiver(post_save, sender=Cita)
+@receiver(post_save, sender=BloqueoHorario)
+@receiver(post_delete, sender=Cita)
+@receiver(post_delete, sender=BloqueoHorario)
+def invalidar_mapa_disponibilidad(sender, instance, **kwargs):
+    """
+    Invalida solo los días afectados por el cambio (antes y después de guardar)
+    y lo registra en el feed de cambios de la agenda.
+
+    Los mapas se borran al confirmar la transacción: antes, otra petición
+    podría reconstruir el mapa con los datos aún sin confirmar a la vista
+    (los anteriores) y dejarlo en la caché durante TIMEOUT_MAPA.
+    """
+    original = getattr(instance, '_intervalo_original', None)
+    actual = (instance.kinesiologo_id, instance.fecha_hora_inicio, instance.fecha_hora_fin)
+
+    def invalidar():
+        invalidar_dias(*actual)
+        if original and original != actual:
+            invalidar_dias(*original)
+    transaction.on_commit(invalidar)
+
+    # Feed en vivo del dashboard: se avisa también al kinesiólogo anterior si la cita cambió de agenda
+    tipo = CAMBIO_CITA if sender is Cita else CAMBIO_BLOQUEO
+    registrar_cambios(instance.kinesiologo_id, tipo, [instance.pk])
+    if original and original[0] != instance.kinesiologo_id:
+        registrar_cambios(original[0], tipo, [instance.pk])
+    # Calendario .ics del paciente (el del kinesiólogo usa la versión del feed en vivo)
+    if sender is Cita:
+        publicar_pacientes([instance.paciente_id])
+
+    # Resumen de ocupación diaria: solo los días tocados, antes y después del cambio
+    programar_recalculo(instance.kinesiologo_id, fechas_de_intervalo(*actual[1:]))
+    if original and original != actual:
+        programar_recalculo(original[0], fechas_de_intervalo(*original[1:]))
+
+    instance._intervalo_original = actual
+
+
+@receiver(post_save, sender=ReglaBloqueo)
+@receiver(post_delete, sender=ReglaBloqueo)
+def invalidar_mapa_regla_bloqueo(sender, instance, **kwargs):
+    """
+    Una regla recurrente puede tocar cualquier día: se invalida toda la caché
+    del kinesiólogo y cambia la versión de su agenda (el feed .ics la incluye).
+    """
+    kinesiologo_id = instance.kinesiologo_id
+    transaction.on_commit(lambda: invalidar_kinesiologo(kinesiologo_id))
+    transaction.on_commit(lambda: publicar(kinesiologo_id))
+    programar_recalculo_futuro(instance.kinesiologo_id)
+
+
+@receiver(post_save, sender=OfertaCupo)
+@receiver(post_delete, sender=OfertaCupo)
+def invalidar_mapa_oferta_cupo(sender, instance, **kwargs):
+    """Un cupo ofrecido a la lista de espera queda retenido (o se libera) en el mapa del día."""
+    intervalo = (instance.kinesiologo_id, instance.fecha_hora_inicio, instance.fecha_hora_fin)
+    transaction.on_commit(lambda: invalidar_dias(*intervalo))
+
+
+# ----------------------------------------------------------------------
+# Invalidación de la plantilla semanal de horarios
+# ----------------------------------------------------------------------
+
+@receiver(post_save, sender=HorarioAtencion)
+@receiver(post_delete, sender=HorarioAtencion)
+@receiver(post_save, sender=HorarioEspecial)
+@receiver(post_delete, sender=HorarioEspecial)
+def invalidar_plantilla_horarios(sender, instance, **kwargs):
+    """Cualquier cambio de turnos o excepciones obliga a recompilar la plantilla del kinesiólogo."""
+    # Tras confirmar: antes, otra petición podría recompilarla con los turnos anteriores
+    kinesiologo_id = instance.kinesiologo_id
+    transaction.on_commit(lambda: invalidar_plantilla(kinesiologo_id))
+    # La jornada cambió: también los minutos de jornada y disponibles de los días que vienen
+    programar_recalculo_futuro(instance.kinesiologo_id)
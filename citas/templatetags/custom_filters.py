@@ -9,4 +9,12 @@ register = template.Library()
 @register.filter
 def default_if_none(value, default_value="N/A"):
     """Devuelve el valor si no es None, de lo contrario devuelve el valor predeterminado."""
-    return value if value is not None else default_value
\ No newline at end of file
+    return value if value is not None else default_value
+
+@register.filter
+def horas(minutos):
+    """Minutos como horas y minutos, p. ej. 90 -> '1:30'."""
+    if minutos is None:
+        return ''
+    horas_enteras, resto = divmod(int(minutos), 60)
+    return f"{horas_enteras}:{resto:02d}"
@@ -1,3 +1,1335 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from importlib import import_module
+from unittest import mock
+from datetime import datetime, time as hora, timedelta, timezone as dt_timezone
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core import mail, signing
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F, Min
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from usuarios.models import Perfil, Kinesiologo, Paciente, KINESIOLOGO
+from usuarios.rut import digito_verificador
+from evaluaciones.models import NotaClinica
+from .models import Cita, BloqueoHorario, ReglaBloqueo, HorarioAtencion, HorarioEspecial, EsperaCupo, IndiceEspera, OfertaCupo, OFERTA_PENDIENTE, OFERTA_EXPIRADA, CambioAgenda, OcupacionHorario, OcupacionDiaria, CITA_PENDIENTE, CITA_CONFIRMADA, CITA_CANCELADA, CITA_FINALIZADA
+from .calendario import CALENDARIO_KINESIOLOGO, CALENDARIO_PACIENTE, SALT_TOKEN, clave_generacion, crear_token, version_agenda
+from .paginacion import TAMANO_PAGINA
+from .disponibilidad import fusionar_intervalos, huecos_libres, horarios_disponibles, inicio_del_dia, obtener_intervalos_ocupados
+from .lista_espera import aceptar_oferta, candidatos_para, expirar_ofertas, indexar_espera, ofrecer_cupo_de_cita, rechazar_oferta
+from .jornadas import PLANTILLA_POR_DEFECTO, TIMEOUT_PLANTILLA, clave_plantilla, duracion_para, obtener_plantilla, turnos_del_dia
+from .mapa_disponibilidad import TIMEOUT_MAPA, VIGENCIA_VERSION as VIGENCIA_VERSION_MAPA, clave_mapa, construir_mapa, esta_libre, mascara_intervalo, version_kinesiologo
+from .reservas import MENSAJE_HORARIO_OCUPADO, guardar_cita_con_reserva
+from .series import crear_serie, generar_ocurrencias, verificar_serie
+from .cambios import RECONEXION_MS, RECONEXION_WSGI_MS, VIGENCIA_VERSION, ultimo_cambio
+from .ocupacion_diaria import AGRUPACION_DIA, MAX_DIAS_REPORTE, completar_dias, resumen_ocupacion
+from .importacion import ImportadorCitas, ruta_punto_control
+from .transiciones import cambiar_estado_citas, update_retornando_ids
+from .recordatorios import enviar_recordatorios, reclamar
+from .views import MAX_DIAS_RANGO_HORARIOS
+
+
+def crear_kinesiologo(username='kine', licencia='LIC-1'):
+    user = User.objects.create_user(username=username)
+    perfil = Perfil.objects.create(user=user, nombre='Kine', apellido='Prueba', rol=KINESIOLOGO)
+    return Kinesiologo.objects.create(perfil=perfil, especialidad='Traumatología', licencia=licencia)
+
+
+def crear_paciente(rut):
+    user = User.objects.create_user(username=rut)
+    perfil = Perfil.objects.create(user=user, nombre='Paciente', apellido=rut)
+    return Paciente.objects.create(perfil=perfil, rut=rut, telefono='912345678', nombre='Paciente', apellido=rut)
+
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    """Varios procesos agendando los mismos horarios no deben producir citas traslapadas."""
+
+    TRABAJADORES = 8
+    INTENTOS_POR_TRABAJADOR = 12
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.pacientes = [crear_paciente(f'1000000{i}-{i}') for i in range(self.TRABAJADORES)]
+        self.inicio = timezone.make_aware(datetime(2030, 3, 4, 9, 0))
+
+    def _agendar(self, indice, resultados):
+        paciente = self.pacientes[indice]
+        exitos = conflictos = 0
+        try:
+            for intento in range(self.INTENTOS_POR_TRABAJADOR):
+                # Horarios cada 30 minutos con citas de 60: se traslapan parcialmente entre sí
+                inicio = self.inicio + timedelta(minutes=30 * ((indice + intento) % self.INTENTOS_POR_TRABAJADOR))
+                while True:
+                    cita = Cita(kinesiologo=self.kine, paciente=paciente, fecha_hora_inicio=inicio, duracion_minutos=60)
+                    try:
+                        guardar_cita_con_reserva(cita)
+                        exitos += 1
+                    except ValidationError:
+                        conflictos += 1
+                    except OperationalError:
+                        # SQLite bloquea la tabla ante escrituras simultáneas: se reintenta
+                        time.sleep(0.005)
+                        continue
+                    break
+        finally:
+            connection.close()
+        resultados[indice] = (exitos, conflictos)
+
+    def test_reservas_concurrentes_no_se_traslapan(self):
+        resultados = {}
+        hilos = [threading.Thread(target=self._agendar, args=(i, resultados)) for i in range(self.TRABAJADORES)]
+
+        comienzo = time.monotonic()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=60)
+        duracion = time.monotonic() - comienzo
+
+        self.assertFalse(any(hilo.is_alive() for hilo in hilos))
+        self.assertEqual(len(resultados), self.TRABAJADORES)
+
+        # Cada intento terminó en éxito o en conflicto, sin quedar colgado
+        total = sum(exitos + conflictos for exitos, conflictos in resultados.values())
+        self.assertEqual(total, self.TRABAJADORES * self.INTENTOS_POR_TRABAJADOR)
+        self.assertLess(duracion, 30)
+
+        citas = list(Cita.objects.filter(kinesiologo=self.kine).exclude(estado=CITA_CANCELADA).order_by('fecha_hora_inicio'))
+        self.assertEqual(len(citas), sum(exitos for exitos, _ in resultados.values()))
+        self.assertGreater(len(citas), 0)
+        for anterior, siguiente in zip(citas, citas[1:]):
+            self.assertLessEqual(anterior.fecha_hora_fin, siguiente.fecha_hora_inicio)
+
+        # Cada cita ocupa exactamente sus 4 gránulos de 15 minutos
+        self.assertEqual(OcupacionHorario.objects.filter(kinesiologo=self.kine).count(), 4 * len(citas))
+
+    def test_cancelar_libera_el_horario(self):
+        cita = guardar_cita_con_reserva(
+            Cita(kinesiologo=self.kine, paciente=self.pacientes[0], fecha_hora_inicio=self.inicio)
+        )
+        with self.assertRaises(ValidationError):
+            guardar_cita_con_reserva(
+                Cita(kinesiologo=self.kine, paciente=self.pacientes[1], fecha_hora_inicio=self.inicio + timedelta(minutes=30))
+            )
+
+        cita.estado = CITA_CANCELADA
+        cita.save()
+
+        # El mismo inicio queda libre (la restricción única solo cuenta las citas activas)
+        otra = guardar_cita_con_reserva(
+            Cita(kinesiologo=self.kine, paciente=self.pacientes[1], fecha_hora_inicio=self.inicio)
+        )
+        self.assertIsNotNone(otra.pk)
+        self.assertEqual(set(OcupacionHorario.objects.filter(kinesiologo=self.kine).values_list('cita_id', flat=True)), {otra.pk})
+
+
+class DashboardConsultasTests(TestCase):
+    """El dashboard del Kinesiólogo usa un número fijo de consultas, sin importar cuántas citas tenga."""
+
+    # Sesión, usuario, citas, conteos, bloqueos, reglas y cursor del feed (el
+    # kinesiólogo viene del actor guardado en la sesión)
+    CONSULTAS_DASHBOARD = 7
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.client.force_login(self.kine.perfil.user)
+        self.pacientes = [crear_paciente(f'2000000{i}-{i}') for i in range(3)]
+        self.manana = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+        self.url = reverse('citas:kinesiologo_dashboard')
+
+    def crear_citas(self, cantidad, estado, desfase_dias=0):
+        citas = []
+        for i in range(cantidad):
+            cita = Cita(
+                kinesiologo=self.kine,
+                paciente=self.pacientes[i % len(self.pacientes)],
+                fecha_hora_inicio=self.manana + timedelta(days=desfase_dias, hours=i),
+                estado=estado,
+            )
+            cita.fecha_hora_fin = cita.calcular_fecha_hora_fin()
+            citas.append(cita)
+        return Cita.objects.bulk_create(citas)
+
+    def crear_finalizadas(self, cantidad):
+        citas = self.crear_citas(cantidad, CITA_FINALIZADA, desfase_dias=-30)
+        NotaClinica.objects.bulk_create([
+            NotaClinica(
+                cita=cita, kinesiologo=self.kine, paciente=cita.paciente,
+                diagnostico_subjetivo='S', diagnostico_objetivo='O', analisis_y_plan='A/P',
+            )
+            for cita in citas
+        ])
+
+    def cargar_dashboard(self):
+        # La primera carga deja en caché la plantilla y el mapa del día
+        self.client.get(self.url)
+        with self.assertNumQueries(self.CONSULTAS_DASHBOARD):
+            respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_consultas_fijas_con_pocas_citas(self):
+        self.crear_citas(2, CITA_PENDIENTE)
+        self.crear_finalizadas(1)
+        self.cargar_dashboard()
+
+    def test_consultas_fijas_con_muchas_citas(self):
+        self.crear_citas(40, CITA_PENDIENTE)
+        self.crear_citas(30, CITA_CONFIRMADA, desfase_dias=5)
+        self.crear_citas(5, CITA_CANCELADA, desfase_dias=10)
+        self.crear_finalizadas(25)
+        respuesta = self.cargar_dashboard()
+
+        self.assertEqual(respuesta.context['resumen'], {
+            'pendientes': 40, 'confirmadas': 30, 'canceladas': 5, 'finalizadas': 25,
+        })
+        # Las próximas llegan por páginas, con el cursor de la siguiente
+        citas_proximas = respuesta.context['citas_proximas']
+        self.assertEqual(len(citas_proximas), TAMANO_PAGINA)
+        self.assertIsNotNone(citas_proximas.siguiente)
+        self.assertIsNone(citas_proximas.anterior)
+        finalizadas = respuesta.context['citas_finalizadas']
+        self.assertEqual(len(finalizadas), 10)
+        # Las más recientes primero
+        self.assertGreater(finalizadas[0].fecha_hora_inicio, finalizadas[-1].fecha_hora_inicio)
+
+
+    # --- Paginación por cursor de las citas próximas ---
+
+    def test_recorre_todas_las_paginas_con_consultas_fijas(self):
+        creadas = self.crear_citas(45, CITA_PENDIENTE)
+        self.client.get(self.url)
+
+        vistas, url = [], self.url
+        while url:
+            with self.assertNumQueries(self.CONSULTAS_DASHBOARD):
+                respuesta = self.client.get(url)
+            pagina = respuesta.context['citas_proximas']
+            vistas.extend(cita.pk for cita in pagina)
+            url = self.url + pagina.url_siguiente if pagina.siguiente else None
+        self.assertEqual(vistas, [cita.pk for cita in creadas])
+
+        # Desde la última página se vuelve a la anterior con el cursor opuesto
+        respuesta = self.client.get(self.url + pagina.url_anterior)
+        self.assertEqual([cita.pk for cita in respuesta.context['citas_proximas']], vistas[20:40])
+
+    def test_fragmento_cargar_mas(self):
+        self.crear_citas(25, CITA_PENDIENTE)
+        pagina = self.client.get(self.url).context['citas_proximas']
+
+        respuesta = self.client.get(
+            self.url + pagina.url_siguiente,
+            headers={'X-Requested-With': 'XMLHttpRequest', 'X-Pagina-Destino': 'lista-citas'},
+        )
+        self.assertTemplateUsed(respuesta, 'kine_dash_filas_citas.html')
+        self.assertTemplateNotUsed(respuesta, 'kine_dash.html')
+        self.assertEqual(len(respuesta.context['citas_proximas']), 5)
+        self.assertNotIn('X-Pagina-Siguiente', respuesta.headers)
+
+    def test_cursor_alterado_vuelve_a_la_primera_pagina(self):
+        self.crear_citas(25, CITA_PENDIENTE)
+        primera = self.client.get(self.url).context['citas_proximas']
+
+        respuesta = self.client.get(self.url, {'cursor': primera.siguiente[:-2] + 'xx'})
+        self.assertEqual(
+            [cita.pk for cita in respuesta.context['citas_proximas']],
+            [cita.pk for cita in primera],
+        )
+
+
+class CambioEstadoLoteTests(TestCase):
+    """Confirmar o cancelar varias citas desde el dashboard es un solo UPDATE condicional."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.otro_kine = crear_kinesiologo('otro', 'LIC-2')
+        self.client.force_login(self.kine.perfil.user)
+        self.paciente = crear_paciente('11111111-1')
+        self.manana = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+        self.url = reverse('citas:kinesiologo_dashboard')
+        self.citas = [
+            guardar_cita_con_reserva(Cita(
+                kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.manana + timedelta(hours=8 + i),
+            ))
+            for i in range(3)
+        ]
+        self.ajena = guardar_cita_con_reserva(Cita(
+            kinesiologo=self.otro_kine, paciente=self.paciente, fecha_hora_inicio=self.manana + timedelta(hours=8),
+        ))
+
+    def enviar(self, accion, valores):
+        return self.client.post(
+            self.url, {'accion': accion, 'citas': valores}, headers={'X-Requested-With': 'XMLHttpRequest'}
+        ).json()
+
+    def test_confirmar_lote_con_un_update_y_concurrencia_optimista(self):
+        # La tercera cita fue confirmada por otra pestaña después de que se marcó como PENDIENTE
+        Cita.objects.filter(pk=self.citas[2].pk).update(estado=CITA_CONFIRMADA)
+        valores = [f'{cita.pk}:{CITA_PENDIENTE}' for cita in self.citas + [self.ajena]]
+        ultimo_cambio = CambioAgenda.objects.order_by('-id').values_list('id', flat=True).first()
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = self.enviar('confirmar_lote', valores)
+        updates = [consulta['sql'] for consulta in consultas if consulta['sql'].startswith('UPDATE "citas_cita"')]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(resultado['cambiadas'], [self.citas[0].pk, self.citas[1].pk])
+        self.assertEqual(resultado['omitidas'], [self.citas[2].pk, self.ajena.pk])
+        self.assertEqual(Cita.objects.get(pk=self.ajena.pk).estado, CITA_PENDIENTE)
+        self.assertEqual(
+            set(CambioAgenda.objects.filter(kinesiologo=self.kine, pk__gt=ultimo_cambio).values_list('objeto_id', flat=True)),
+            {self.citas[0].pk, self.citas[1].pk},
+        )
+
+    def test_cancelar_lote_libera_los_horarios(self):
+        resultado = self.enviar('cancelar_lote', [f'{cita.pk}:{CITA_PENDIENTE}' for cita in self.citas[:2]])
+
+        self.assertEqual(resultado['cambiadas'], [self.citas[0].pk, self.citas[1].pk])
+        self.assertFalse(OcupacionHorario.objects.filter(cita__in=self.citas[:2]).exists())
+        self.assertTrue(OcupacionHorario.objects.filter(cita=self.citas[2]).exists())
+        # El horario liberado se puede volver a agendar
+        otra = guardar_cita_con_reserva(
+            Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.citas[0].fecha_hora_inicio)
+        )
+        self.assertIsNotNone(otra.pk)
+
+    def test_update_retornando_ids_bloquea_lee_y_actualiza(self):
+        otro_paciente = crear_paciente('22222222-2')
+        Cita.objects.filter(pk=self.citas[1].pk).update(paciente=otro_paciente)
+        with CaptureQueriesContext(connection) as consultas:
+            ids = update_retornando_ids(Cita.objects.filter(paciente__rut='22222222-2'), motivo='Con join')
+        self.assertEqual(ids, [self.citas[1].pk])
+        self.assertEqual(list(Cita.objects.filter(motivo='Con join').values_list('pk', flat=True)), [self.citas[1].pk])
+        # Un SELECT de los ids y un UPDATE por esos ids, en una transacción
+        sentencias = [consulta['sql'].split()[0] for consulta in consultas]
+        self.assertEqual([sentencia for sentencia in sentencias if sentencia in ('SELECT', 'UPDATE')], ['SELECT', 'UPDATE'])
+
+        ids = update_retornando_ids(Cita.objects.filter(kinesiologo=self.kine, motivo__isnull=True), motivo='Resto')
+        self.assertEqual(sorted(ids), sorted(cita.pk for cita in self.citas if cita.pk != self.citas[1].pk))
+        self.assertEqual(update_retornando_ids(Cita.objects.filter(motivo='No existe'), motivo='X'), [])
+
+class CalendarioIcsTests(TestCase):
+    """El feed .ics se transmite por bloques y responde 304 sin consultas si la agenda no cambió."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.manana = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+        self.url_kine = reverse('citas:calendario_ics', args=[crear_token(CALENDARIO_KINESIOLOGO, self.kine.pk)])
+        self.url_paciente = reverse('citas:calendario_ics', args=[crear_token(CALENDARIO_PACIENTE, self.paciente.pk)])
+
+    def agendar(self, horas):
+        with self.captureOnCommitCallbacks(execute=True):
+            return guardar_cita_con_reserva(Cita(
+                kinesiologo=self.kine, paciente=self.paciente,
+                fecha_hora_inicio=self.manana + timedelta(hours=horas), motivo='Lumbago; control, semana 2',
+            ))
+
+    def test_feed_y_revalidacion(self):
+        cita = self.agendar(9)
+        respuesta = self.client.get(self.url_kine)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        contenido = b''.join(respuesta.streaming_content).decode()
+        self.assertTrue(contenido.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn(f'UID:cita-{cita.pk}@', contenido)
+        self.assertIn(r'DESCRIPTION:Lumbago\; control\, semana 2', contenido)
+        self.assertTrue(contenido.endswith('END:VCALENDAR\r\n'))
+
+        etag = respuesta['ETag']
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(self.url_kine, headers={'If-None-Match': etag})
+        self.assertEqual(respuesta.status_code, 304)
+
+        # Un cambio en la agenda cambia la versión de ambos calendarios
+        etag_paciente = self.client.get(self.url_paciente)['ETag']
+        self.agendar(11)
+        self.assertEqual(self.client.get(self.url_kine, headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.client.get(self.url_paciente, headers={'If-None-Match': etag_paciente}).status_code, 200)
+
+    def test_feed_incluye_ocurrencias_de_reglas_de_bloqueo(self):
+        etag = self.client.get(self.url_kine)['ETag']
+        manana = self.manana.date()
+        with self.captureOnCommitCallbacks(execute=True):
+            regla = ReglaBloqueo.objects.create(
+                kinesiologo=self.kine, dias_semana='0,1,2,3,4,5,6', hora_inicio=hora(13), hora_fin=hora(14),
+                vigente_desde=manana, vigente_hasta=manana + timedelta(days=2),
+                excepciones=[(manana + timedelta(days=1)).isoformat()], motivo='Colación',
+            )
+        # Guardar la regla cambia la versión de la agenda: el feed no responde 304
+        respuesta = self.client.get(self.url_kine, headers={'If-None-Match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        contenido = b''.join(respuesta.streaming_content).decode()
+
+        uids = [linea for linea in contenido.split('\r\n') if linea.startswith(f'UID:regla-{regla.pk}-')]
+        self.assertEqual(uids, [
+            f'UID:regla-{regla.pk}-{fecha:%Y%m%d}@kinegestion' for fecha in (manana, manana + timedelta(days=2))
+        ])
+        self.assertIn(f'DTSTART:{(self.manana + timedelta(hours=13)).astimezone(dt_timezone.utc):%Y%m%dT%H%M%SZ}', contenido)
+        self.assertIn('SUMMARY:Bloqueado: Colación', contenido)
+        # El feed del paciente no muestra los bloqueos del kinesiólogo
+        self.assertNotIn('UID:regla-', b''.join(self.client.get(self.url_paciente).streaming_content).decode())
+
+    def test_token_invalido(self):
+        self.assertEqual(self.client.get(self.url_kine.replace('.ics', 'x.ics')).status_code, 404)
+
+    def test_regenerar_enlace_revoca_el_anterior(self):
+        self.assertEqual(self.client.get(self.url_paciente).status_code, 200)
+        # Los tokens anteriores a las generaciones valen como la generación 0
+        antiguo = signing.dumps([CALENDARIO_PACIENTE, self.paciente.pk], salt=SALT_TOKEN, compress=True)
+        self.assertEqual(self.client.get(reverse('citas:calendario_ics', args=[antiguo])).status_code, 200)
+
+        self.client.force_login(self.paciente.perfil.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse('citas:regenerar_calendario'))
+        self.assertRedirects(respuesta, reverse('citas:agenda'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(self.url_paciente).status_code, 404)
+        self.assertEqual(self.client.get(reverse('citas:calendario_ics', args=[antiguo])).status_code, 404)
+
+        # La agenda muestra el enlace nuevo, que sí funciona
+        url_nueva = reverse('citas:calendario_ics', args=[crear_token(CALENDARIO_PACIENTE, self.paciente.pk)])
+        self.assertContains(self.client.get(reverse('citas:agenda')), url_nueva)
+        self.assertEqual(self.client.get(url_nueva).status_code, 200)
+        # El calendario del kinesiólogo no se ve afectado
+        self.assertEqual(self.client.get(self.url_kine).status_code, 200)
+
+        # Otro proceso con la generación antigua en su caché la vuelve a leer de la BD al expirar
+        cache.delete(clave_generacion(CALENDARIO_PACIENTE, self.paciente.pk))
+        self.assertEqual(self.client.get(self.url_paciente).status_code, 404)
+
+    def test_version_de_agenda_expira(self):
+        with mock.patch('citas.calendario.cache') as cache_simulada:
+            cache_simulada.get.return_value = None
+            version_agenda(CALENDARIO_PACIENTE, self.paciente.pk)
+        self.assertEqual(cache_simulada.add.call_args.args[2], VIGENCIA_VERSION)
+
+
+class ExportacionesTests(TestCase):
+    """Las exportaciones se transmiten por bloques y un Kinesiólogo solo exporta su agenda."""
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.otro_kine = crear_kinesiologo('otro', 'LIC-2')
+        self.paciente = crear_paciente('11111111-1')
+        manana = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time()))
+        citas = []
+        for i, kine in enumerate([self.kine] * 3 + [self.otro_kine]):
+            cita = Cita(kinesiologo=kine, paciente=self.paciente, fecha_hora_inicio=manana + timedelta(hours=i), motivo='Dolor, "agudo"')
+            cita.fecha_hora_fin = cita.calcular_fecha_hora_fin()
+            citas.append(cita)
+        Cita.objects.bulk_create(citas)
+        self.client.force_login(self.kine.perfil.user)
+
+    def descargar(self, tipo, formato, **filtros):
+        respuesta = self.client.get(reverse('citas:exportar_datos', args=[tipo, formato]), filtros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return b''.join(respuesta.streaming_content)
+
+    def test_csv_solo_con_la_agenda_propia(self):
+        filas = list(csv.reader(io.StringIO(self.descargar('citas', 'csv').decode('utf-8-sig'))))
+        self.assertEqual(filas[0][0], 'ID')
+        self.assertEqual(len(filas), 4)
+        self.assertEqual(filas[1][-1], 'Dolor, "agudo"')
+        self.assertEqual(filas[1][7], 'FONASA')
+
+    def test_csv_neutraliza_formulas(self):
+        for motivo, esperado in (
+            ('=HYPERLINK("http://x", "ver")', '\'=HYPERLINK("http://x", "ver")'),
+            ('@SUM(A1)', "'@SUM(A1)"),
+            ('-2+3', "'-2+3"),
+            ('\tTAB', "'\tTAB"),
+            ('Dolor -=+', 'Dolor -=+'),
+        ):
+            Cita.objects.filter(kinesiologo=self.kine).update(motivo=motivo)
+            filas = list(csv.reader(io.StringIO(self.descargar('citas', 'csv').decode('utf-8-sig'))))
+            self.assertEqual(filas[1][-1], esperado)
+
+    def test_xlsx_valido(self):
+        self.kine.perfil.user.is_staff = True
+        self.kine.perfil.user.save()
+        with zipfile.ZipFile(io.BytesIO(self.descargar('citas', 'xlsx', kinesiologo=self.otro_kine.pk))) as archivo:
+            hoja = ElementTree.fromstring(archivo.read('xl/worksheets/sheet1.xml'))
+            self.assertIn('xl/workbook.xml', archivo.namelist())
+        filas = hoja.findall('.//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}row')
+        self.assertEqual(len(filas), 2)
+
+    def test_filtros_invalidos(self):
+        respuesta = self.client.get(
+            reverse('citas:exportar_datos', args=['citas', 'csv']), {'desde': '2026-02-01', 'hasta': '2026-01-01'}
+        )
+        self.assertRedirects(respuesta, reverse('citas:exportaciones'))
+
+
+class ImportacionCitasTests(TestCase):
+    ENCABEZADO = ['rut', 'nombre', 'apellido', 'telefono', 'prevision', 'licencia', 'fecha_hora_inicio', 'duracion_minutos', 'estado']
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.existente = crear_paciente('11111111-1')
+        cita = Cita(kinesiologo=self.kine, paciente=self.existente, fecha_hora_inicio=timezone.make_aware(datetime(2020, 3, 2, 9, 0)))
+        guardar_cita_con_reserva(cita)
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, 'historico.csv')
+
+    def escribir(self, filas):
+        with open(self.ruta, 'w', newline='', encoding='utf-8') as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(self.ENCABEZADO)
+            escritor.writerows(filas)
+
+    def importar(self, **opciones):
+        call_command('importar_citas', self.ruta, stdout=io.StringIO(), **opciones)
+        with open(f"{self.ruta}.rechazos.csv", encoding='utf-8') as archivo:
+            return {int(fila['fila']): fila['motivo_rechazo'] for fila in csv.DictReader(archivo)}
+
+    def test_importa_y_rechaza_con_motivo(self):
+        self.escribir([
+            ['22.222.222-2', 'Ana', 'Rojas', '+56911112222', 'ISAPRE', 'LIC-1', '2020-03-02 10:00', '45', 'Finalizada'],
+            ['22222222-2', 'Ana', 'Rojas', '', '', 'LIC-1', '2020-03-02 10:30', '60', ''],  # choca con la fila 2
+            ['11111111-1', '', '', '', '', 'LIC-1', '2020-03-02 09:30', '30', ''],  # choca con la cita existente
+            ['11111111-1', '', '', '', '', 'LIC-1', '2020-03-02 09:30', '30', 'CANCELADA'],
+            ['1-1', 'X', 'Y', '', '', 'LIC-1', '2020-03-03 10:00', '', ''],
+            ['33333333-3', 'Luis', 'Soto', '', '', 'LIC-9', '2020-03-03 10:00', '', ''],
+            ['44444444-4', 'Eva', 'Paz', '', '', 'LIC-1', '03-03-2020 11:00', '', ''],
+            ['12.345.678-9', 'Dígito', 'Errado', '', '', 'LIC-1', '2020-03-04 10:00', '', ''],
+        ])
+        rechazos = self.importar(lote=3)
+
+        self.assertEqual(sorted(rechazos), [3, 4, 6, 7, 9])
+        self.assertIn('archivo', rechazos[3])
+        self.assertIn('RUT inválido', rechazos[9])
+        self.assertIn('ya registrada', rechazos[4])
+        nueva = Paciente.objects.get(rut_normalizado='222222222')
+        self.assertEqual((nueva.rut, nueva.perfil.user.username), ('22222222-2', '22222222-2'))
+        self.assertEqual((nueva.prevision, nueva.perfil.nombre), ('I', 'Ana'))
+        self.assertFalse(nueva.perfil.user.has_usable_password())
+        cita = Cita.objects.get(paciente=nueva)
+        self.assertEqual((cita.estado, cita.fecha_hora_fin - cita.fecha_hora_inicio), (CITA_FINALIZADA, timedelta(minutes=45)))
+        self.assertEqual(OcupacionHorario.objects.filter(cita=cita).count(), 3)
+        self.assertEqual(Cita.objects.filter(paciente=self.existente, estado=CITA_CANCELADA).count(), 1)
+        self.assertEqual(Cita.objects.get(paciente__rut='44444444-4').estado, CITA_FINALIZADA)
+        self.assertFalse(os.path.exists(ruta_punto_control(self.ruta)))
+
+    def test_reanuda_desde_el_punto_de_control(self):
+        inicio = datetime(2021, 5, 3, 8, 0)
+        self.escribir([
+            [f'2000000{i}-{digito_verificador(f"2000000{i}")}', 'Paciente', str(i), '', '', 'LIC-1', (inicio + timedelta(hours=i)).strftime('%Y-%m-%d %H:%M'), '', '']
+            for i in range(6)
+        ])
+        importar_lote = ImportadorCitas.importar_lote
+        lotes = []
+
+        def falla_en_el_tercer_lote(importador, lote):
+            lotes.append(lote)
+            if len(lotes) == 3:
+                raise RuntimeError("corte de conexión")
+            return importar_lote(importador, lote)
+
+        with mock.patch.object(ImportadorCitas, 'importar_lote', falla_en_el_tercer_lote):
+            with self.assertRaises(RuntimeError):
+                self.importar(lote=2)
+        self.assertEqual(Cita.objects.filter(kinesiologo=self.kine, fecha_hora_inicio__year=2021).count(), 4)
+
+        self.assertEqual(self.importar(lote=2), {})
+        self.assertEqual(Cita.objects.filter(kinesiologo=self.kine, fecha_hora_inicio__year=2021).count(), 6)
+        self.assertFalse(os.path.exists(ruta_punto_control(self.ruta)))
+
+    def lote(self, *filas):
+        return [(numero, dict(zip(self.ENCABEZADO, fila))) for numero, fila in enumerate(filas, 2)]
+
+    def test_reserva_concurrente_rechaza_solo_la_fila_que_choca(self):
+        importador = ImportadorCitas()
+        lote = self.lote(
+            ['22222222-2', 'Ana', 'Rojas', '', '', 'LIC-1', '2020-03-05 10:00', '', ''],
+            ['33333333-3', 'Luis', 'Soto', '', '', 'LIC-1', '2020-03-05 12:00', '', ''],
+        )
+        descartar_traslapes = ImportadorCitas.descartar_traslapes
+
+        def reserva_tras_el_barrido(importador, datos):
+            resultado = descartar_traslapes(importador, datos)
+            cita = Cita(kinesiologo=self.kine, paciente=self.existente, fecha_hora_inicio=timezone.make_aware(datetime(2020, 3, 5, 10, 30)))
+            guardar_cita_con_reserva(cita)
+            return resultado
+
+        with mock.patch.object(ImportadorCitas, 'descartar_traslapes', reserva_tras_el_barrido):
+            rechazos = importador.importar_lote(lote)
+
+        self.assertEqual([(numero, motivo) for numero, _, motivo in rechazos], [(2, MENSAJE_HORARIO_OCUPADO)])
+        self.assertEqual((importador.importadas, importador.rechazadas), (1, 1))
+        self.assertTrue(Cita.objects.filter(paciente__rut_normalizado='333333333').exists())
+        # El paciente de la fila rechazada se creó igual en el reintento y el mapa apunta a su ficha
+        self.assertEqual(importador.pacientes['222222222'], Paciente.objects.get(rut_normalizado='222222222').pk)
+
+    def test_lote_revertido_no_deja_pacientes_en_el_mapa(self):
+        importador = ImportadorCitas()
+        lote = self.lote(['22222222-2', 'Ana', 'Rojas', '', '', 'LIC-1', '2020-03-05 10:00', '', ''])
+        with mock.patch('citas.importacion.publicar_pacientes', side_effect=RuntimeError("corte de conexión")):
+            with self.assertRaises(RuntimeError):
+                importador.importar_lote(lote)
+        self.assertNotIn('222222222', importador.pacientes)
+        self.assertEqual(importador.pacientes_creados, 0)
+
+        # Al reintentar, el paciente se vuelve a crear en vez de apuntar a una ficha revertida
+        self.assertEqual(importador.importar_lote(lote), [])
+        self.assertEqual(Cita.objects.get(paciente__rut_normalizado='222222222').kinesiologo, self.kine)
+
+
+class OcupacionDiariaTests(TestCase):
+    """El resumen diario se mantiene desde las señales y coincide con la reconstrucción completa."""
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        # Lunes con la jornada por defecto (09:00 a 18:00)
+        self.fecha = datetime(2030, 3, 4).date()
+        self.nueve = timezone.make_aware(datetime(2030, 3, 4, 9, 0))
+
+    def resumen(self):
+        return OcupacionDiaria.objects.get(kinesiologo=self.kine, fecha=self.fecha)
+
+    def test_se_actualiza_con_citas_bloqueos_y_cancelaciones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.nueve)
+            guardar_cita_con_reserva(cita)
+        resumen = self.resumen()
+        self.assertEqual(
+            (resumen.minutos_jornada, resumen.minutos_agendados, resumen.minutos_disponibles, resumen.citas_pendientes),
+            (540, 60, 480, 1),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BloqueoHorario.objects.create(
+                kinesiologo=self.kine, fecha_hora_inicio=self.nueve + timedelta(hours=3), fecha_hora_fin=self.nueve + timedelta(hours=4),
+            )
+        resumen = self.resumen()
+        self.assertEqual((resumen.minutos_bloqueados, resumen.minutos_disponibles), (60, 420))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cambiar_estado_citas(self.kine.pk, {cita.pk: None}, CITA_CANCELADA)
+        resumen = self.resumen()
+        self.assertEqual(
+            (resumen.minutos_agendados, resumen.minutos_disponibles, resumen.citas_pendientes, resumen.citas_canceladas),
+            (0, 480, 0, 1),
+        )
+
+    def test_reconstruccion_y_reporte(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for horas in (0, 2):
+                guardar_cita_con_reserva(Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.nueve + timedelta(hours=horas)))
+        incremental = OcupacionDiaria.objects.values('fecha', 'minutos_agendados', 'minutos_disponibles', 'citas_pendientes').get()
+
+        OcupacionDiaria.objects.all().delete()
+        call_command('reconstruir_ocupacion', stdout=io.StringIO())
+        self.assertEqual(
+            OcupacionDiaria.objects.values('fecha', 'minutos_agendados', 'minutos_disponibles', 'citas_pendientes').get(),
+            incremental,
+        )
+
+        self.client.force_login(self.kine.perfil.user)
+        parametros = {'desde': '2030-03-04', 'hasta': '2030-03-17', 'agrupacion': 'semana'}
+        # La primera petición guarda el actor en la sesión y completa los días sin fila
+        self.client.get(reverse('citas:reporte_ocupacion'), parametros)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('citas:reporte_ocupacion'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        semana, siguiente = respuesta.context['filas']
+        # Los días sin citas también suman su jornada (la plantilla por defecto atiende los 7 días)
+        self.assertEqual(
+            (semana['minutos_jornada'], semana['minutos_agendados'], semana['porcentaje_ocupacion']),
+            (7 * 540, 120, 3),
+        )
+        self.assertEqual((siguiente['minutos_jornada'], siguiente['porcentaje_ocupacion']), (7 * 540, 0))
+        # Sesión, usuario, días ya calculados y una sola suma sobre el resumen
+        self.assertEqual(len(consultas), 4)
+
+    def test_reporte_completa_los_dias_sin_fila(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            guardar_cita_con_reserva(Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.nueve))
+        otro = crear_kinesiologo('kine2', 'LIC-2')
+        self.assertEqual(OcupacionDiaria.objects.count(), 1)
+
+        filas = list(resumen_ocupacion(self.fecha, self.fecha + timedelta(days=6), agrupacion=AGRUPACION_DIA))
+        self.assertEqual(OcupacionDiaria.objects.count(), 14)
+        self.assertEqual(len(filas), 14)
+        martes = next(fila for fila in filas if fila['kinesiologo_id'] == self.kine.pk and fila['periodo'] == self.fecha + timedelta(days=1))
+        self.assertEqual((martes['minutos_jornada'], martes['minutos_disponibles'], martes['porcentaje_ocupacion']), (540, 540, 0))
+        self.assertTrue(all(fila['minutos_agendados'] == 0 for fila in filas if fila['kinesiologo_id'] == otro.pk))
+        # Ya completos, no se vuelve a calcular nada
+        self.assertEqual(completar_dias(self.fecha, self.fecha + timedelta(days=6)), 0)
+
+    def test_rango_del_reporte_y_del_completado_acotados(self):
+        self.client.force_login(self.kine.perfil.user)
+        respuesta = self.client.get(reverse('citas:reporte_ocupacion'), {'desde': '1900-01-01', 'hasta': '2100-12-31'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.context['form'].errors)
+        self.assertFalse(OcupacionDiaria.objects.filter(fecha__year__lt=2000).exists())
+        # Solo la fecha inicial: el término por defecto igual cuenta para el límite
+        respuesta = self.client.get(reverse('citas:reporte_ocupacion'), {'desde': '1900-01-01'})
+        self.assertTrue(respuesta.context['form'].errors)
+
+        OcupacionDiaria.objects.all().delete()
+        self.assertEqual(completar_dias(self.fecha - timedelta(days=3650), self.fecha, self.kine.pk), MAX_DIAS_REPORTE)
+        self.assertEqual(
+            OcupacionDiaria.objects.aggregate(primero=Min('fecha'))['primero'],
+            self.fecha - timedelta(days=MAX_DIAS_REPORTE - 1),
+        )
+
+
+class RecordatoriosTests(TestCase):
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.paciente.perfil.user.email = 'paciente@example.com'
+        self.paciente.perfil.user.save()
+        self.ahora = timezone.now()
+        self.citas = {}
+        for horas, estado in ((2, CITA_PENDIENTE), (5, CITA_CONFIRMADA), (8, CITA_CANCELADA), (30, CITA_CONFIRMADA)):
+            cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.ahora + timedelta(hours=horas), estado=estado)
+            cita.save()
+            self.citas[horas] = cita
+
+    def test_envia_una_sola_vez_las_citas_activas_de_la_ventana(self):
+        totales = enviar_recordatorios(horas=24, tamano_lote=1, ahora=self.ahora)
+
+        self.assertEqual(totales, {'enviados': 2, 'sin_correo': 0, 'fallidos': 0})
+        self.assertEqual([correo.to for correo in mail.outbox], [['paciente@example.com']] * 2)
+        self.assertIn('Confirma tu cita', mail.outbox[0].subject)
+        self.assertIn('Recordatorio', mail.outbox[1].subject)
+        self.assertTrue(Cita.objects.get(pk=self.citas[2].pk).recordatorio_enviado)
+        self.assertIsNone(Cita.objects.get(pk=self.citas[30].pk).recordatorio_enviado)
+
+        # Otra ejecución (u otro proceso) no vuelve a enviarlos
+        self.assertEqual(enviar_recordatorios(horas=24, ahora=self.ahora)['enviados'], 0)
+        self.assertEqual(reclamar([self.citas[2].pk, self.citas[5].pk], timezone.now()), [])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_fallo_libera_y_cambio_de_horario_reinicia(self):
+        conexion = mail.get_connection()
+        with mock.patch.object(conexion, 'send_messages', side_effect=[OSError("SMTP caído"), 1]):
+            totales = enviar_recordatorios(horas=24, ahora=self.ahora, conexion=conexion)
+        self.assertEqual((totales['enviados'], totales['fallidos']), (1, 1))
+        self.assertIsNone(Cita.objects.get(pk=self.citas[2].pk).recordatorio_enviado)
+
+        cita = Cita.objects.get(pk=self.citas[5].pk)
+        self.assertIsNotNone(cita.recordatorio_enviado)
+        cita.fecha_hora_inicio += timedelta(hours=1)
+        cita.save(update_fields=['fecha_hora_inicio'])
+        self.assertIsNone(Cita.objects.get(pk=cita.pk).recordatorio_enviado)
+
+    def test_guardar_una_instancia_antigua_no_pisa_el_reclamo(self):
+        cita = Cita.objects.get(pk=self.citas[5].pk)
+        parcial = Cita.objects.only('id', 'estado', 'kinesiologo_id', 'fecha_hora_inicio', 'duracion_minutos').get(pk=cita.pk)
+        self.assertEqual(reclamar([cita.pk], self.ahora), [cita.pk])
+
+        # Guardados completos y parciales que no cambian la hora conservan la marca
+        cita.motivo = 'Control'
+        cita.save()
+        parcial.estado = CITA_PENDIENTE
+        parcial.save()
+        cita.save(update_fields=['motivo', 'duracion_minutos'])
+        guardada = Cita.objects.get(pk=cita.pk)
+        self.assertEqual((guardada.recordatorio_enviado, guardada.motivo, guardada.estado), (self.ahora, 'Control', CITA_PENDIENTE))
+
+        # Cambiar la hora en un guardado completo sí la reinicia
+        cita.fecha_hora_inicio += timedelta(hours=1)
+        cita.save()
+        self.assertIsNone(Cita.objects.get(pk=cita.pk).recordatorio_enviado)
+
+
+class PermisosObjetoTests(TestCase):
+    """Las vistas de detalle cargan y autorizan el objeto con una sola consulta."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.otro_kine = crear_kinesiologo('kine2', 'LIC-2')
+        self.paciente = crear_paciente('11111111-1')
+        self.otro_paciente = crear_paciente('22222222-2')
+        self.cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=timezone.now() + timedelta(days=1))
+        self.cita.save()
+        NotaClinica.objects.create(
+            cita=self.cita, kinesiologo=self.kine, paciente=self.paciente,
+            diagnostico_subjetivo='S', diagnostico_objetivo='O', analisis_y_plan='A/P',
+        )
+
+    def get(self, usuario, nombre, **kwargs):
+        self.client.force_login(usuario)
+        # La primera petición deja el actor en la sesión
+        self.client.get(reverse('citas:agenda'))
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse(nombre, kwargs=kwargs))
+        return respuesta, len(consultas)
+
+    def test_dueno_con_una_consulta_ajeno_403_inexistente_404(self):
+        for nombre, kwargs in (
+            ('citas:detalle_cita', {'pk': self.cita.pk}),
+            ('citas:cita_confirmada', {'cita_id': self.cita.pk}),
+            ('evaluaciones:ver_nota_clinica', {'cita_pk': self.cita.pk}),
+        ):
+            respuesta, consultas = self.get(self.paciente.perfil.user, nombre, **kwargs)
+            self.assertEqual(respuesta.status_code, 200, nombre)
+            # Sesión, usuario y la cita (con lo que muestra la plantilla)
+            self.assertEqual(consultas, 3, nombre)
+            self.assertEqual(self.get(self.otro_paciente.perfil.user, nombre, **kwargs)[0].status_code, 403, nombre)
+
+        self.assertEqual(self.get(self.paciente.perfil.user, 'citas:detalle_cita', pk=self.cita.pk + 100)[0].status_code, 404)
+
+    def test_nota_clinica_solo_para_el_kinesiologo_asignado(self):
+        respuesta, consultas = self.get(self.kine.perfil.user, 'evaluaciones:crear_o_editar_nota_clinica', cita_pk=self.cita.pk)
+        self.assertEqual((respuesta.status_code, consultas), (200, 3))
+        self.assertTrue(respuesta.context['es_edicion'])
+        for usuario in (self.otro_kine.perfil.user, self.paciente.perfil.user):
+            self.assertEqual(
+                self.get(usuario, 'evaluaciones:crear_o_editar_nota_clinica', cita_pk=self.cita.pk)[0].status_code, 403,
+            )
+        self.assertEqual(self.get(self.kine.perfil.user, 'evaluaciones:ver_nota_clinica', cita_pk=self.cita.pk)[0].status_code, 200)
+
+
+class IntervalosTests(TestCase):
+    """Fusión de intervalos ocupados y recorrido de huecos libres (citas/disponibilidad.py)."""
+
+    def h(self, hora, minuto=0):
+        return timezone.make_aware(datetime(2030, 3, 4, hora, minuto))
+
+    def test_fusiona_traslapados_y_contiguos(self):
+        intervalos = [
+            (self.h(11), self.h(12)),
+            (self.h(9), self.h(10)),
+            (self.h(9, 30), self.h(9, 45)),  # contenido en el anterior
+            (self.h(10), self.h(10, 30)),  # se toca con 9:00-10:00
+            (self.h(14), self.h(14)),  # vacío: se descarta
+        ]
+        self.assertEqual(
+            fusionar_intervalos(intervalos),
+            [(self.h(9), self.h(10, 30)), (self.h(11), self.h(12))],
+        )
+
+    def test_huecos_dentro_de_la_ventana(self):
+        ocupados = [(self.h(7), self.h(8, 30)), (self.h(10), self.h(11)), (self.h(12), self.h(20))]
+        self.assertEqual(
+            huecos_libres(ocupados, self.h(8), self.h(13)),
+            [(self.h(8, 30), self.h(10)), (self.h(11), self.h(12))],
+        )
+        self.assertEqual(huecos_libres([], self.h(8), self.h(9)), [(self.h(8), self.h(9))])
+        self.assertEqual(huecos_libres([(self.h(7), self.h(21))], self.h(8), self.h(9)), [])
+
+    def test_horarios_alineados_a_la_grilla(self):
+        ocupados = [(self.h(9, 10), self.h(9, 40))]
+        # Citas de 30 minutos cada 30 desde las 9:00: 9:00 y 9:30 chocan, 9:40 no está en la grilla
+        self.assertEqual(
+            horarios_disponibles(ocupados, self.h(9), self.h(11), duracion=30),
+            [self.h(10), self.h(10, 30)],
+        )
+
+
+class HorariosRangoTests(TestCase):
+    """Endpoints JSON de horarios libres: un día (api_horarios) y un rango de días (api_horarios_rango)."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.otro_kine = crear_kinesiologo('kine2', 'LIC-2')
+        self.lunes = datetime(2030, 3, 4).date()
+        # Sin turnos configurados rige la jornada por defecto: 9:00-18:00 en citas de 60 minutos
+        Cita(
+            kinesiologo=self.kine, paciente=crear_paciente('11111111-1'),
+            fecha_hora_inicio=timezone.make_aware(datetime(2030, 3, 4, 10, 0)),
+        ).save()
+
+    def rango(self, **parametros):
+        return self.client.get(reverse('citas:api_horarios_rango'), parametros)
+
+    def test_horarios_por_kinesiologo_y_dia(self):
+        respuesta = self.rango(fecha_desde='2030-03-04', fecha_hasta='2030-03-05', kinesiologo_id=f'{self.kine.pk},{self.otro_kine.pk}')
+        self.assertEqual(respuesta.status_code, 200)
+        dias = {kine['id']: kine['dias'] for kine in respuesta.json()['kinesiologos']}
+        self.assertEqual(set(dias), {self.kine.pk, self.otro_kine.pk})
+        self.assertEqual(len(dias[self.kine.pk]['2030-03-04']), 8)
+        self.assertNotIn('10:00', dias[self.kine.pk]['2030-03-04'])
+        self.assertEqual(len(dias[self.kine.pk]['2030-03-05']), 9)
+        self.assertEqual(len(dias[self.otro_kine.pk]['2030-03-04']), 9)
+
+        respuesta = self.client.get(reverse('citas:api_horarios'), {'kinesiologo_id': self.kine.pk, 'fecha': '2030-03-04'})
+        self.assertEqual([horario['hora'] for horario in respuesta.json()['horarios']][:2], ['09:00', '11:00'])
+
+    def test_parametros_invalidos_responden_400(self):
+        hasta = self.lunes + timedelta(days=MAX_DIAS_RANGO_HORARIOS - 1)
+        self.assertEqual(self.rango(fecha_desde='2030-03-04', fecha_hasta=hasta.isoformat()).status_code, 200)
+        hasta += timedelta(days=1)
+        self.assertEqual(self.rango(fecha_desde='2030-03-04', fecha_hasta=hasta.isoformat()).status_code, 400)
+        self.assertEqual(self.rango(fecha_desde='2030-03-05', fecha_hasta='2030-03-04').status_code, 400)
+        self.assertEqual(self.rango(fecha_desde='04-03-2030', fecha_hasta='2030-03-04').status_code, 400)
+        self.assertEqual(self.rango(fecha_desde='2030-03-04', fecha_hasta='2030-03-04', kinesiologo_id='x').status_code, 400)
+
+        for parametros in ({'kinesiologo_id': 'x', 'fecha': '2030-03-04'}, {'kinesiologo_id': self.kine.pk, 'fecha': 'mañana'}):
+            self.assertEqual(self.client.get(reverse('citas:api_horarios'), parametros).status_code, 400)
+
+
+class FechaHoraFinTests(TestCase):
+    """La hora de fin se persiste y se mantiene al día; la BD rechaza citas sin duración."""
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.inicio = timezone.make_aware(datetime(2030, 3, 4, 9, 0))
+
+    def test_fin_calculado_al_guardar(self):
+        cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio, duracion_minutos=45)
+        cita.save()
+        self.assertEqual(Cita.objects.get(pk=cita.pk).fecha_hora_fin, self.inicio + timedelta(minutes=45))
+
+        # Con update_fields también se escribe el fin recalculado
+        cita.fecha_hora_inicio += timedelta(hours=2)
+        cita.save(update_fields=['fecha_hora_inicio'])
+        self.assertEqual(Cita.objects.get(pk=cita.pk).fecha_hora_fin, self.inicio + timedelta(hours=2, minutes=45))
+
+    def test_duracion_cero_es_error_de_validacion(self):
+        cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio, duracion_minutos=0)
+        with self.assertRaises(ValidationError) as contexto:
+            cita.full_clean()
+        self.assertIn('duracion_minutos', contexto.exception.message_dict)
+        with self.assertRaises(ValidationError):
+            cita.save()
+
+    def test_restriccion_fin_posterior_al_inicio(self):
+        cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio)
+        cita.save()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cita.objects.filter(pk=cita.pk).update(fecha_hora_fin=F('fecha_hora_inicio'))
+
+    def test_migracion_repara_duraciones_cero(self):
+        # Una cita antigua con duración 0 no debe hacer fallar el relleno de la hora de fin
+        cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio)
+        cita.save()
+        Cita.objects.filter(pk=cita.pk).update(duracion_minutos=0)
+        migracion = import_module('citas.migrations.0003_cita_fecha_hora_fin_indices')
+        migracion.calcular_fecha_hora_fin(apps, None)
+        cita.refresh_from_db()
+        self.assertEqual(cita.duracion_minutos, migracion.DURACION_POR_DEFECTO)
+        self.assertEqual(cita.fecha_hora_fin, self.inicio + timedelta(minutes=migracion.DURACION_POR_DEFECTO))
+
+
+class MapaDisponibilidadTests(TestCase):
+    """El mapa de bits de cada día sale de la caché y se invalida al confirmar los cambios de ese día."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.lunes = datetime(2030, 3, 4).date()
+        self.inicio = timezone.make_aware(datetime(2030, 3, 4, 9, 0))
+
+    def test_mapa_del_dia(self):
+        medianoche = inicio_del_dia(self.lunes)
+        # 9:00-10:00 son los gránulos 36 a 39
+        self.assertEqual(construir_mapa([(self.inicio, self.inicio + timedelta(hours=1))], medianoche), 0b1111 << 36)
+        self.assertEqual(mascara_intervalo(medianoche, self.inicio + timedelta(minutes=5), self.inicio + timedelta(minutes=20)), 0b11 << 36)
+
+    def test_cache_invalidada_al_confirmar(self):
+        self.assertTrue(esta_libre(self.kine.pk, self.inicio))
+        with self.captureOnCommitCallbacks(execute=True):
+            cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio)
+            cita.save()
+            # Sin confirmar: el mapa en caché no se toca
+            self.assertEqual(cache.get(clave_mapa(self.kine.pk, self.lunes)), 0)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertFalse(esta_libre(self.kine.pk, self.inicio))
+            self.assertFalse(esta_libre(self.kine.pk, self.inicio))
+        # Se reconstruye una vez y luego sale de la caché
+        self.assertEqual(len(consultas), 4)
+
+        # Al moverla a otro día se invalidan los dos días
+        self.assertTrue(esta_libre(self.kine.pk, self.inicio + timedelta(days=1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.fecha_hora_inicio += timedelta(days=1)
+            cita.save()
+        self.assertTrue(esta_libre(self.kine.pk, self.inicio))
+        self.assertFalse(esta_libre(self.kine.pk, self.inicio + timedelta(days=1)))
+
+    def test_regla_de_bloqueo_invalida_todos_los_dias(self):
+        version = version_kinesiologo(self.kine.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            ReglaBloqueo.objects.create(
+                kinesiologo=self.kine, dias_semana='0', hora_inicio=self.inicio.time(), hora_fin=(self.inicio + timedelta(hours=1)).time(),
+                vigente_desde=self.lunes,
+            )
+        self.assertNotEqual(version_kinesiologo(self.kine.pk), version)
+        self.assertFalse(esta_libre(self.kine.pk, self.inicio + timedelta(weeks=2)))
+
+    def test_version_expira_antes_que_los_mapas(self):
+        self.assertLess(VIGENCIA_VERSION_MAPA, TIMEOUT_MAPA)
+        self.assertTrue(esta_libre(self.kine.pk, self.inicio))
+        # Otro proceso bloqueó el horario: su invalidación no llega a la caché de este proceso
+        BloqueoHorario.objects.bulk_create([
+            BloqueoHorario(kinesiologo=self.kine, fecha_hora_inicio=self.inicio, fecha_hora_fin=self.inicio + timedelta(hours=1)),
+        ])
+        self.assertTrue(esta_libre(self.kine.pk, self.inicio))
+        despues = time.time() + VIGENCIA_VERSION_MAPA + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=despues):
+            self.assertFalse(esta_libre(self.kine.pk, self.inicio))
+
+
+class ReservaEnSaveTests(TestCase):
+    """Cualquier guardado de una Cita (no solo guardar_cita_con_reserva) reserva sus gránulos."""
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.inicio = timezone.make_aware(datetime(2030, 3, 4, 9, 0))
+        self.cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio)
+        self.cita.save()
+
+    def granulos(self):
+        return OcupacionHorario.objects.filter(kinesiologo=self.kine).count()
+
+    def test_save_reserva_y_mover_libera_lo_anterior(self):
+        self.assertEqual(self.granulos(), 4)
+        with self.assertRaises(ValidationError):
+            Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio + timedelta(minutes=45)).save()
+
+        cita = Cita.objects.get(pk=self.cita.pk)
+        cita.fecha_hora_inicio += timedelta(hours=2)
+        cita.save()
+        Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=self.inicio).save()
+        self.assertEqual(self.granulos(), 8)
+
+        # Un cambio que no toca el horario no vuelve a escribir los gránulos
+        cita = Cita.objects.get(pk=self.cita.pk)
+        cita.estado = CITA_FINALIZADA
+        with CaptureQueriesContext(connection) as consultas:
+            cita.save()
+        self.assertFalse([consulta for consulta in consultas if 'citas_ocupacionhorario' in consulta['sql']])
+
+    def test_admin_rechaza_un_horario_tomado(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(admin)
+        datos = {
+            'kinesiologo': self.kine.pk, 'paciente': self.paciente.pk,
+            'fecha_hora_inicio_0': '2030-03-04', 'fecha_hora_inicio_1': '09:30:00',
+            'duracion_minutos': 60, 'estado': CITA_PENDIENTE, 'motivo': '',
+        }
+        respuesta = self.client.post(reverse('admin:citas_cita_add'), datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'ya no está disponible')
+        self.assertEqual(Cita.objects.count(), 1)
+
+        datos['fecha_hora_inicio_1'] = '10:00:00'
+        self.assertEqual(self.client.post(reverse('admin:citas_cita_add'), datos).status_code, 302)
+        self.assertEqual(self.granulos(), 8)
+
+
+class SeriesTests(TestCase):
+    """Series de sesiones: verificación en una pasada, alternativas e inserción atómica."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.lunes = datetime(2030, 3, 4).date()
+        self.hora = datetime(2030, 3, 4, 10, 0).time()
+        # Ocupa la sesión del miércoles 6 a las 10:00
+        Cita(kinesiologo=self.kine, paciente=crear_paciente('22222222-2'), fecha_hora_inicio=self.en(2, 10)).save()
+
+    def en(self, dias, hora, minuto=0):
+        return timezone.make_aware(datetime(2030, 3, 4 + dias, hora, minuto))
+
+    def test_ocurrencias(self):
+        self.assertEqual(
+            generar_ocurrencias(self.lunes, [0, 2], self.hora, cantidad=3),
+            [self.en(0, 10), self.en(2, 10), self.en(7, 10)],
+        )
+        self.assertEqual(len(generar_ocurrencias(self.lunes, [0, 2], self.hora, fecha_fin=self.lunes + timedelta(days=13))), 4)
+        self.assertEqual(generar_ocurrencias(self.lunes, [], self.hora, cantidad=3), [])
+
+    def test_conflictos_con_alternativas(self):
+        ocurrencias = generar_ocurrencias(self.lunes, [0, 2], self.hora, cantidad=4)
+        ocurrencias.append(self.en(4, 20))  # fuera de la jornada (9:00-18:00)
+        disponibles, conflictos = verificar_serie(self.kine.pk, ocurrencias)
+
+        self.assertEqual(disponibles, [self.en(0, 10), self.en(7, 10), self.en(9, 10)])
+        self.assertEqual([conflicto['inicio'] for conflicto in conflictos], [self.en(2, 10), self.en(4, 20)])
+        # El horario más cercano del mismo día y luego la misma hora en los días siguientes
+        self.assertEqual(conflictos[0]['alternativas'], [self.en(2, 9), self.en(3, 10), self.en(4, 10)])
+
+    def test_crear_serie_es_atomica(self):
+        citas = crear_serie(self.kine, self.paciente, [self.en(0, 10), self.en(7, 10)])
+        self.assertEqual(OcupacionHorario.objects.filter(cita__in=citas).count(), 8)
+
+        with self.assertRaises(ValidationError):
+            crear_serie(self.kine, self.paciente, [self.en(1, 10), self.en(2, 10)])
+        self.assertFalse(Cita.objects.filter(fecha_hora_inicio=self.en(1, 10)).exists())
+
+
+class ReglaBloqueoTests(TestCase):
+    """Las reglas de bloqueo recurrente se expanden solo dentro de la ventana consultada."""
+
+    def setUp(self):
+        self.kine = crear_kinesiologo()
+        # Colación lunes y miércoles 13:00-14:00 durante marzo, salvo el miércoles 13
+        self.regla = ReglaBloqueo(
+            kinesiologo=self.kine, dias_semana='0,2', hora_inicio=datetime(2030, 1, 1, 13).time(),
+            hora_fin=datetime(2030, 1, 1, 14).time(), vigente_desde=datetime(2030, 3, 4).date(),
+            vigente_hasta=datetime(2030, 3, 31).date(), excepciones=['2030-03-13'],
+        )
+
+    def h(self, dia, hora, minuto=0, mes=3):
+        return timezone.make_aware(datetime(2030, mes, dia, hora, minuto))
+
+    def test_expandir_respeta_dias_vigencia_y_excepciones(self):
+        intervalos = self.regla.expandir(self.h(1, 0), self.h(16, 0))
+        self.assertEqual([inicio.day for inicio, _ in intervalos], [4, 6, 11])
+        self.assertEqual(intervalos[0], (self.h(4, 13), self.h(4, 14)))
+        # Fuera de la vigencia no hay ocurrencias
+        self.assertEqual(self.regla.expandir(self.h(1, 0, mes=4), self.h(30, 0, mes=4)), [])
+        # La ventana recorta: solo toca la ocurrencia del lunes 4
+        self.assertEqual(self.regla.expandir(self.h(4, 13, 30), self.h(5, 9)), [(self.h(4, 13), self.h(4, 14))])
+
+    def test_aplica_a_y_validacion(self):
+        self.assertTrue(self.regla.aplica_a(self.h(6, 13, 30), self.h(6, 14, 30)))
+        self.assertFalse(self.regla.aplica_a(self.h(6, 14), self.h(6, 15)))
+        self.assertFalse(self.regla.aplica_a(self.h(13, 13), self.h(13, 14)))
+
+        self.regla.dias_semana = ''
+        with self.assertRaises(ValidationError):
+            self.regla.clean()
+
+    def test_ocupa_la_agenda(self):
+        self.regla.save()
+        ocupados = obtener_intervalos_ocupados(self.kine.pk, self.h(4, 0), self.h(5, 0))
+        self.assertEqual(ocupados, [(self.h(4, 13), self.h(4, 14))])
+
+
+class JornadasTests(TestCase):
+    """Plantilla semanal de turnos por kinesiólogo, compilada una vez y guardada en la caché."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.lunes = datetime(2030, 3, 4).date()
+
+    def hora(self, hora):
+        return datetime(2030, 1, 1, hora).time()
+
+    def h(self, dia, hora):
+        return timezone.make_aware(datetime(2030, 3, dia, hora))
+
+    def test_jornada_por_defecto(self):
+        self.assertEqual(turnos_del_dia(obtener_plantilla(self.kine.pk), self.lunes), [(self.h(4, 9), self.h(4, 18), 60)])
+
+    def test_turnos_semanales_y_horario_especial(self):
+        HorarioAtencion.objects.create(kinesiologo=self.kine, dia_semana=0, hora_inicio=self.hora(14), hora_fin=self.hora(18))
+        HorarioAtencion.objects.create(
+            kinesiologo=self.kine, dia_semana=0, hora_inicio=self.hora(8), hora_fin=self.hora(12), duracion_cita_minutos=30,
+        )
+        HorarioEspecial.objects.create(kinesiologo=self.kine, fecha_desde=datetime(2030, 3, 11).date(), fecha_hasta=datetime(2030, 3, 11).date())
+        plantilla = obtener_plantilla(self.kine.pk)
+
+        self.assertEqual(
+            turnos_del_dia(plantilla, self.lunes),
+            [(self.h(4, 8), self.h(4, 12), 30), (self.h(4, 14), self.h(4, 18), 60)],
+        )
+        # Con turnos configurados, un día sin turnos no tiene atención
+        self.assertEqual(turnos_del_dia(plantilla, self.lunes + timedelta(days=1)), [])
+        # El horario especial sin horas cierra el lunes 11
+        self.assertEqual(turnos_del_dia(plantilla, self.lunes + timedelta(days=7)), [])
+        self.assertEqual(duracion_para(self.kine.pk, self.h(4, 9)), 30)
+
+    def test_plantilla_en_cache_e_invalidada_al_cambiar(self):
+        obtener_plantilla(self.kine.pk)
+        with CaptureQueriesContext(connection) as consultas:
+            obtener_plantilla(self.kine.pk)
+        self.assertEqual(len(consultas), 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                HorarioAtencion.objects.create(kinesiologo=self.kine, dia_semana=1, hora_inicio=self.hora(10), hora_fin=self.hora(12))
+        # Hasta el commit la plantilla anterior sigue en la caché (nadie la recompila con filas sin confirmar)
+        self.assertEqual(cache.get(clave_plantilla(self.kine.pk)), PLANTILLA_POR_DEFECTO)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(clave_plantilla(self.kine.pk)), PLANTILLA_POR_DEFECTO)
+        self.assertEqual(turnos_del_dia(obtener_plantilla(self.kine.pk), self.lunes), [])
+
+    def test_plantilla_expira_en_minutos(self):
+        self.assertLessEqual(TIMEOUT_PLANTILLA, 10 * 60)
+        obtener_plantilla(self.kine.pk)
+        # Otro proceso cambió los turnos: esta caché no recibe la invalidación, pero la plantilla expira
+        HorarioAtencion.objects.bulk_create([
+            HorarioAtencion(kinesiologo=self.kine, dia_semana=1, hora_inicio=self.hora(10), hora_fin=self.hora(12)),
+        ])
+        despues = time.time() + TIMEOUT_PLANTILLA + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=despues):
+            self.assertEqual(turnos_del_dia(obtener_plantilla(self.kine.pk), self.lunes), [])
+
+
+class ListaEsperaTests(TestCase):
+    """Un cupo liberado se ofrece a la lista de espera, en orden de inscripción."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.inicio = timezone.make_aware(datetime(2030, 3, 4, 10, 0))  # lunes
+        self.cita = Cita(kinesiologo=self.kine, paciente=crear_paciente('11111111-1'), fecha_hora_inicio=self.inicio)
+        self.cita.save()
+        self.inscritas = 0
+
+    def inscribir(self, rut, desde=hora(9), hasta=hora(13)):
+        espera = EsperaCupo.objects.create(
+            paciente=crear_paciente(rut), dias_semana='0', hora_desde=desde, hora_hasta=hasta,
+            fecha_desde=self.inicio.date(), fecha_hasta=self.inicio.date(),
+        )
+        # Orden de inscripción explícito (auto_now_add puede repetir el instante)
+        self.inscritas += 1
+        EsperaCupo.objects.filter(pk=espera.pk).update(fecha_creacion=timezone.now() - timedelta(days=100 - self.inscritas))
+        indexar_espera(espera)
+        return espera
+
+    def cancelar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cita.estado = CITA_CANCELADA
+            self.cita.save()
+            ofrecer_cupo_de_cita(self.cita)
+        return OfertaCupo.objects.filter(estado=OFERTA_PENDIENTE).first()
+
+    def test_oferta_rechazo_aceptacion_y_expiracion(self):
+        primera, segunda = self.inscribir('22222222-2'), self.inscribir('33333333-3')
+        oferta = self.cancelar()
+        self.assertEqual(oferta.espera, primera)
+        # El cupo queda retenido para el paciente al que se le ofreció
+        self.assertFalse(esta_libre(self.kine.pk, self.inicio))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(rechazar_oferta(oferta))
+        oferta = OfertaCupo.objects.get(estado=OFERTA_PENDIENTE)
+        self.assertEqual(oferta.espera, segunda)
+
+        cita = aceptar_oferta(oferta)
+        self.assertEqual((cita.paciente_id, cita.fecha_hora_inicio), (segunda.paciente_id, self.inicio))
+        segunda.refresh_from_db()
+        self.assertFalse(segunda.activa)
+        self.assertFalse(IndiceEspera.objects.filter(espera=segunda).exists())
+        with self.assertRaises(ValidationError):
+            aceptar_oferta(OfertaCupo.objects.get(espera=primera))
+
+    def test_oferta_vencida_pasa_al_siguiente(self):
+        primera, segunda = self.inscribir('22222222-2'), self.inscribir('33333333-3')
+        oferta = self.cancelar()
+        OfertaCupo.objects.filter(pk=oferta.pk).update(expira_en=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expirar_ofertas(), 1)
+        self.assertEqual(OfertaCupo.objects.get(pk=oferta.pk).estado, OFERTA_EXPIRADA)
+        self.assertEqual(OfertaCupo.objects.get(estado=OFERTA_PENDIENTE).espera, segunda)
+
+    def test_esperas_que_no_calzan_no_agotan_los_candidatos(self):
+        # Inscritas antes, con filas en el índice para las 10 pero desde las 10:30
+        for i in range(3):
+            self.inscribir(f'4444444{i}-{digito_verificador(f"4444444{i}")}', desde=hora(10, 30))
+        valida = self.inscribir('22222222-2')
+        with mock.patch('citas.lista_espera.MAX_CANDIDATOS', 2):
+            self.assertEqual(candidatos_para(self.kine.pk, self.inicio, self.inicio + timedelta(hours=1)), [valida])
+            self.assertEqual(self.cancelar().espera, valida)
+
+
+class VistasAsincronasTests(TestCase):
+    """Las vistas asíncronas (ORM y caché asíncronos) responden igual que las síncronas."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.paciente = crear_paciente('11111111-1')
+        self.cita = Cita(kinesiologo=self.kine, paciente=self.paciente, fecha_hora_inicio=timezone.now() + timedelta(days=1))
+        self.cita.save()
+        Cita(
+            kinesiologo=self.kine, paciente=self.paciente,
+            fecha_hora_inicio=timezone.make_aware(datetime(2030, 3, 4, 10, 0)),
+        ).save()
+
+    async def test_horarios_disponibles(self):
+        respuesta = await self.async_client.get(reverse('citas:api_horarios'), {'kinesiologo_id': self.kine.pk, 'fecha': '2030-03-04'})
+        self.assertEqual(respuesta.status_code, 200)
+        horas = [horario['hora'] for horario in respuesta.json()['horarios']]
+        self.assertEqual(horas, ['09:00', '11:00', '12:00', '13:00', '14:00', '15:00', '16:00', '17:00'])
+
+    async def test_datos_dashboard(self):
+        url = reverse('citas:api_dashboard_kinesiologo')
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        await self.async_client.aforce_login(self.paciente.perfil.user)
+        self.assertEqual((await self.async_client.get(url)).status_code, 403)
+
+        await self.async_client.aforce_login(self.kine.perfil.user)
+        datos = (await self.async_client.get(url)).json()
+        self.assertEqual(datos['citas_pendientes'], 2)
+        self.assertEqual([cita['id'] for cita in datos['citas']][0], self.cita.pk)
+        self.assertEqual(datos['citas'][0]['paciente'], f"Paciente {self.paciente.apellido}")
+
+    async def test_agenda_del_paciente(self):
+        self.assertEqual((await self.async_client.get(reverse('citas:agenda'))).status_code, 302)
+        await self.async_client.aforce_login(self.paciente.perfil.user)
+        respuesta = await self.async_client.get(reverse('citas:agenda'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([cita.pk for cita in respuesta.context['citas']][0], self.cita.pk)
+
+
+class FeedCambiosTests(TestCase):
+    """El feed de cambios del dashboard: respuesta inmediata bajo WSGI, stream bajo ASGI."""
+
+    def setUp(self):
+        cache.clear()
+        self.kine = crear_kinesiologo()
+        self.url = reverse('citas:feed_cambios_agenda')
+        self.cursor = ultimo_cambio(self.kine.pk)
+        self.cita = Cita(
+            kinesiologo=self.kine, paciente=crear_paciente('11111111-1'),
+            fecha_hora_inicio=timezone.now() + timedelta(days=1),
+        )
+        self.cita.save()
+
+    def test_wsgi_responde_sin_esperar(self):
+        self.client.force_login(self.kine.perfil.user)
+        inicio = time.monotonic()
+        respuesta = self.client.get(self.url, {'desde': self.cursor})
+        self.assertLess(time.monotonic() - inicio, 1)
+        self.assertFalse(respuesta.streaming)
+        cuerpo = respuesta.content.decode()
+        self.assertTrue(cuerpo.startswith(f"retry: {RECONEXION_WSGI_MS}\n\n"))
+        self.assertIn(f'"id": {self.cita.pk}', cuerpo)
+
+        # Reanudando desde el último evento no hay nada nuevo
+        ultimo = ultimo_cambio(self.kine.pk)
+        respuesta = self.client.get(self.url, headers={'Last-Event-ID': str(ultimo)})
+        self.assertEqual(respuesta.content.decode(), f"retry: {RECONEXION_WSGI_MS}\n\n")
+
+    def test_wsgi_sin_sesion_o_sin_perfil(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_login(self.cita.paciente.perfil.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @mock.patch('citas.cambios.INTERVALO_REVISION', 0.01)
+    @mock.patch('citas.cambios.DURACION_CONEXION', 0.2)
+    async def test_asgi_transmite_eventos(self):
+        await self.async_client.aforce_login(self.kine.perfil.user)
+        respuesta = await self.async_client.get(self.url, {'desde': self.cursor})
+        self.assertTrue(respuesta.streaming)
+        cuerpo = ''.join([parte.decode() async for parte in respuesta.streaming_content])
+        self.assertTrue(cuerpo.startswith(f"retry: {RECONEXION_MS}\n\n"))
+        self.assertIn(f'"id": {self.cita.pk}', cuerpo)
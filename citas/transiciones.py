@@ -0,0 +1,102 @@
+# citas/transiciones.py
+
+"""
+Cambios de estado masivos de citas (confirmar o cancelar varias a la vez).
+
+Todo el lote se cambia con un solo UPDATE sobre las filas elegidas (y
+bloqueadas) por dueño (kinesiologo_id) y por el estado que el kinesiólogo veía al seleccionar cada
+cita (concurrencia optimista): una cita que otro cambió entretanto no se
+toca y se informa como omitida. Las filas se bloquean y se leen sus ids antes
+del UPDATE, en la misma transacción, para saber cuáles se modificaron.
+
+.update() no dispara señales, así que aquí se hace a mano lo que harían al
+guardar: registrar los cambios en el feed de la agenda, cambiar la versión
+del calendario de los pacientes, recalcular la ocupación diaria y, al cancelar, liberar los gránulos,
+invalidar el mapa de esos días y ofrecer los cupos a la lista de espera.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Cita, OcupacionHorario, CITA_PENDIENTE, CITA_CONFIRMADA, CITA_CANCELADA, CAMBIO_CITA
+from .mapa_disponibilidad import invalidar_dias
+from .cambios import registrar_cambios
+from .calendario import publicar_pacientes
+from .lista_espera import ofrecer_cupo
+from .ocupacion_diaria import fechas_de_intervalo, programar_recalculo
+
+
+# Estados desde los que se puede llegar a cada estado destino
+TRANSICIONES = {
+    CITA_CONFIRMADA: (CITA_PENDIENTE,),
+    CITA_CANCELADA: (CITA_PENDIENTE, CITA_CONFIRMADA),
+}
+
+MAX_CITAS_POR_LOTE = 200
+
+def update_retornando_ids(queryset, **valores):
+    """
+    Ejecuta queryset.update(**valores) y retorna los ids de las filas
+    modificadas: en una transacción bloquea las filas (SELECT ... FOR UPDATE
+    donde el motor lo soporta), lee sus ids y actualiza solo esas. Usa solo
+    la API pública del ORM, así funciona igual en cualquier motor.
+    """
+    with transaction.atomic(using=queryset.db):
+        ids = list(queryset.select_for_update().values_list('pk', flat=True))
+        if ids:
+            queryset.model._base_manager.using(queryset.db).filter(pk__in=ids).update(**valores)
+    return ids
+
+
+def cambiar_estado_citas(kinesiologo_id, vistas, nuevo_estado):
+    """
+    Cambia a `nuevo_estado` las citas del kinesiólogo indicadas en `vistas`,
+    un dict {cita_id: estado_visto}. Un estado visto None acepta cualquier
+    estado de origen válido para la transición.
+
+    Retorna (cambiadas, omitidas): listas de ids de las citas que se
+    modificaron y de las que no (ajenas, inexistentes o que cambiaron de
+    estado desde que se vieron).
+    """
+    origenes = TRANSICIONES[nuevo_estado]
+    vistas = dict(list(vistas.items())[:MAX_CITAS_POR_LOTE])
+
+    # Las citas se agrupan por el estado con que se vieron: (pk IN (...) AND estado = ...) OR ...
+    por_estado = {}
+    for cita_id, estado_visto in vistas.items():
+        if estado_visto is None or estado_visto in origenes:
+            por_estado.setdefault(estado_visto, []).append(cita_id)
+    condicion = Q(pk__in=[])
+    for estado_visto, ids in por_estado.items():
+        condicion |= Q(pk__in=ids) if estado_visto is None else Q(pk__in=ids, estado=estado_visto)
+
+    cambiadas = []
+    if por_estado:
+        with transaction.atomic():
+            cambiadas = update_retornando_ids(
+                Cita.objects.filter(condicion, kinesiologo_id=kinesiologo_id, estado__in=origenes),
+                estado=nuevo_estado,
+            )
+            if cambiadas:
+                _tras_cambio_de_estado(kinesiologo_id, cambiadas, nuevo_estado)
+
+    cambiadas_set = set(cambiadas)
+    return cambiadas, [cita_id for cita_id in vistas if cita_id not in cambiadas_set]
+
+
+def _tras_cambio_de_estado(kinesiologo_id, cita_ids, nuevo_estado):
+    # Lo que harían las señales post_save de cada cita
+    registrar_cambios(kinesiologo_id, CAMBIO_CITA, cita_ids)
+    citas = list(Cita.objects.filter(pk__in=cita_ids).values_list('fecha_hora_inicio', 'fecha_hora_fin', 'paciente_id'))
+    publicar_pacientes([paciente_id for _, _, paciente_id in citas])
+    programar_recalculo(kinesiologo_id, [fecha for inicio, fin, _ in citas for fecha in fechas_de_intervalo(inicio, fin)])
+    if nuevo_estado != CITA_CANCELADA:
+        return
+
+    OcupacionHorario.objects.filter(cita_id__in=cita_ids).delete()
+    for inicio, fin, paciente_id in citas:
+        transaction.on_commit(lambda inicio=inicio, fin=fin: invalidar_dias(kinesiologo_id, inicio, fin))
+        transaction.on_commit(
+            lambda inicio=inicio, fin=fin, paciente_id=paciente_id:
+                ofrecer_cupo(kinesiologo_id, inicio, fin, excluir_paciente_id=paciente_id)
+        )
@@ -12,7 +12,10 @@ urlpatterns = [
     path('agenda/', views.agenda, name='agenda'),
     path('detalle/<int:pk>/', views.detalle_cita, name='detalle_cita'),
     path('agendar/', views.NuevaCitaView.as_view(), name='agendar_cita'), 
+    path('agendar/serie/', views.NuevaSerieView.as_view(), name='agendar_serie'),
     path('confirmacion/<int:cita_id>/', views.confirmacion_cita, name='cita_confirmada'),
+    path('lista-espera/', views.ListaEsperaView.as_view(), name='lista_espera'),
+    path('lista-espera/oferta/<int:pk>/', views.responder_oferta, name='responder_oferta'),
     
     # CANCELACIÓN DEL PACIENTE (Usando la vista renombrada)
     path('cancelar/paciente/<int:pk>/', views.cancelar_cita_paciente, name='cancelar_cita_paciente'), 
@@ -24,9 +27,21 @@ urlpatterns = [
     # Vistas del Kinesiólogo
     path('kinesiologo/dashboard/', views.KinesiologoDashboardView.as_view(), name='kinesiologo_dashboard'),
     path('kinesiologo/bloqueos/', views.gestionar_bloqueos, name='gestionar_bloqueos'),
+    path('api/kinesiologo/dashboard/', views.datos_dashboard_kinesiologo, name='api_dashboard_kinesiologo'),
+    path('api/kinesiologo/cambios/', views.feed_cambios_agenda, name='feed_cambios_agenda'),
+    
+    # Exportaciones (CSV / XLSX)
+    path('exportar/', views.exportaciones, name='exportaciones'),
+    path('exportar/<str:tipo>.<str:formato>', views.exportar_datos, name='exportar_datos'),
+    path('ocupacion/', views.reporte_ocupacion, name='reporte_ocupacion'),
+    
+    # Calendario .ics (kinesiólogo o paciente, según el token)
+    path('calendario/<str:token>.ics', views.calendario_ics, name='calendario_ics'),
+    path('calendario/regenerar/', views.regenerar_calendario, name='regenerar_calendario'),
     
     # API
     path('api/horarios/', views.obtener_horarios_disponibles, name='api_horarios'),
+    path('api/horarios/rango/', views.obtener_horarios_rango, name='api_horarios_rango'),
     
     # Dashboard (Usando la vista index de usuarios)
     path('dashboard/', index, name='dashboard'),
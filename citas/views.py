@@ -4,74 +4,100 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse
 from django.contrib import messages
 from datetime import datetime, date
-from django.db.models import Q 
-from django.http import JsonResponse
+from django.db.models import Q, Count
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
 from datetime import timedelta
 from django.utils import timezone 
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition
 from django.db import transaction 
-from django.core.exceptions import ObjectDoesNotExist 
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 
 # Importaciones de modelos y constantes necesarios
-from usuarios.models import Paciente, Kinesiologo, KINESIOLOGO
-from .forms import CitaForm, BloqueoHorarioForm
-from .models import Cita, BloqueoHorario, CITA_PENDIENTE, CITA_CANCELADA, CITA_FINALIZADA, CITA_CONFIRMADA
+from usuarios.models import Paciente, Kinesiologo
+from .forms import CitaForm, BloqueoHorarioForm, ReglaBloqueoForm, SerieSesionesForm, EsperaCupoForm, ExportacionForm, OcupacionForm
+from .models import Cita, BloqueoHorario, ReglaBloqueo, EsperaCupo, OfertaCupo, OFERTA_PENDIENTE, CITA_PENDIENTE, CITA_CANCELADA, CITA_FINALIZADA, CITA_CONFIRMADA
+from .disponibilidad import inicio_del_dia, disponibilidad_por_rango
+from .jornadas import duracion_para
+from .mapa_disponibilidad import horarios_libres_dia, ahorarios_libres_dia
+from .reservas import guardar_cita_con_reserva
+from .series import MAX_SESIONES_SERIE, generar_ocurrencias, verificar_serie, crear_serie
+from .cambios import ultimo_cambio, aultimo_cambio, alote_eventos, eventos_agenda
+from .calendario import (
+    CALENDARIO_KINESIOLOGO, CALENDARIO_PACIENTE, crear_token, acrear_token, regenerar_token, leer_token,
+    etag_agenda, ultima_modificacion, eventos_calendario,
+)
+from .lista_espera import indexar_espera, dar_de_baja_espera, ofrecer_cupo_de_cita, aceptar_oferta, rechazar_oferta
+from .transiciones import cambiar_estado_citas
+from .permisos import ACCESO_PACIENTE, ACCESO_ADMINISTRADOR, con_permiso
+from .exportaciones import EXPORTACIONES, FORMATOS, TIPOS_CONTENIDO, exportar, nombre_archivo
+from .ocupacion_diaria import AGRUPACION_SEMANA, resumen_ocupacion
+from .paginacion import Pagina, PaginadorKeyset, paginar, apaginar, es_fragmento, respuesta_fragmento
 
 # ----------------------------------------------------------------------
 # Vistas del Paciente
 # ----------------------------------------------------------------------
 
-def agenda(request):
-    """Muestra la lista de citas próximas del paciente."""
-    if not request.user.is_authenticated:
+async def agenda(request):
+    """
+    Muestra la lista de citas próximas del paciente, paginada por cursor.
+    Vista asíncrona: las consultas usan el ORM asíncrono y no retienen un hilo
+    del servidor mientras esperan a la BD.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
         return redirect('usuarios:autenticar_paciente') 
 
     hoy = timezone.now()
     
-    try:
-        paciente = Paciente.objects.get(perfil__user=request.user)
-        citas_proximas = Cita.objects.filter(
-            paciente=paciente,
-            fecha_hora_inicio__gte=hoy
-        ).order_by('fecha_hora_inicio')
-    except Paciente.DoesNotExist:
+    # El paciente viene del actor guardado en la sesión, sin consultar la BD
+    paciente = (await request.aactor()).paciente
+    if paciente is not None:
+        citas_proximas = await apaginar(
+            request,
+            Cita.objects.filter(
+                paciente=paciente,
+                fecha_hora_inicio__gte=hoy
+            ).select_related('kinesiologo__perfil'),
+            ('fecha_hora_inicio', 'id'),
+        )
+        url_calendario = request.build_absolute_uri(
+            reverse('citas:calendario_ics', args=[await acrear_token(CALENDARIO_PACIENTE, paciente.pk)])
+        )
+    else:
         messages.warning(request, "Tu perfil de Paciente no está configurado.")
-        citas_proximas = Cita.objects.none() 
+        citas_proximas = Pagina([])
+        url_calendario = None
 
     context = {
         'citas': citas_proximas,
         'hoy': hoy,
+        'url_calendario': url_calendario,
     }
-    return render(request, 'citas_agenda.html', context)
+    # El contexto de plantillas (usuario, mensajes) es síncrono: se renderiza en un hilo
+    if es_fragmento(request):
+        return await sync_to_async(respuesta_fragmento)(request, 'citas_agenda_filas.html', context, citas_proximas)
+    return await sync_to_async(render)(request, 'citas_agenda.html', context)
 
 
-def detalle_cita(request, pk):
-    """Muestra el detalle de una cita específica."""
-    cita = get_object_or_404(Cita, pk=pk)
-    
-    # Restricción de seguridad
-    if not request.user.is_superuser and cita.paciente.perfil.user != request.user:
-          messages.error(request, "Acceso denegado: Esta no es su cita.")
-          return redirect(reverse('citas:agenda'))
-          
+@login_required
+@con_permiso(Cita.objects.select_related('paciente__perfil', 'kinesiologo__perfil'), [ACCESO_PACIENTE, ACCESO_ADMINISTRADOR])
+def detalle_cita(request, cita):
+    """Muestra el detalle de una cita específica (solo a su paciente o a un superusuario)."""
     return render(request, 'detalle.html', {'cita': cita})
 
 
 @login_required
 @transaction.atomic 
-def cancelar_cita_paciente(request, pk):
+@con_permiso(Cita.objects.all(), [ACCESO_PACIENTE, ACCESO_ADMINISTRADOR])
+def cancelar_cita_paciente(request, cita):
     """
     Permite al Paciente logueado cancelar su propia cita.
     Esta función es accedida por POST desde detalle.html.
     """
-    cita = get_object_or_404(Cita, pk=pk)
-    
-    # 1. Seguridad: Verificar propiedad del paciente
-    if not request.user.is_superuser and cita.paciente.perfil.user != request.user:
-        messages.error(request, "Acceso denegado: No puedes cancelar la cita de otro paciente.")
-        return redirect(reverse('citas:agenda'))
-        
-    # 2. Lógica de cancelación
+    # Lógica de cancelación (la propiedad de la cita ya se verificó al cargarla)
     if request.method == 'POST':
         try:
             # Solo permitir cancelar si la cita no está Finalizada o ya Cancelada
@@ -81,6 +107,8 @@ def cancelar_cita_paciente(request, pk):
                 
             cita.estado = CITA_CANCELADA 
             cita.save()
+            # El horario liberado se ofrece a la lista de espera al confirmar la transacción
+            ofrecer_cupo_de_cita(cita)
             messages.success(request, f"Cita #{cita.pk} cancelada con éxito. Sentimos el inconveniente.")
             
         except Exception as e:
@@ -94,14 +122,10 @@ def cancelar_cita_paciente(request, pk):
     return redirect(reverse('citas:agenda'))
 
 
-def confirmacion_cita(request, cita_id):
+@login_required
+@con_permiso(Cita.objects.select_related('kinesiologo__perfil'), [ACCESO_PACIENTE, ACCESO_ADMINISTRADOR], parametro='cita_id')
+def confirmacion_cita(request, cita):
     """Muestra los detalles de la cita agendada para la confirmación."""
-    cita = get_object_or_404(Cita, pk=cita_id)
-    
-    if not request.user.is_superuser and cita.paciente.perfil.user != request.user:
-          messages.error(request, "Acceso denegado a la confirmación.")
-          return redirect(reverse('citas:agenda'))
-          
     context = {
         'cita': cita
     }
@@ -129,7 +153,9 @@ class NuevaCitaView(LoginRequiredMixin, View):
         if form.is_valid():
             try:
                 
-                paciente = Paciente.objects.get(perfil__user=request.user)
+                paciente = request.actor.paciente
+                if paciente is None:
+                    raise Paciente.DoesNotExist
                 
                 cita = form.save(commit=False)
                 cita.paciente = paciente
@@ -137,10 +163,13 @@ class NuevaCitaView(LoginRequiredMixin, View):
                 # Asignar estado PENDIENTE por defecto
                 cita.estado = CITA_PENDIENTE
                 
-                cita.save()
+                # Guarda la cita y reserva sus gránulos en la misma transacción
+                guardar_cita_con_reserva(cita)
                 
                 return redirect(reverse('citas:cita_confirmada', kwargs={'cita_id': cita.pk}))
                 
+            except ValidationError as e:
+                form.add_error(None, e)
             except Paciente.DoesNotExist:
                 messages.error(request, "Error de perfil. Solo los usuarios con perfil de Paciente pueden agendar citas.")
                 
@@ -156,12 +185,160 @@ class NuevaCitaView(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
 
 
-HORA_INICIO_JORNADA = 9 
-HORA_FIN_JORNADA = 18 
-DURACION_CITA = 60 
+class NuevaSerieView(LoginRequiredMixin, View):
+    """
+    Agenda una serie de sesiones de una sola vez: verifica la disponibilidad
+    de todas las ocurrencias en una pasada, informa los conflictos con fechas
+    alternativas y crea la serie completa en una transacción.
+    """
+    
+    template_name = 'citas_serie.html'
+    
+    def get(self, request):
+        form = SerieSesionesForm()
+        return render(request, self.template_name, {'form': form})
+    
+    def post(self, request):
+        form = SerieSesionesForm(request.POST)
+        context = {'form': form}
+        
+        if not form.is_valid():
+            return render(request, self.template_name, context)
+        
+        paciente = request.actor.paciente
+        if paciente is None:
+            messages.error(request, "Error de perfil. Solo los usuarios con perfil de Paciente pueden agendar citas.")
+            return redirect(reverse('citas:agenda'))
+        
+        datos = form.cleaned_data
+        kine = datos['kinesiologo']
+        ocurrencias = generar_ocurrencias(
+            datos['fecha_inicio'], datos['dias_semana'], datos['hora'],
+            cantidad=datos['cantidad'], fecha_fin=datos['fecha_fin'],
+        )
+        if not ocurrencias:
+            form.add_error(None, "La recurrencia indicada no genera ninguna sesión.")
+            return render(request, self.template_name, context)
+        if datos['fecha_fin'] and not datos['cantidad'] and len(ocurrencias) >= MAX_SESIONES_SERIE:
+            messages.warning(request, f"La serie se limitó a {MAX_SESIONES_SERIE} sesiones.")
+        
+        # La duración de cada sesión es la del turno del kinesiólogo en que cae la serie
+        duracion = duracion_para(kine.pk, ocurrencias[0])
+        disponibles, conflictos = verificar_serie(kine.pk, ocurrencias, duracion)
+        
+        if conflictos and not datos['omitir_conflictos']:
+            context.update({'conflictos': conflictos, 'disponibles': disponibles})
+            return render(request, self.template_name, context)
+        
+        if not disponibles:
+            form.add_error(None, "Ninguna de las sesiones de la serie está disponible.")
+            context['conflictos'] = conflictos
+            return render(request, self.template_name, context)
+        
+        try:
+            citas = crear_serie(kine, paciente, disponibles, duracion, datos['motivo'] or None)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return render(request, self.template_name, context)
+        
+        messages.success(request, f"Se agendaron {len(citas)} sesiones con {kine}.")
+        if conflictos:
+            messages.warning(request, f"Se omitieron {len(conflictos)} sesiones por conflicto de horario.")
+        return redirect(reverse('citas:agenda'))
+
 
-def obtener_horarios_disponibles(request):
-    """Retorna una lista JSON de las horas libres para un kinesiólogo y fecha dados."""
+class ListaEsperaView(LoginRequiredMixin, View):
+    """
+    Inscripción del Paciente en la lista de espera y respuesta a los cupos
+    liberados que se le ofrecen.
+    """
+    
+    template_name = 'citas_lista_espera.html'
+    
+    def get_paciente(self, request):
+        return request.actor.paciente
+    
+    def render_pagina(self, request, paciente, form):
+        context = {
+            'form': form,
+            'esperas': EsperaCupo.objects.filter(paciente=paciente, activa=True).prefetch_related('kinesiologos__perfil'),
+            'ofertas': OfertaCupo.objects.filter(
+                espera__paciente=paciente,
+                estado=OFERTA_PENDIENTE,
+                expira_en__gt=timezone.now(),
+            ).select_related('kinesiologo__perfil').order_by('fecha_hora_inicio'),
+        }
+        return render(request, self.template_name, context)
+    
+    def get(self, request):
+        paciente = self.get_paciente(request)
+        if not paciente:
+            messages.error(request, "Error de perfil. Solo los usuarios con perfil de Paciente pueden usar la lista de espera.")
+            return redirect(reverse('citas:agenda'))
+        return self.render_pagina(request, paciente, EsperaCupoForm())
+    
+    def post(self, request):
+        paciente = self.get_paciente(request)
+        if not paciente:
+            messages.error(request, "Error de perfil. Solo los usuarios con perfil de Paciente pueden usar la lista de espera.")
+            return redirect(reverse('citas:agenda'))
+        
+        if 'baja_espera' in request.POST:
+            espera = EsperaCupo.objects.filter(pk=request.POST.get('espera_pk'), paciente=paciente, activa=True).first()
+            if espera:
+                dar_de_baja_espera(espera)
+                messages.success(request, "Saliste de la lista de espera.")
+            else:
+                messages.error(request, "La inscripción no existe o no tienes permiso para modificarla.")
+            return redirect(reverse('citas:lista_espera'))
+        
+        form = EsperaCupoForm(request.POST)
+        if not form.is_valid():
+            return self.render_pagina(request, paciente, form)
+        
+        with transaction.atomic():
+            espera = form.save(commit=False)
+            espera.paciente = paciente
+            espera.save()
+            form.save_m2m()
+            indexar_espera(espera)
+        
+        messages.success(request, "Quedaste inscrito en la lista de espera. Te ofreceremos el primer cupo que se libere.")
+        return redirect(reverse('citas:lista_espera'))
+
+
+@login_required
+def responder_oferta(request, pk):
+    """Acepta o rechaza (por POST) un cupo liberado ofrecido al paciente."""
+    oferta = get_object_or_404(OfertaCupo.objects.select_related('espera__paciente__perfil'), pk=pk)
+    
+    if oferta.espera.paciente.perfil.user != request.user:
+        messages.error(request, "Acceso denegado: Esta oferta no es para ti.")
+        return redirect(reverse('citas:lista_espera'))
+    if request.method != 'POST':
+        messages.warning(request, "Acción no permitida.")
+        return redirect(reverse('citas:lista_espera'))
+    
+    if request.POST.get('accion') == 'aceptar':
+        try:
+            cita = aceptar_oferta(oferta)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect(reverse('citas:lista_espera'))
+        return redirect(reverse('citas:cita_confirmada', kwargs={'cita_id': cita.pk}))
+    
+    if rechazar_oferta(oferta):
+        messages.info(request, "Rechazaste el cupo ofrecido. Sigues en la lista de espera.")
+    else:
+        messages.warning(request, "La oferta ya no está vigente.")
+    return redirect(reverse('citas:lista_espera'))
+
+
+async def obtener_horarios_disponibles(request):
+    """
+    Retorna una lista JSON de las horas libres para un kinesiólogo y fecha dados.
+    Vista asíncrona: el selector de fecha no queda en cola detrás de páginas lentas.
+    """
     kinesiologo_id = request.GET.get('kinesiologo_id')
     fecha_str = request.GET.get('fecha')
 
@@ -169,141 +346,353 @@ def obtener_horarios_disponibles(request):
         return JsonResponse({'error': 'Faltan parámetros de Kinesiólogo o Fecha.'}, status=400)
 
     try:
-        from datetime import datetime 
-        
+        kinesiologo_id = int(kinesiologo_id)
         fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-        
-        inicio_dia = timezone.make_aware(datetime.combine(fecha_obj, datetime.min.time().replace(hour=HORA_INICIO_JORNADA)))
-        fin_dia = timezone.make_aware(datetime.combine(fecha_obj, datetime.min.time().replace(hour=HORA_FIN_JORNADA)))
-        
-        # Citas agendadas
-        citas_agendadas = Cita.objects.filter(
-            kinesiologo_id=kinesiologo_id,
-            fecha_hora_inicio__date=fecha_obj
-        ).values_list('fecha_hora_inicio', 'duracion_minutos')
-        
-        # Bloqueos de horario
-        bloqueos = BloqueoHorario.objects.filter(
-            kinesiologo_id=kinesiologo_id,
-            fecha_hora_inicio__date=fecha_obj
-        ).values_list('fecha_hora_inicio', 'fecha_hora_fin')
+    except ValueError:
+        return JsonResponse({'error': 'Identificador de Kinesiólogo o fecha inválidos.'}, status=400)
 
-        
-        horarios_posibles = []
-        hora_actual = inicio_dia
-        
-        while hora_actual < fin_dia:
-            es_disponible = True
-            
-            # 1. Verificar colisión con citas agendadas
-            for cita_inicio, duracion in citas_agendadas:
-                cita_fin = cita_inicio + timedelta(minutes=duracion)
-                if hora_actual < cita_fin and (hora_actual + timedelta(minutes=DURACION_CITA)) > cita_inicio:
-                    es_disponible = False
-                    break
-                
-            # 2. Verificar colisión con bloqueos
-            if es_disponible:
-                for bloqueo_inicio, bloqueo_fin in bloqueos:
-                    if hora_actual < bloqueo_fin and (hora_actual + timedelta(minutes=DURACION_CITA)) > bloqueo_inicio:
-                        es_disponible = False
-                        break
-                
-            
-            if es_disponible and (hora_actual + timedelta(minutes=DURACION_CITA)) <= fin_dia:
-                horarios_posibles.append({
-                    'hora': hora_actual.strftime('%H:%M'),
-                    'valor': hora_actual.isoformat(), 
-                })
-            
-            hora_actual += timedelta(minutes=DURACION_CITA)
+    try:
+        # El mapa de bits del día sale de la caché; solo se consulta la BD si no estaba construido
+        horarios_posibles = [
+            {
+                'hora': hora.strftime('%H:%M'),
+                'valor': hora.isoformat(),
+            }
+            for hora in await ahorarios_libres_dia(kinesiologo_id, fecha_obj)
+        ]
             
         return JsonResponse({'horarios': horarios_posibles})
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+MAX_DIAS_RANGO_HORARIOS = 31
+
+def obtener_horarios_rango(request):
+    """
+    Retorna en una sola respuesta JSON las horas libres de varios kinesiólogos
+    para cada día de un rango de fechas (tablero semanal de recepción).
+    Se filtra por una lista de `kinesiologo_id` o por `especialidad`; sin filtros se incluyen todos.
+    """
+    fecha_desde_str = request.GET.get('fecha_desde')
+    fecha_hasta_str = request.GET.get('fecha_hasta')
+    especialidad = request.GET.get('especialidad')
+    # Acepta tanto ?kinesiologo_id=1&kinesiologo_id=2 como ?kinesiologo_id=1,2
+    kinesiologo_ids = [
+        kine_id.strip()
+        for valor in request.GET.getlist('kinesiologo_id')
+        for kine_id in valor.split(',')
+        if kine_id.strip()
+    ]
+
+    if not fecha_desde_str or not fecha_hasta_str:
+        return JsonResponse({'error': 'Faltan parámetros de Fecha desde o Fecha hasta.'}, status=400)
+
+    try:
+        fecha_desde = datetime.strptime(fecha_desde_str, '%Y-%m-%d').date()
+        fecha_hasta = datetime.strptime(fecha_hasta_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido (se espera AAAA-MM-DD).'}, status=400)
+
+    if fecha_hasta < fecha_desde:
+        return JsonResponse({'error': 'La fecha hasta debe ser igual o posterior a la fecha desde.'}, status=400)
+    if (fecha_hasta - fecha_desde).days >= MAX_DIAS_RANGO_HORARIOS:
+        return JsonResponse({'error': f'El rango no puede superar {MAX_DIAS_RANGO_HORARIOS} días.'}, status=400)
+
+    try:
+        kinesiologos = Kinesiologo.objects.select_related('perfil').order_by('perfil__apellido', 'perfil__nombre')
+        if kinesiologo_ids:
+            kinesiologos = kinesiologos.filter(pk__in=kinesiologo_ids)
+        if especialidad:
+            kinesiologos = kinesiologos.filter(especialidad__iexact=especialidad)
+        kinesiologos = list(kinesiologos)
+
+        # Cuatro consultas más para todas las citas, bloqueos, reglas y cupos retenidos del rango, sin importar N ni D
+        # (las plantillas de horario salen de la caché)
+        disponibilidad = disponibilidad_por_rango([kine.pk for kine in kinesiologos], fecha_desde, fecha_hasta)
+
+        resultado = [
+            {
+                'id': kine.pk,
+                'nombre': f"{kine.perfil.nombre} {kine.perfil.apellido}",
+                'especialidad': kine.especialidad,
+                'dias': {
+                    dia.isoformat(): [hora.strftime('%H:%M') for hora in horarios]
+                    for dia, horarios in disponibilidad[kine.pk].items()
+                },
+            }
+            for kine in kinesiologos
+        ]
+
+        return JsonResponse({
+            'fecha_desde': fecha_desde.isoformat(),
+            'fecha_hasta': fecha_hasta.isoformat(),
+            'kinesiologos': resultado,
+        })
+
+    except ValueError:
+        return JsonResponse({'error': 'Identificador de Kinesiólogo inválido.'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 # ----------------------------------------------------------------------
 # Vistas del Kinesiólogo
 # ----------------------------------------------------------------------
 
+MAX_CITAS_FINALIZADAS_DASHBOARD = 10
+
+# Acciones del dashboard que cambian el estado de una cita o de un lote de citas
+ACCIONES_CITA = {'confirmar': CITA_CONFIRMADA, 'cancelar': CITA_CANCELADA}
+ACCIONES_LOTE = {'confirmar_lote': CITA_CONFIRMADA, 'cancelar_lote': CITA_CANCELADA}
+MENSAJES_TRANSICION = {CITA_CONFIRMADA: 'confirmada', CITA_CANCELADA: 'cancelada'}
+
 class KinesiologoDashboardView(LoginRequiredMixin, View):
+    """
+    Dashboard del Kinesiólogo con un número fijo de consultas, sin importar
+    cuántas citas tenga: una para las citas (una página de próximas y las
+    últimas finalizadas, con paciente, perfil y nota) y una de agregados
+    condicionales para los conteos por estado. Las citas próximas y los
+    bloqueos se cargan por páginas ("cargar más").
+    """
     template_name = 'kine_dash.html' 
     
-    def get_kinesiologo(self, user):
-        """Intenta obtener el objeto Kinesiologo asociado al User."""
-        try:
-            return Kinesiologo.objects.get(perfil__user=user)
-        except Kinesiologo.DoesNotExist:
-            return None
+    def get_kinesiologo(self, request):
+        """El Kinesiologo (con su perfil) del actor de la petición, o None."""
+        return request.actor.kinesiologo
 
     def get(self, request):
-        if request.user.perfil.rol != KINESIOLOGO:
+        # Perfil y Kinesiólogo vienen del actor de la sesión: sin consultas aparte
+        kine = self.get_kinesiologo(request)
+        if kine is None and not request.actor.es_kinesiologo:
             messages.error(request, "Acceso no autorizado al dashboard de Kinesiólogo.")
             return redirect('index') 
             
-        kine = self.get_kinesiologo(request.user)
         if not kine:
             messages.error(request, "Perfil de Kinesiólogo no encontrado.")
             return redirect('index')
             
         hoy = timezone.localdate()
-        
-        # OBTENER CITAS: El cambio clave es excluir solo las FINALIZADAS
-        # Esto permite que las citas CANCELADAS aparezcan en la lista del Kine.
-        citas_proximas = Cita.objects.filter(
+        desde = inicio_del_dia(hoy)
+
+        # Citas próximas y bloqueos se paginan por cursor: el costo no crece con la agenda
+        paginador_citas = PaginadorKeyset(request, ('fecha_hora_inicio', 'id'))
+        paginador_bloqueos = PaginadorKeyset(request, ('fecha_hora_inicio', 'id'), parametro='cursor_bloqueos')
+
+        bloqueos_futuros = BloqueoHorario.objects.filter(kinesiologo=kine, fecha_hora_fin__gt=desde)
+
+        if es_fragmento(request, 'lista-bloqueos'):
+            bloqueos = paginador_bloqueos.pagina(paginador_bloqueos.consulta(bloqueos_futuros))
+            return respuesta_fragmento(request, 'kine_dash_filas_bloqueos.html', {'bloqueos': bloqueos}, bloqueos)
+
+        # Página de citas próximas (todas menos las FINALIZADAS, así las CANCELADAS
+        # aparecen en la lista del Kine), como subconsulta de a lo más una página + 1
+        pagina_proximas = paginador_citas.consulta(
+            Cita.objects.filter(kinesiologo=kine, fecha_hora_inicio__gte=desde).exclude(estado=CITA_FINALIZADA).values('pk')
+        )
+        if es_fragmento(request, 'lista-citas'):
+            citas_proximas = paginador_citas.pagina(
+                Cita.objects.filter(pk__in=pagina_proximas).select_related('paciente__perfil')
+            )
+            return respuesta_fragmento(request, 'kine_dash_filas_citas.html', {'citas_proximas': citas_proximas}, citas_proximas)
+
+        # UNA CONSULTA DE CITAS: la página de próximas y las últimas finalizadas con su nota.
+        # Pacientes, perfiles y notas vienen en el mismo JOIN: sin consultas por fila.
+        ultimas_finalizadas = Cita.objects.filter(
             kinesiologo=kine,
-            fecha_hora_inicio__date__gte=hoy
-        ).exclude(
-            # ✅ CORRECCIÓN: Usamos CITA_FINALIZADA, NO CITA_CANCELADA.
-            estado=CITA_FINALIZADA 
-        ).order_by('fecha_hora_inicio')
+            estado=CITA_FINALIZADA
+        ).order_by('-fecha_hora_inicio').values('pk')[:MAX_CITAS_FINALIZADAS_DASHBOARD]
 
-        bloqueos = BloqueoHorario.objects.filter(
-            kinesiologo=kine,
-            fecha_hora_inicio__date__gte=hoy
+        citas = Cita.objects.filter(
+            Q(pk__in=pagina_proximas) | Q(pk__in=ultimas_finalizadas)
+        ).select_related(
+            'paciente__perfil', 'nota_clinica'
         ).order_by('fecha_hora_inicio')
 
+        proximas, citas_finalizadas = [], []
+        for cita in citas:
+            (citas_finalizadas if cita.estado == CITA_FINALIZADA else proximas).append(cita)
+        citas_finalizadas.reverse()
+        citas_proximas = paginador_citas.pagina(proximas)
+
+        # UNA CONSULTA DE CONTEOS: agregados condicionales en una sola pasada
+        resumen = Cita.objects.filter(kinesiologo=kine).aggregate(
+            pendientes=Count('pk', filter=Q(estado=CITA_PENDIENTE, fecha_hora_inicio__gte=desde)),
+            confirmadas=Count('pk', filter=Q(estado=CITA_CONFIRMADA, fecha_hora_inicio__gte=desde)),
+            canceladas=Count('pk', filter=Q(estado=CITA_CANCELADA, fecha_hora_inicio__gte=desde)),
+            finalizadas=Count('pk', filter=Q(estado=CITA_FINALIZADA)),
+        )
+
+        bloqueos = paginador_bloqueos.pagina(paginador_bloqueos.consulta(bloqueos_futuros))
+
+        reglas_bloqueo = ReglaBloqueo.objects.filter(kinesiologo=kine).filter(
+            Q(vigente_hasta__isnull=True) | Q(vigente_hasta__gte=hoy)
+        )
+
         context = {
             'citas_proximas': citas_proximas,
+            'citas_finalizadas': citas_finalizadas,
+            'resumen': resumen,
             'bloqueos': bloqueos,
+            'reglas_bloqueo': reglas_bloqueo,
             'kinesiologo': kine,
             'fecha_hoy': hoy,
+            'horarios_libres_hoy': horarios_libres_dia(kine.pk, hoy),
+            # Cursor desde el que el feed en vivo envía los cambios posteriores a este render
+            'ultimo_cambio': ultimo_cambio(kine.pk),
+            'url_calendario': request.build_absolute_uri(
+                reverse('citas:calendario_ics', args=[crear_token(CALENDARIO_KINESIOLOGO, kine.pk)])
+            ),
         }
         return render(request, self.template_name, context)
 
     # Lógica POST para cambiar estado de citas (Confirmar, Finalizar, Cancelar)
     def post(self, request):
-        cita_pk = request.POST.get('cita_pk')
         accion = request.POST.get('accion')
-        
-        cita = get_object_or_404(Cita, pk=cita_pk)
-        
-        if cita.kinesiologo.perfil.user != request.user:
-            messages.error(request, "No tienes permiso para modificar esta cita.")
-            return redirect(reverse('citas:kinesiologo_dashboard'))
 
-        try:
-            if accion == 'confirmar':
-                cita.estado = CITA_CONFIRMADA
-                messages.success(request, f"Cita con {cita.paciente.nombre} confirmada.")
-            elif accion == 'cancelar':
-                cita.estado = CITA_CANCELADA
-                messages.warning(request, f"Cita con {cita.paciente.nombre} cancelada.")
-            elif accion == 'finalizar' and cita.estado != CITA_FINALIZADA:
-                # Redirigir a la vista de Nota Clínica para que se complete el flujo
-                return redirect(reverse('evaluaciones:crear_nota_clinica', kwargs={'cita_pk': cita.pk}))
+        if accion in ACCIONES_LOTE:
+            return self.post_lote(request, ACCIONES_LOTE[accion])
 
-            # Guardar el estado si fue confirmar o cancelar
-            if accion in ['confirmar', 'cancelar']:
-                cita.save()
+        cita_pk = request.POST.get('cita_pk')
+        if accion == 'finalizar':
+            cita = get_object_or_404(Cita, pk=cita_pk, kinesiologo__perfil__user=request.user)
+            if cita.estado != CITA_FINALIZADA:
+                # Redirigir a la vista de Nota Clínica para que se complete el flujo
+                return redirect(reverse('evaluaciones:crear_o_editar_nota_clinica', kwargs={'cita_pk': cita.pk}))
+        elif accion in ACCIONES_CITA and cita_pk and cita_pk.isdigit():
+            # Un UPDATE filtrado por dueño: no se carga la cita ni su kinesiólogo para validar el permiso
+            kine = self.get_kinesiologo(request)
+            cambiadas, _ = cambiar_estado_citas(kine.pk if kine else None, {int(cita_pk): None}, ACCIONES_CITA[accion])
+            if cambiadas:
+                messages.success(request, f"Cita #{cita_pk} {MENSAJES_TRANSICION[ACCIONES_CITA[accion]]}.")
+            else:
+                messages.error(request, "No tienes permiso para modificar esta cita o su estado ya no lo permite.")
 
-        except Exception as e:
-            messages.error(request, f"Error al procesar la acción: {e}")
+        return redirect(reverse('citas:kinesiologo_dashboard'))
 
+    def post_lote(self, request, nuevo_estado):
+        """
+        Confirma o cancela de una vez las citas marcadas en el dashboard. Cada
+        casilla envía "id:estado" con el estado que se veía al marcarla: las
+        que cambiaron entretanto se omiten y se informan.
+        """
+        vistas = {}
+        for valor in request.POST.getlist('citas'):
+            cita_id, _, estado_visto = valor.partition(':')
+            if cita_id.isdigit():
+                vistas[int(cita_id)] = estado_visto or None
+
+        kine = self.get_kinesiologo(request)
+        if kine is None or not vistas:
+            cambiadas, omitidas = [], list(vistas)
+        else:
+            cambiadas, omitidas = cambiar_estado_citas(kine.pk, vistas, nuevo_estado)
+
+        if es_fragmento(request):
+            return JsonResponse({'estado': nuevo_estado, 'cambiadas': cambiadas, 'omitidas': omitidas})
+
+        if cambiadas:
+            messages.success(request, f"{len(cambiadas)} cita(s) {MENSAJES_TRANSICION[nuevo_estado]}(s).")
+        if omitidas:
+            messages.warning(
+                request,
+                f"{len(omitidas)} cita(s) no se modificaron: cambiaron de estado o no te pertenecen "
+                f"(#{', #'.join(str(cita_id) for cita_id in omitidas)})."
+            )
+        if not vistas:
+            messages.error(request, "Selecciona al menos una cita.")
         return redirect(reverse('citas:kinesiologo_dashboard'))
 
 
+MAX_CITAS_DATOS_DASHBOARD = 50
+
+async def datos_dashboard_kinesiologo(request):
+    """
+    Datos del dashboard del Kinesiólogo en JSON (citas próximas, pendientes,
+    bloqueos y horarios libres de hoy), servidos con el ORM asíncrono.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Debes iniciar sesión.'}, status=401)
+
+    kine = (await request.aactor()).kinesiologo
+    if kine is None:
+        return JsonResponse({'error': 'Perfil de Kinesiólogo no encontrado.'}, status=403)
+
+    hoy = timezone.localdate()
+    desde = inicio_del_dia(hoy)
+
+    citas = Cita.objects.filter(
+        kinesiologo=kine,
+        fecha_hora_inicio__gte=desde
+    ).exclude(
+        estado=CITA_FINALIZADA
+    ).select_related('paciente').order_by('fecha_hora_inicio')[:MAX_CITAS_DATOS_DASHBOARD]
+
+    bloqueos = BloqueoHorario.objects.filter(
+        kinesiologo=kine,
+        fecha_hora_fin__gt=desde
+    ).order_by('fecha_hora_inicio')
+
+    return JsonResponse({
+        'fecha': hoy.isoformat(),
+        'citas_pendientes': await Cita.objects.filter(kinesiologo=kine, estado=CITA_PENDIENTE, fecha_hora_inicio__gte=desde).acount(),
+        'citas': [
+            {
+                'id': cita.pk,
+                'inicio': timezone.localtime(cita.fecha_hora_inicio).isoformat(),
+                'fin': timezone.localtime(cita.fecha_hora_fin).isoformat(),
+                'estado': cita.estado,
+                'paciente': f"{cita.paciente.nombre} {cita.paciente.apellido}",
+                'motivo': cita.motivo or '',
+            }
+            async for cita in citas
+        ],
+        'bloqueos': [
+            {
+                'id': bloqueo.pk,
+                'inicio': timezone.localtime(bloqueo.fecha_hora_inicio).isoformat(),
+                'fin': timezone.localtime(bloqueo.fecha_hora_fin).isoformat(),
+                'motivo': bloqueo.motivo or '',
+            }
+            async for bloqueo in bloqueos
+        ],
+        'horarios_libres_hoy': [hora.strftime('%H:%M') for hora in await ahorarios_libres_dia(kine.pk, hoy)],
+    })
+
+
+async def feed_cambios_agenda(request):
+    """
+    Feed en vivo (Server-Sent Events) de los cambios de citas y bloqueos del
+    Kinesiólogo. El dashboard lo usa para actualizar solo las filas que cambian.
+    Se reanuda desde el encabezado Last-Event-ID o el parámetro `desde`.
+    Con el perfil ASGI la conexión queda abierta; con WSGI responde de inmediato
+    con los cambios pendientes y el navegador vuelve a preguntar según `retry`.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Debes iniciar sesión.'}, status=401)
+
+    kine = (await request.aactor()).kinesiologo
+    if kine is None:
+        return JsonResponse({'error': 'Perfil de Kinesiólogo no encontrado.'}, status=403)
+
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    try:
+        cursor = int(cursor)
+    except (TypeError, ValueError):
+        cursor = await aultimo_cambio(kine.pk)
+
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(eventos_agenda(kine.pk, cursor), content_type='text/event-stream')
+    else:
+        # Bajo WSGI una conexión abierta retendría un worker síncrono: se responde sin esperar
+        response = HttpResponse(await alote_eventos(kine.pk, cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Evita que un proxy (nginx) acumule los eventos antes de enviarlos
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # citas/views.py (función gestionar_bloqueos)
 
 @login_required
@@ -311,21 +700,19 @@ class KinesiologoDashboardView(LoginRequiredMixin, View):
 def gestionar_bloqueos(request):
     """Permite al Kinesiólogo añadir o eliminar bloques de horario."""
     
-    # 1. Validación de Rol
-    if request.user.perfil.rol != KINESIOLOGO:
+    # 1. Validación de Rol (rol y Kinesiólogo vienen del actor de la sesión)
+    if not request.actor.es_kinesiologo:
         messages.error(request, "Acceso no autorizado.")
         return redirect('index')
 
     # 2. OBTENCIÓN SEGURA DEL KINESIOLOGO
-    try:
-        kine = Kinesiologo.objects.get(perfil__user=request.user)
-    except Kinesiologo.DoesNotExist:
+    kine = request.actor.kinesiologo
+    if kine is None:
         messages.error(request, "Error de perfil: Tu cuenta no está asociada a un perfil de Kinesiólogo válido.")
         return redirect(reverse('citas:kinesiologo_dashboard')) 
 
     # --- Inicialización de variables para el GET ---
     form = BloqueoHorarioForm() 
-    bloqueos_futuros = BloqueoHorario.objects.none() 
 
     # ----------------------------------------------------------------------
     # 3. MANEJO DE POST (CREAR O ELIMINAR)
@@ -353,6 +740,31 @@ def gestionar_bloqueos(request):
             else:
                 messages.error(request, "Error en el formulario de bloqueo. Por favor, revisa las fechas y horas.")
                 
+        elif 'add_regla' in request.POST:
+            regla_form = ReglaBloqueoForm(request.POST)
+            if regla_form.is_valid():
+                regla = regla_form.save(commit=False)
+                regla.kinesiologo = kine
+                
+                # Validación de traslape con citas futuras dentro de la vigencia
+                conflictos = regla.citas_en_conflicto()
+                if conflictos:
+                    primera = timezone.localtime(conflictos[0].fecha_hora_inicio)
+                    messages.error(request, f"La regla se traslapa con {len(conflictos)} cita(s) agendada(s), la primera el {primera.strftime('%d-%m-%Y %H:%M')}.")
+                else:
+                    regla.save()
+                    messages.success(request, "Bloqueo recurrente creado con éxito.")
+            else:
+                messages.error(request, "Error en el formulario de bloqueo recurrente. Por favor, revisa los días, horas y vigencia.")
+                
+        elif 'delete_regla' in request.POST:
+            regla_pk = request.POST.get('regla_pk')
+            eliminadas, _ = ReglaBloqueo.objects.filter(pk=regla_pk, kinesiologo=kine).delete() if regla_pk else (0, None)
+            if eliminadas:
+                messages.success(request, "Bloqueo recurrente eliminado.")
+            else:
+                messages.error(request, "El bloqueo recurrente no existe o no tienes permiso para eliminarlo.")
+                
         elif 'delete_bloqueo' in request.POST:
             bloqueo_pk = request.POST.get('bloqueo_pk')
             if bloqueo_pk: 
@@ -376,21 +788,200 @@ def gestionar_bloqueos(request):
     hoy = timezone.localdate()
     
     try:
-        # Filtra los bloques para el Kinesiólogo obtenido
-        bloqueos_futuros = BloqueoHorario.objects.filter(
-            kinesiologo=kine,
-            fecha_hora_inicio__date__gte=hoy
-        ).order_by('fecha_hora_inicio')
+        # Filtra los bloques para el Kinesiólogo obtenido, una página a la vez
+        bloqueos_futuros = paginar(
+            request,
+            BloqueoHorario.objects.filter(
+                kinesiologo=kine,
+                fecha_hora_fin__gt=inicio_del_dia(hoy)
+            ),
+            ('fecha_hora_inicio', 'id'),
+        )
         
     except ObjectDoesNotExist:
         messages.error(request, "Error de datos: Se encontraron bloques con referencias a Kinesiólogos eliminados. Contacta a soporte.")
-        bloqueos_futuros = BloqueoHorario.objects.none()
+        bloqueos_futuros = Pagina([])
     except Exception as e:
         messages.error(request, f"Error inesperado al listar bloqueos: {e}")
-        bloqueos_futuros = BloqueoHorario.objects.none()
+        bloqueos_futuros = Pagina([])
+
+    if es_fragmento(request):
+        return respuesta_fragmento(request, 'kine_bloq_filas.html', {'bloqueos_futuros': bloqueos_futuros}, bloqueos_futuros)
+
+    reglas = ReglaBloqueo.objects.filter(kinesiologo=kine).filter(
+        Q(vigente_hasta__isnull=True) | Q(vigente_hasta__gte=hoy)
+    )
 
     context = {
         'form': form,
-        'bloqueos_futuros': bloqueos_futuros
+        'regla_form': ReglaBloqueoForm(initial={'vigente_desde': hoy}),
+        'bloqueos_futuros': bloqueos_futuros,
+        'reglas': reglas,
     }
-    return render(request, 'kine_bloq.html', context)
\ No newline at end of file
+    return render(request, 'kine_bloq.html', context)
+
+
+# ----------------------------------------------------------------------
+# Feed iCalendar (.ics) para aplicaciones de calendario
+# ----------------------------------------------------------------------
+
+def _etag_calendario(request, token):
+    datos = leer_token(token)
+    return etag_agenda(*datos) if datos else None
+
+
+def _modificacion_calendario(request, token):
+    datos = leer_token(token)
+    return ultima_modificacion(*datos) if datos else None
+
+
+@login_required
+def regenerar_calendario(request):
+    """Genera (por POST) un nuevo enlace al calendario del usuario; el anterior deja de funcionar."""
+    actor = request.actor
+    if actor.kinesiologo is not None:
+        tipo, propietario_id, destino = CALENDARIO_KINESIOLOGO, actor.kinesiologo.pk, 'citas:kinesiologo_dashboard'
+    elif actor.paciente is not None:
+        tipo, propietario_id, destino = CALENDARIO_PACIENTE, actor.paciente.pk, 'citas:agenda'
+    else:
+        messages.error(request, "Tu perfil no tiene un calendario asociado.")
+        return redirect('index')
+    if request.method != 'POST':
+        messages.warning(request, "Acción no permitida.")
+        return redirect(reverse(destino))
+
+    regenerar_token(tipo, propietario_id)
+    messages.success(request, "Generamos un nuevo enlace al calendario. El anterior ya no funciona.")
+    return redirect(reverse(destino))
+
+
+@condition(etag_func=_etag_calendario, last_modified_func=_modificacion_calendario)
+def calendario_ics(request, token):
+    """
+    Agenda del kinesiólogo o del paciente en formato iCalendar, autenticada
+    por el token de la URL. Si la versión de la agenda no cambió, el
+    decorador `condition` responde 304 antes de llegar aquí (sin consultas).
+    """
+    datos = leer_token(token)
+    if datos is None:
+        raise Http404("Calendario no encontrado.")
+    tipo, propietario_id = datos
+
+    if tipo == CALENDARIO_KINESIOLOGO:
+        kine = get_object_or_404(Kinesiologo.objects.select_related('perfil'), pk=propietario_id)
+        nombre = f"Agenda de {kine.perfil.nombre} {kine.perfil.apellido}"
+    else:
+        paciente = get_object_or_404(Paciente, pk=propietario_id)
+        nombre = f"Citas de kinesiología de {paciente.nombre} {paciente.apellido}"
+
+    respuesta = StreamingHttpResponse(
+        eventos_calendario(tipo, propietario_id, nombre), content_type='text/calendar; charset=utf-8'
+    )
+    respuesta['Content-Disposition'] = 'inline; filename="agenda.ics"'
+    # El cliente puede guardar el feed, pero debe revalidarlo (ETag) en cada consulta
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+# ----------------------------------------------------------------------
+# Exportaciones (CSV / XLSX)
+# ----------------------------------------------------------------------
+
+def _kinesiologo_exportacion(request):
+    """
+    Alcance de la exportación o el reporte: (permitido, kinesiologo_id
+    forzado). El personal administrativo ve todo; un Kinesiólogo, solo lo suyo.
+    """
+    if request.user.is_staff:
+        return True, None
+    kine = request.actor.kinesiologo
+    return kine is not None, kine.pk if kine else None
+
+
+@login_required
+def exportaciones(request):
+    """Formulario con los filtros de las exportaciones de citas y notas clínicas."""
+    permitido, kine_id = _kinesiologo_exportacion(request)
+    if not permitido:
+        messages.error(request, "Acceso no autorizado.")
+        return redirect('index')
+
+    form = ExportacionForm()
+    if kine_id:
+        # Un Kinesiólogo solo exporta su propia agenda
+        del form.fields['kinesiologo']
+    return render(request, 'citas_exportar.html', {'form': form, 'formatos': FORMATOS})
+
+
+@login_required
+def exportar_datos(request, tipo, formato):
+    """
+    Descarga de citas o metadatos de notas clínicas en CSV o XLSX. Las filas
+    se leen por bloques y se transmiten a medida que se escriben: la memoria
+    no crece con el rango y el primer byte sale de inmediato.
+    """
+    if tipo not in EXPORTACIONES or formato not in FORMATOS:
+        raise Http404("Exportación no encontrada.")
+    permitido, kine_id = _kinesiologo_exportacion(request)
+    if not permitido:
+        messages.error(request, "Acceso no autorizado.")
+        return redirect('index')
+
+    form = ExportacionForm(request.GET)
+    if not form.is_valid():
+        messages.error(request, "Revisa los filtros de la exportación.")
+        return redirect(reverse('citas:exportaciones'))
+    desde, hasta = form.cleaned_data['desde'], form.cleaned_data['hasta']
+    if kine_id is None and form.cleaned_data['kinesiologo']:
+        kine_id = form.cleaned_data['kinesiologo'].pk
+
+    respuesta = StreamingHttpResponse(
+        exportar(tipo, formato, desde, hasta, kine_id), content_type=TIPOS_CONTENIDO[formato]
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo(tipo, formato, desde, hasta)}"'
+    return respuesta
+
+
+# ----------------------------------------------------------------------
+# Reporte de ocupación
+# ----------------------------------------------------------------------
+
+SEMANAS_REPORTE = 4
+
+
+@login_required
+def reporte_ocupacion(request):
+    """
+    Minutos de jornada, agendados, bloqueados y disponibles por kinesiólogo y
+    semana (o día). Suma las filas precalculadas de OcupacionDiaria: el costo
+    depende del rango pedido, no del historial de citas.
+    """
+    permitido, kine_id = _kinesiologo_exportacion(request)
+    if not permitido:
+        messages.error(request, "Acceso no autorizado.")
+        return redirect('index')
+
+    # Por defecto, las semanas completas entre SEMANAS_REPORTE atrás y SEMANAS_REPORTE adelante
+    hoy = timezone.localdate()
+    lunes = hoy - timedelta(days=hoy.weekday())
+    desde = lunes - timedelta(weeks=SEMANAS_REPORTE)
+    hasta = lunes + timedelta(weeks=SEMANAS_REPORTE, days=6)
+    agrupacion = AGRUPACION_SEMANA
+
+    form = OcupacionForm(request.GET or None, initial={'desde': desde, 'hasta': hasta, 'agrupacion': agrupacion})
+    if kine_id:
+        del form.fields['kinesiologo']
+    if form.is_bound and form.is_valid():
+        desde = form.cleaned_data['desde'] or desde
+        hasta = form.cleaned_data['hasta'] or hasta
+        agrupacion = form.cleaned_data['agrupacion'] or agrupacion
+        if kine_id is None and form.cleaned_data.get('kinesiologo'):
+            kine_id = form.cleaned_data['kinesiologo'].pk
+
+    return render(request, 'citas_ocupacion.html', {
+        'form': form,
+        'filas': list(resumen_ocupacion(desde, hasta, kine_id, agrupacion)) if desde <= hasta else [],
+        'desde': desde,
+        'hasta': hasta,
+        'por_semana': agrupacion == AGRUPACION_SEMANA,
+    })
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0009_paginacion_indices'),
+        ('evaluaciones', '0002_notaclinica_delete_evaluacion'),
+        ('usuarios', '0005_paginacion_indices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notaclinica',
+            index=models.Index(fields=['kinesiologo', 'fecha_creacion', 'cita'], name='nota_kine_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notaclinica',
+            index=models.Index(fields=['paciente', 'fecha_creacion', 'cita'], name='nota_paciente_fecha_idx'),
+        ),
+    ]
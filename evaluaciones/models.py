@@ -61,6 +61,11 @@ class NotaClinica(models.Model):
         verbose_name = 'Nota Clínica'
         verbose_name_plural = 'Notas Clínicas'
         ordering = ['-fecha_creacion']
+        # Listados paginados por (fecha_creacion, cita) del kinesiólogo o del paciente
+        indexes = [
+            models.Index(fields=['kinesiologo', 'fecha_creacion', 'cita'], name='nota_kine_fecha_idx'),
+            models.Index(fields=['paciente', 'fecha_creacion', 'cita'], name='nota_paciente_fecha_idx'),
+        ]
 
     def __str__(self):
         # Usamos la relación con la cita para obtener el nombre del paciente
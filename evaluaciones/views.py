@@ -8,7 +8,9 @@ from django.contrib.auth.decorators import login_required
 
 # Importaciones CLAVE
 from citas.models import Cita, CITA_FINALIZADA
-from usuarios.models import Kinesiologo, Paciente, KINESIOLOGO
+from citas.paginacion import paginar, es_fragmento, respuesta_fragmento
+from citas.permisos import ACCESO_PACIENTE, ACCESO_KINESIOLOGO, ACCESO_ADMINISTRADOR, con_permiso
+from usuarios.models import Paciente
 from .models import NotaClinica 
 from .forms import NotaClinicaForm 
 
@@ -20,24 +22,29 @@ from .forms import NotaClinicaForm
 def listado_evaluaciones(request, paciente_pk=None):
     """Lista las Notas Clínicas, opcionalmente filtradas por paciente."""
     
-    # Restricción de seguridad
-    if request.user.perfil.rol != KINESIOLOGO and not request.user.is_superuser:
+    # Restricción de seguridad (el rol viene del actor de la sesión)
+    if not request.actor.es_kinesiologo and not request.user.is_superuser:
         messages.error(request, "Acceso no autorizado.")
         return redirect('index')
 
     if paciente_pk:
         paciente = get_object_or_404(Paciente, pk=paciente_pk)
-        notas = NotaClinica.objects.filter(paciente=paciente).order_by('-fecha_creacion')
+        notas = NotaClinica.objects.filter(paciente=paciente)
     else:
-        try:
-            kine = Kinesiologo.objects.get(perfil__user=request.user)
-            notas = NotaClinica.objects.filter(kinesiologo=kine).order_by('-fecha_creacion')
-        except Kinesiologo.DoesNotExist:
+        kine = request.actor.kinesiologo
+        if kine is not None:
+            notas = NotaClinica.objects.filter(kinesiologo=kine)
+        else:
             notas = NotaClinica.objects.none()
             messages.warning(request, "No se encontraron notas clínicas asociadas a tu perfil.")
+
+    # Más recientes primero, una página a la vez (la cita y el paciente vienen en el mismo JOIN)
+    notas = paginar(request, notas.select_related('cita', 'paciente__perfil'), ('-fecha_creacion', '-pk'))
             
     context = {'notas': notas, 'paciente': paciente if paciente_pk else None}
     
+    if es_fragmento(request):
+        return respuesta_fragmento(request, 'evaluaciones_list_filas.html', context, notas)
     # RUTA DE PLANTILLA CORREGIDA: 'evaluaciones_list.html'
     return render(request, 'evaluaciones_list.html', context)
 
@@ -47,22 +54,15 @@ def listado_evaluaciones(request, paciente_pk=None):
 
 @login_required
 # @transaction.atomic <--- ¡COMENTADO O ELIMINADO PARA FORZAR EL ERROR VISIBLE!
-def crear_o_editar_nota_clinica(request, cita_pk):
+@con_permiso(Cita.objects.select_related('paciente__perfil', 'nota_clinica'), [ACCESO_KINESIOLOGO], parametro='cita_pk')
+def crear_o_editar_nota_clinica(request, cita):
     """
     Permite al Kinesiólogo crear o editar la nota clínica asociada a una Cita.
+    Solo el Kinesiólogo asignado a la cita: la cita, su paciente y su nota
+    llegan en la misma consulta que verifica el permiso.
     """
-    cita = get_object_or_404(Cita, pk=cita_pk)
-    
-    # Restricción de seguridad
-    # Usando cita.kinesiologo.perfil.user para asegurar que el Kine logueado es el asignado a la cita
-    if request.user.perfil.rol != KINESIOLOGO or cita.kinesiologo.perfil.user != request.user:
-        messages.error(request, "Acceso no autorizado.")
-        return redirect('index')
-    
-    try:
-        nota_existente = NotaClinica.objects.get(cita=cita)
-    except NotaClinica.DoesNotExist:
-        nota_existente = None
+    cita_pk = cita.pk
+    nota_existente = getattr(cita, 'nota_clinica', None)
         
     if request.method == 'POST':
         form = NotaClinicaForm(request.POST, instance=nota_existente)
@@ -71,8 +71,8 @@ def crear_o_editar_nota_clinica(request, cita_pk):
             # RESTAURADO EL CÓDIGO LIMPIO SIN TRY/EXCEPT DE BASE DE DATOS
             nota = form.save(commit=False)
             nota.cita = cita
-            nota.kinesiologo = cita.kinesiologo 
-            nota.paciente = cita.paciente 
+            nota.kinesiologo_id = cita.kinesiologo_id
+            nota.paciente_id = cita.paciente_id
             nota.save()
             
             # Cambiar estado de la Cita a FINALIZADA
@@ -101,23 +101,19 @@ def crear_o_editar_nota_clinica(request, cita_pk):
 
 
 @login_required
-def ver_nota_clinica(request, cita_pk):
+@con_permiso(
+    Cita.objects.select_related('paciente__perfil', 'kinesiologo__perfil', 'nota_clinica__kinesiologo__perfil'),
+    [ACCESO_KINESIOLOGO, ACCESO_PACIENTE, ACCESO_ADMINISTRADOR], parametro='cita_pk',
+)
+def ver_nota_clinica(request, cita):
     """
     Permite ver la nota clínica. Accesible por Kinesiólogo (su cita) o Paciente (su cita).
     """
-    cita = get_object_or_404(Cita, pk=cita_pk)
-    
-    # Restricción de seguridad
-    es_kine = request.user.perfil.rol == KINESIOLOGO and cita.kinesiologo.perfil.user == request.user
-    es_paciente = cita.paciente.perfil.user == request.user
-    
-    if not (request.user.is_superuser or es_kine or es_paciente):
-        messages.error(request, "Acceso denegado a esta nota clínica.")
-        return redirect('index')
+    cita_pk = cita.pk
+    es_kine = request.acceso == ACCESO_KINESIOLOGO
 
-    try:
-        nota = NotaClinica.objects.get(cita=cita)
-    except NotaClinica.DoesNotExist:
+    nota = getattr(cita, 'nota_clinica', None)
+    if nota is None:
         messages.warning(request, "La nota clínica para esta cita aún no ha sido registrada.")
         
         if es_kine:
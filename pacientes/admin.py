@@ -2,7 +2,21 @@
 
 from django.contrib import admin
  
+from usuarios.admin import BusquedaRutMixin
 from usuarios.models import Paciente 
+from usuarios.rut import normalizar_rut, rut_valido
+from .busqueda import buscar_pacientes
 
 
-admin.site.register(Paciente)
+@admin.register(Paciente)
+class PacienteAdmin(BusquedaRutMixin, admin.ModelAdmin):
+    list_display = ('rut', 'apellido', 'nombre', 'telefono', 'prevision', 'rut_duplicado')
+    # Fichas antiguas con el RUT de otra ficha, pendientes de corregir o fusionar
+    list_filter = ('prevision', 'rut_duplicado')
+    search_fields = ('apellido', 'nombre')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Un RUT completo se busca por igualdad (BusquedaRutMixin); lo demás, en el índice de búsqueda
+        if not search_term.strip() or rut_valido(normalizar_rut(search_term)):
+            return super().get_search_results(request, queryset, search_term)
+        return buscar_pacientes(search_term, queryset), False
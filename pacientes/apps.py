@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PacientesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pacientes'
+
+    def ready(self):
+        # Registra los receptores que mantienen el índice de búsqueda de pacientes
+        from . import signals  # noqa: F401
@@ -0,0 +1,185 @@
+# pacientes/busqueda.py
+
+"""
+Búsqueda de pacientes por nombre, apellido, prefijo de RUT y teléfono (la
+búsqueda mientras se escribe de recepción y la del admin).
+
+En SQLite se usa un índice de texto completo FTS5: la tabla virtual
+pacientes_busqueda, con una fila por paciente (rowid = id del paciente).
+
+- Cada término buscado es un prefijo: 'ro' encuentra a Rojas y a Rosa. La
+  tabla guarda índices de prefijos de 2 a 4 caracteres, así un prefijo
+  corto no recorre todo el vocabulario.
+- No distingue mayúsculas ni acentos (tokenizador unicode61 con
+  remove_diacritics): 'jose' encuentra a José.
+- Todos los términos deben calzar: 'ana ro' encuentra a Ana Rojas.
+- Un término numérico (con o sin puntos, guion, K o '+') se busca como
+  prefijo del RUT normalizado y del teléfono, guardado solo con dígitos y
+  también sin el 56 de Chile.
+
+El índice se actualiza con señales (pacientes/signals.py), en la misma
+transacción que la ficha. bulk_create no emite señales: quien inserte
+fichas así debe llamar a indexar_pacientes. El comando reconstruir_busqueda
+lo rehace completo.
+
+En otros motores se filtra con icontains/startswith sobre las columnas de
+Paciente; en PostgreSQL la migración crea índices de trigramas (pg_trgm)
+que atienden esos LIKE sin recorrer la tabla.
+"""
+
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from usuarios.models import Paciente
+from usuarios.rut import normalizar_rut
+
+
+TABLA = 'pacientes_busqueda'
+# Campos de Paciente que alimentan el índice
+CAMPOS_INDICE = ('nombre', 'apellido', 'rut_normalizado', 'telefono')
+TAMANO_RECONSTRUCCION = 2000
+
+CREAR_TABLA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5("
+    "nombre, apellido, rut, telefono, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+)
+
+# Un término "numérico": RUT (12.345.678-K) o teléfono (+56912345678)
+TERMINO_NUMERICO = re.compile(r'\+?[\d.\-]*\d[\d.\-]*[kK]?')
+# Palabras tal como las separa el tokenizador unicode61 (el guion bajo también separa)
+PALABRA = re.compile(r'[^\W_]+')
+
+
+def usa_fts(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+
+# ----------------------------------------------------------------------
+# Mantención del índice
+# ----------------------------------------------------------------------
+
+def _telefonos(telefono):
+    digitos = re.sub(r'\D', '', telefono or '')
+    if digitos.startswith('56') and len(digitos) > 9:
+        return f"{digitos} {digitos[2:]}"
+    return digitos
+
+
+def _fila(paciente):
+    return (paciente.pk, paciente.nombre, paciente.apellido, paciente.rut_normalizado or '', _telefonos(paciente.telefono))
+
+
+def _insertar(cursor, pacientes):
+    cursor.executemany(
+        f"INSERT INTO {TABLA} (rowid, nombre, apellido, rut, telefono) VALUES (%s, %s, %s, %s, %s)",
+        [_fila(paciente) for paciente in pacientes],
+    )
+
+
+def indexar_pacientes(pacientes, using=DEFAULT_DB_ALIAS):
+    """Agrega o actualiza las fichas en el índice (tras save() o bulk_create)."""
+    pacientes = list(pacientes)
+    if not pacientes or not usa_fts(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLA} WHERE rowid = %s", [(paciente.pk,) for paciente in pacientes])
+        _insertar(cursor, pacientes)
+
+
+def desindexar_pacientes(ids, using=DEFAULT_DB_ALIAS):
+    ids = list(ids)
+    if not ids or not usa_fts(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLA} WHERE rowid = %s", [(pk,) for pk in ids])
+
+
+def reconstruir_indice(pacientes=None):
+    """
+    Vacía el índice y lo vuelve a llenar con `pacientes` (por defecto, todas
+    las fichas). Retorna la cantidad de fichas indexadas.
+    """
+    if pacientes is None:
+        pacientes = Paciente.objects.all()
+    using = pacientes.db
+    if not usa_fts(using):
+        return 0
+
+    total = 0
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(CREAR_TABLA)
+        cursor.execute(f"DELETE FROM {TABLA}")
+        lote = []
+        for paciente in pacientes.only('pk', *CAMPOS_INDICE).order_by('pk').iterator(chunk_size=TAMANO_RECONSTRUCCION):
+            lote.append(paciente)
+            if len(lote) >= TAMANO_RECONSTRUCCION:
+                _insertar(cursor, lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            _insertar(cursor, lote)
+            total += len(lote)
+        # Junta los segmentos del índice en uno: las búsquedas siguientes leen menos
+        cursor.execute(f"INSERT INTO {TABLA} ({TABLA}) VALUES ('optimize')")
+    return total
+
+
+# ----------------------------------------------------------------------
+# Búsqueda
+# ----------------------------------------------------------------------
+
+def terminos(texto):
+    """
+    Separa lo buscado en términos (numerico, valor): los numéricos quedan
+    normalizados ('12.345' -> '12345') y las palabras tal cual.
+    """
+    resultado = []
+    for parte in (texto or '').split():
+        if TERMINO_NUMERICO.fullmatch(parte):
+            resultado.append((True, normalizar_rut(parte)))
+        else:
+            resultado.extend((False, palabra) for palabra in PALABRA.findall(parte))
+    return resultado
+
+
+def consulta_fts(texto):
+    """Expresión MATCH de FTS5 para lo buscado, o '' si no hay términos."""
+    condiciones = []
+    for numerico, valor in terminos(texto):
+        # Entre comillas dobles el término es literal (no se interpreta como operador)
+        columnas = ('{rut}' if valor.endswith('K') else '{rut telefono}') if numerico else '{nombre apellido}'
+        condiciones.append(f'{columnas} : "{valor}"*')
+    return ' AND '.join(condiciones)
+
+
+def _filtro_sin_fts(texto):
+    filtro = Q()
+    for numerico, valor in terminos(texto):
+        if numerico and valor.endswith('K'):
+            filtro &= Q(rut_normalizado__startswith=valor)
+        elif numerico:
+            filtro &= Q(rut_normalizado__startswith=valor) | Q(telefono__contains=valor)
+        else:
+            filtro &= Q(nombre__icontains=valor) | Q(apellido__icontains=valor)
+    return filtro
+
+
+def buscar_pacientes(texto, queryset=None):
+    """
+    Filtra `queryset` (por defecto, todas las fichas) por lo buscado. El
+    orden queda a cargo de quien llama: p. ej. el listado pagina por
+    (apellido, id).
+    """
+    if queryset is None:
+        queryset = Paciente.objects.all()
+    if not usa_fts(queryset.db):
+        return queryset.filter(_filtro_sin_fts(texto))
+
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return queryset
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {TABLA} WHERE {TABLA} MATCH %s", [consulta]))
@@ -0,0 +1,232 @@
+# pacientes/incorporacion.py
+
+"""
+Incorporación masiva de pacientes (p. ej. la cartera de una clínica en
+convenio) desde un CSV.
+
+Cada paciente queda igual que si se hubiera registrado en el sitio
+(usuarios.views.RegistroPacienteView): usuario con el RUT en formato
+canónico y la clave inicial (los 4 últimos dígitos del celular), su Perfil
+y su ficha de Paciente. La diferencia está en el costo:
+
+1. La validación (RUT y dígito verificador, duplicados en el archivo y en
+   la BD) usa conjuntos: los RUT ya vistos en el archivo se guardan en
+   memoria y los existentes se cargan con dos consultas por lote (fichas y
+   nombres de usuario), no una por fila.
+2. Las claves iniciales se codifican (PBKDF2 u otro hasher configurado) en
+   un pool de procesos, que es donde se va casi todo el tiempo. Se hace
+   antes de abrir la transacción, así la BD no queda bloqueada mientras
+   tanto.
+3. Usuarios, perfiles y fichas se insertan con bulk_create, en una
+   transacción por lote.
+
+Las filas rechazadas se informan con su motivo. Un lote confirmado no se
+deshace si falla uno posterior; al volver a ejecutar el archivo, los
+pacientes ya creados se rechazan como duplicados y se crean los que faltan.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from usuarios.lotes_csv import FilaInvalida
+from usuarios.models import Paciente, Perfil, PACIENTE
+from usuarios.rut import normalizar_rut, rut_valido, formatear_rut
+from .busqueda import indexar_pacientes
+
+
+User = get_user_model()
+
+TAMANO_LOTE = 500
+TAMANO_INSERCION = 500
+
+COLUMNAS_OBLIGATORIAS = ('rut', 'nombre', 'apellido', 'telefono')
+COLUMNAS = COLUMNAS_OBLIGATORIAS + ('email', 'direccion', 'prevision', 'antecedentes_medicos')
+COLUMNAS_RECHAZO = ('fila', 'motivo_rechazo')
+
+MOTIVO_DUPLICADO_ARCHIVO = "El RUT ya aparece en una fila anterior del archivo."
+MOTIVO_PACIENTE_EXISTENTE = "Ya existe un paciente registrado con este RUT."
+MOTIVO_USUARIO_EXISTENTE = "Ya existe un usuario con este RUT."
+
+# Se acepta el código o el nombre de la previsión, sin importar mayúsculas
+PREVISIONES = {clave.lower(): clave for clave, _ in Paciente.PREVISION_CHOICES}
+PREVISIONES.update({nombre.lower(): clave for clave, nombre in Paciente.PREVISION_CHOICES})
+
+
+def clave_inicial(telefono):
+    """La clave con que queda el usuario, la misma del registro en el sitio."""
+    return telefono[-4:] if len(telefono) >= 4 else "0000"
+
+
+def _texto(fila, columna):
+    return (fila.get(columna) or '').strip()
+
+
+def _codificar(hasher, clave):
+    # Corre en los procesos del pool: equivale a make_password con el hasher ya resuelto
+    return hasher.encode(clave, hasher.salt())
+
+
+class IncorporadorPacientes:
+    """
+    Incorpora los lotes de filas de un CSV. Conserva entre lotes los RUT ya
+    vistos y los totales. Con procesos > 1 codifica las claves en un pool
+    que se cierra con cerrar() (o al salir del bloque with).
+    """
+
+    def __init__(self, procesos=None):
+        self.procesos = procesos or os.cpu_count() or 1
+        self.pool = None
+        if self.procesos > 1:
+            # django.setup: con spawn o forkserver los procesos parten sin las apps cargadas
+            self.pool = ProcessPoolExecutor(max_workers=self.procesos, initializer=django.setup)
+        self.hasher = get_hasher()
+        self.vistos = set()
+        self.creados = 0
+        self.rechazados = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # --- Validación ------------------------------------------------------
+
+    def validar(self, fila):
+        """Retorna los datos limpios de la fila o lanza FilaInvalida."""
+        rut = normalizar_rut(_texto(fila, 'rut'))
+        if not rut_valido(rut):
+            raise FilaInvalida(f"RUT inválido: '{_texto(fila, 'rut')}'.")
+
+        datos = {columna: _texto(fila, columna) for columna in COLUMNAS}
+        for columna in ('nombre', 'apellido', 'telefono'):
+            if not datos[columna]:
+                raise FilaInvalida(f"Falta {columna}.")
+        if len(datos['telefono']) > 15:
+            raise FilaInvalida(f"Teléfono demasiado largo: '{datos['telefono']}'.")
+        if datos['email']:
+            try:
+                validate_email(datos['email'])
+            except ValidationError:
+                raise FilaInvalida(f"Correo inválido: '{datos['email']}'.")
+
+        prevision = datos['prevision']
+        if prevision and prevision.lower() not in PREVISIONES:
+            raise FilaInvalida(f"Previsión desconocida: '{prevision}'.")
+
+        datos.update(
+            rut=rut,
+            nombre=datos['nombre'][:100],
+            apellido=datos['apellido'][:100],
+            direccion=datos['direccion'][:255] or None,
+            prevision=PREVISIONES.get(prevision.lower(), 'F'),
+            antecedentes_medicos=datos['antecedentes_medicos'] or None,
+        )
+        return datos
+
+    def descartar_existentes(self, datos):
+        """
+        Retorna (aceptados, rechazados): se rechazan los RUT repetidos en el
+        archivo y los que ya tienen ficha o usuario (dos consultas por lote).
+        """
+        ruts = {dato['rut'] for dato in datos}
+        con_ficha = set(Paciente.objects.filter(rut_normalizado__in=ruts).values_list('rut_normalizado', flat=True))
+        con_usuario = {
+            normalizar_rut(username) for username in User.objects.filter(
+                username__in=[formatear_rut(rut) for rut in ruts]
+            ).values_list('username', flat=True)
+        }
+
+        aceptados, rechazados = [], []
+        for dato in datos:
+            rut = dato['rut']
+            if rut in self.vistos:
+                rechazados.append((dato, MOTIVO_DUPLICADO_ARCHIVO))
+            elif rut in con_ficha:
+                rechazados.append((dato, MOTIVO_PACIENTE_EXISTENTE))
+            elif rut in con_usuario:
+                rechazados.append((dato, MOTIVO_USUARIO_EXISTENTE))
+            else:
+                aceptados.append(dato)
+            self.vistos.add(rut)
+        return aceptados, rechazados
+
+    # --- Claves ----------------------------------------------------------
+
+    def codificar_claves(self, claves):
+        """Hash de cada clave, en el mismo orden, repartido entre los procesos del pool."""
+        codificar = partial(_codificar, self.hasher)
+        if self.pool is None:
+            return [codificar(clave) for clave in claves]
+        # Varias claves por tarea (menos viajes entre procesos), unas cuatro tareas por proceso
+        por_tarea = max(1, len(claves) // (self.procesos * 4))
+        return list(self.pool.map(codificar, claves, chunksize=por_tarea))
+
+    # --- Lote ------------------------------------------------------------
+
+    def incorporar_lote(self, lote):
+        """
+        Crea los pacientes válidos del lote, una lista de (numero, fila).
+        Retorna los rechazos como (numero, fila, motivo).
+        """
+        rechazos = []
+        datos = []
+        for numero, fila in lote:
+            try:
+                dato = self.validar(fila)
+            except FilaInvalida as error:
+                rechazos.append((numero, fila, str(error)))
+                continue
+            dato.update(numero=numero, fila=fila)
+            datos.append(dato)
+
+        datos, duplicados = self.descartar_existentes(datos)
+        rechazos.extend((dato['numero'], dato['fila'], motivo) for dato, motivo in duplicados)
+
+        if datos:
+            claves = self.codificar_claves([clave_inicial(dato['telefono']) for dato in datos])
+            with transaction.atomic():
+                usuarios = User.objects.bulk_create([
+                    User(
+                        username=formatear_rut(dato['rut']), email=dato['email'],
+                        first_name=dato['nombre'], last_name=dato['apellido'], password=clave,
+                    )
+                    for dato, clave in zip(datos, claves)
+                ], batch_size=TAMANO_INSERCION)
+                perfiles = Perfil.objects.bulk_create([
+                    Perfil(
+                        user=usuario, nombre=dato['nombre'], apellido=dato['apellido'], rol=PACIENTE,
+                        telefono=dato['telefono'], direccion=dato['direccion'],
+                    )
+                    for usuario, dato in zip(usuarios, datos)
+                ], batch_size=TAMANO_INSERCION)
+                pacientes = Paciente.objects.bulk_create([
+                    # bulk_create no pasa por save(): el RUT normalizado se asigna aquí
+                    Paciente(
+                        perfil=perfil, rut=formatear_rut(dato['rut']), rut_normalizado=dato['rut'],
+                        nombre=dato['nombre'], apellido=dato['apellido'], telefono=dato['telefono'],
+                        direccion=dato['direccion'], prevision=dato['prevision'],
+                        antecedentes_medicos=dato['antecedentes_medicos'],
+                    )
+                    for perfil, dato in zip(perfiles, datos)
+                ], batch_size=TAMANO_INSERCION)
+                # Tampoco emite post_save: las fichas se agregan aquí al índice de búsqueda
+                indexar_pacientes(pacientes)
+            self.creados += len(datos)
+
+        rechazos.sort(key=lambda rechazo: rechazo[0])
+        self.rechazados += len(rechazos)
+        return rechazos
@@ -0,0 +1,74 @@
+# pacientes/management/commands/incorporar_pacientes.py
+
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pacientes.incorporacion import COLUMNAS, COLUMNAS_OBLIGATORIAS, COLUMNAS_RECHAZO, TAMANO_LOTE, IncorporadorPacientes
+from usuarios.lotes_csv import abrir_lector, leer_lotes
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea de una vez los pacientes de un CSV (p. ej. la cartera de una clínica en convenio), "
+        f"con las columnas {', '.join(COLUMNAS)}. Cada paciente queda como si se hubiera "
+        "registrado en el sitio; las claves se codifican en paralelo y las filas rechazadas "
+        "van a un CSV con el motivo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="CSV a incorporar (UTF-8, con encabezado).")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Pacientes por lote y transacción.")
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help="Procesos que codifican las claves (por defecto, uno por CPU).",
+        )
+        parser.add_argument(
+            '--rechazos',
+            help="CSV donde se escriben las filas rechazadas. Por defecto, <archivo>.rechazos.csv.",
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        if not os.path.isfile(ruta):
+            raise CommandError(f"No existe el archivo {ruta}.")
+        if options['lote'] < 1 or options['procesos'] < 1:
+            raise CommandError("--lote y --procesos deben ser mayores que cero.")
+        ruta_rechazos = options['rechazos'] or f"{ruta}.rechazos.csv"
+
+        inicio = time.monotonic()
+        procesadas = 0
+        # utf-8-sig: acepta el BOM que agrega Excel
+        with open(ruta, newline='', encoding='utf-8-sig') as archivo, \
+                open(ruta_rechazos, 'w', newline='', encoding='utf-8') as salida_rechazos, \
+                IncorporadorPacientes(options['procesos']) as incorporador:
+            try:
+                lector = abrir_lector(archivo, COLUMNAS_OBLIGATORIAS)
+            except ValueError as error:
+                raise CommandError(str(error))
+
+            rechazos_csv = csv.writer(salida_rechazos)
+            rechazos_csv.writerow(COLUMNAS_RECHAZO + tuple(lector.fieldnames))
+
+            for lote in leer_lotes(lector, options['lote']):
+                for numero, fila, motivo in incorporador.incorporar_lote(lote):
+                    rechazos_csv.writerow([numero, motivo, *(fila.get(columna) for columna in lector.fieldnames)])
+                procesadas += len(lote)
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f"Fila {lote[-1][0]}: {incorporador.creados} creados, "
+                        f"{incorporador.rechazados} rechazados ({self._ritmo(procesadas, inicio)} filas/s)."
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{incorporador.creados} pacientes creados, {incorporador.rechazados} filas rechazadas. "
+            f"{procesadas} filas en {time.monotonic() - inicio:.1f} s ({self._ritmo(procesadas, inicio)} filas/s)."
+        ))
+        if incorporador.rechazados:
+            self.stdout.write(f"Filas rechazadas en {ruta_rechazos}.")
+
+    def _ritmo(self, filas, inicio):
+        segundos = time.monotonic() - inicio
+        return round(filas / segundos) if segundos else filas
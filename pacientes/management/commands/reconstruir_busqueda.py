@@ -0,0 +1,26 @@
+# pacientes/management/commands/reconstruir_busqueda.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from pacientes.busqueda import reconstruir_indice, usa_fts
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace el índice de búsqueda de pacientes (FTS5 en SQLite) con todas las fichas. "
+        "Sirve tras cargas que no pasan por las señales (SQL directo, restauraciones) o para "
+        "compactar el índice."
+    )
+
+    def handle(self, *args, **options):
+        if not usa_fts():
+            self.stdout.write("Esta base de datos no usa el índice FTS5: la búsqueda usa los índices de trigramas.")
+            return
+
+        inicio = time.monotonic()
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice de búsqueda reconstruido: {total} pacientes en {time.monotonic() - inicio:.1f} s."
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 18:40
+
+from django.db import migrations
+
+
+# En PostgreSQL: índices de trigramas para los icontains de la búsqueda
+# (Django compara UPPER("columna"::text) LIKE UPPER(...))
+INDICES_TRIGRAMAS = (
+    ('paciente_nombre_trgm', 'UPPER("nombre"::text) gin_trgm_ops'),
+    ('paciente_apellido_trgm', 'UPPER("apellido"::text) gin_trgm_ops'),
+    ('paciente_telefono_trgm', '"telefono" gin_trgm_ops'),
+)
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    from pacientes.busqueda import reconstruir_indice
+
+    conexion = schema_editor.connection
+    if conexion.vendor == 'sqlite':
+        # Crea la tabla FTS5 y la llena con las fichas existentes
+        Paciente = apps.get_model('usuarios', 'Paciente')
+        reconstruir_indice(Paciente.objects.using(conexion.alias))
+    elif conexion.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for nombre, expresion in INDICES_TRIGRAMAS:
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON "usuarios_paciente" USING gin ({expresion})')
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS pacientes_busqueda")
+    elif conexion.vendor == 'postgresql':
+        for nombre, _ in INDICES_TRIGRAMAS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {nombre}")
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('usuarios', '0006_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,28 @@
+# pacientes/signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from usuarios.models import Paciente
+from .busqueda import CAMPOS_INDICE, indexar_pacientes, desindexar_pacientes
+
+
+# ----------------------------------------------------------------------
+# Índice de búsqueda de pacientes (pacientes/busqueda.py)
+# ----------------------------------------------------------------------
+
+@receiver(post_save, sender=Paciente)
+def indexar_paciente(sender, instance, update_fields=None, using=None, **kwargs):
+    """
+    Actualiza la ficha en el índice, en la misma transacción que el guardado
+    (si esta se revierte, el índice también). No hace nada si el guardado no
+    tocó los campos indexados.
+    """
+    if update_fields is not None and not set(update_fields) & set(CAMPOS_INDICE):
+        return
+    indexar_pacientes([instance], using=using)
+
+
+@receiver(post_delete, sender=Paciente)
+def desindexar_paciente(sender, instance, using=None, **kwargs):
+    desindexar_pacientes([instance.pk], using=using)
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from usuarios.models import Perfil, Paciente, PACIENTE
+from usuarios.rut import digito_verificador
+from .busqueda import TABLA, buscar_pacientes
+from .incorporacion import IncorporadorPacientes, MOTIVO_DUPLICADO_ARCHIVO, MOTIVO_PACIENTE_EXISTENTE, MOTIVO_USUARIO_EXISTENTE
+
+
+# MD5 solo para que las pruebas no esperen al hasher real
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class IncorporacionPacientesTests(TestCase):
+    ENCABEZADO = ['rut', 'nombre', 'apellido', 'telefono', 'email', 'prevision']
+
+    def setUp(self):
+        user = User.objects.create_user(username='11111111-1')
+        perfil = Perfil.objects.create(user=user, nombre='Ana', apellido='Rojas', rol=PACIENTE)
+        Paciente.objects.create(perfil=perfil, rut='11111111-1', telefono='912345678', nombre='Ana', apellido='Rojas')
+        User.objects.create_user(username='33333333-3')  # usuario sin ficha de paciente
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, 'cartera.csv')
+
+    def escribir(self, filas):
+        with open(self.ruta, 'w', newline='', encoding='utf-8') as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(self.ENCABEZADO)
+            escritor.writerows(filas)
+
+    def incorporar(self, **opciones):
+        call_command('incorporar_pacientes', self.ruta, stdout=io.StringIO(), **opciones)
+        with open(f"{self.ruta}.rechazos.csv", encoding='utf-8') as archivo:
+            return {int(fila['fila']): fila['motivo_rechazo'] for fila in csv.DictReader(archivo)}
+
+    def test_crea_pacientes_y_rechaza_con_motivo(self):
+        self.escribir([
+            ['22.222.222-2', 'Luis', 'Soto', '987654321', 'luis@example.com', 'Isapre'],
+            ['22222222-2', 'Luis', 'Soto', '987654321', '', ''],
+            ['11.111.111-1', 'Ana', 'Rojas', '912345678', '', ''],
+            ['33333333-3', 'Eva', 'Paz', '911112222', '', ''],
+            ['12.345.678-9', 'Dígito', 'Errado', '911112222', '', ''],
+            ['44444444-4', 'Sin', 'Teléfono', '', '', ''],
+            ['55555555-5', 'Rosa', 'Vera', '955554444', 'no-es-correo', ''],
+            ['66666666-6', 'Juan', 'Díaz', '966667777', '', 'fonasa'],
+        ])
+        rechazos = self.incorporar(lote=3, procesos=1)
+
+        self.assertEqual(sorted(rechazos), [3, 4, 5, 6, 7, 8])
+        self.assertEqual(rechazos[3], MOTIVO_DUPLICADO_ARCHIVO)
+        self.assertEqual(rechazos[4], MOTIVO_PACIENTE_EXISTENTE)
+        self.assertEqual(rechazos[5], MOTIVO_USUARIO_EXISTENTE)
+        self.assertIn('RUT inválido', rechazos[6])
+        self.assertIn('Correo inválido', rechazos[8])
+
+        nuevo = Paciente.objects.select_related('perfil__user').get(rut_normalizado='222222222')
+        self.assertEqual((nuevo.rut, nuevo.prevision, nuevo.perfil.rol), ('22222222-2', 'I', PACIENTE))
+        self.assertEqual((nuevo.perfil.user.username, nuevo.perfil.user.email), ('22222222-2', 'luis@example.com'))
+        # Misma clave inicial que el registro en el sitio: los 4 últimos dígitos del celular
+        self.assertTrue(nuevo.perfil.user.check_password('4321'))
+        self.assertEqual(Paciente.objects.get(rut_normalizado='666666666').prevision, 'F')
+
+        # Volver a ejecutar el archivo no duplica a nadie
+        self.assertEqual(sorted(self.incorporar(lote=3, procesos=1)), [2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(Paciente.objects.count(), 3)
+
+    def test_claves_codificadas_en_varios_procesos(self):
+        with IncorporadorPacientes(procesos=2) as incorporador:
+            rechazos = incorporador.incorporar_lote([
+                (numero, {'rut': f'7000000{numero}{digito_verificador(f"7000000{numero}")}', 'nombre': 'P',
+                          'apellido': str(numero), 'telefono': f'9000000{numero}'})
+                for numero in range(2, 10)
+            ])
+        self.assertEqual((rechazos, incorporador.creados), ([], 8))
+        for usuario in User.objects.filter(username__startswith='7000000'):
+            self.assertTrue(usuario.check_password(f'000{usuario.username[7]}'))
+
+
+class BusquedaPacientesTests(TestCase):
+    def crear(self, rut, nombre, apellido, telefono):
+        user = User.objects.create_user(username=rut)
+        perfil = Perfil.objects.create(user=user, nombre=nombre, apellido=apellido, rol=PACIENTE)
+        return Paciente.objects.create(perfil=perfil, rut=rut, nombre=nombre, apellido=apellido, telefono=telefono)
+
+    def setUp(self):
+        self.jose = self.crear('11.111.111-1', 'José', 'Rojas', '+56 9 1234 5678')
+        self.ana = self.crear('22222222-2', 'Ana', 'Rosales', '987654321')
+        self.luis = self.crear('12345678-5', 'Luis', 'Muñoz', '223334444')
+
+    def buscar(self, texto):
+        return set(buscar_pacientes(texto).values_list('nombre', flat=True))
+
+    def test_busca_por_prefijo_de_nombre_rut_y_telefono(self):
+        self.assertEqual(self.buscar('ro'), {'José', 'Ana'})
+        self.assertEqual(self.buscar('jose ro'), {'José'})
+        self.assertEqual(self.buscar('MUNO'), {'Luis'})
+        self.assertEqual(self.buscar('12.345'), {'Luis'})
+        self.assertEqual(self.buscar('912345'), {'José'})
+        self.assertEqual(self.buscar('+569123'), {'José'})
+        self.assertEqual(self.buscar('ana 11'), set())
+        # Comillas y operadores de FTS5 se tratan como texto
+        self.assertEqual(self.buscar('"ro" OR'), set())
+        self.assertEqual(self.buscar('-'), {'José', 'Ana', 'Luis'})
+
+    def test_sin_fts_filtra_sobre_las_columnas(self):
+        with mock.patch('pacientes.busqueda.usa_fts', return_value=False):
+            self.assertEqual(self.buscar('ro'), {'José', 'Ana'})
+            self.assertEqual(self.buscar('12.345 lu'), {'Luis'})
+            self.assertEqual(self.buscar('5555'), set())
+
+    def test_el_indice_sigue_a_las_fichas(self):
+        self.ana.apellido = 'Vera'
+        self.ana.save()
+        self.assertEqual(self.buscar('ro'), {'José'})
+        self.jose.perfil.user.delete()
+        self.assertEqual(self.buscar('ro'), set())
+        self.assertEqual(self.buscar('vera'), {'Ana'})
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA}")
+        self.assertEqual(self.buscar('vera'), set())
+        call_command('reconstruir_busqueda', stdout=io.StringIO())
+        self.assertEqual(self.buscar('vera'), {'Ana'})
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_incorporados_en_lote_quedan_indexados(self):
+        with IncorporadorPacientes(procesos=1) as incorporador:
+            incorporador.incorporar_lote([(2, {'rut': '33333333-3', 'nombre': 'Rocío', 'apellido': 'Paz', 'telefono': '955554444'})])
+        self.assertEqual(self.buscar('rocio'), {'Rocío'})
+
+    def test_listado_filtra_y_pagina_la_busqueda(self):
+        respuesta = self.client.get(reverse('pacientes:listado_pacientes'), {'q': 'ro'})
+        self.assertEqual([paciente.nombre for paciente in respuesta.context['pacientes']], ['José', 'Ana'])
+        self.assertContains(respuesta, 'value="ro"')
+
+        respuesta = self.client.get(
+            reverse('pacientes:listado_pacientes'), {'q': 'zzz'}, headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        self.assertEqual(respuesta.content.strip(), b'')
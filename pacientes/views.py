@@ -1,13 +1,21 @@
 # pacientes/views.py
 from django.shortcuts import render, get_object_or_404
 from usuarios.models import Paciente 
+from citas.paginacion import paginar, es_fragmento, respuesta_fragmento
+from .busqueda import buscar_pacientes
 
 def listado_pacientes(request):
-    """Muestra el listado de todos los pacientes."""
-    pacientes = Paciente.objects.all().order_by('perfil__user__last_name')
-    context = {'pacientes': pacientes}
-    
+    """
+    Muestra el listado de los pacientes, ordenado por apellido y paginado por
+    cursor. Con ?q= filtra por nombre, apellido, RUT o teléfono (pacientes/busqueda.py).
+    """
+    busqueda = request.GET.get('q', '').strip()
+    queryset = buscar_pacientes(busqueda) if busqueda else Paciente.objects.all()
+    pacientes = paginar(request, queryset, ('apellido', 'id'))
+    context = {'pacientes': pacientes, 'busqueda': busqueda}
     
+    if es_fragmento(request):
+        return respuesta_fragmento(request, 'pacientes_list_filas.html', context, pacientes)
     return render(request, 'pacientes_list.html', context) 
 
 def detalle_paciente(request, pk):
@@ -3,6 +3,9 @@ ASGI config for proyecto_kinesiologo project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Usa por defecto el perfil de despliegue ASGI (settings_asgi), pensado para
+servir con varios workers: uvicorn proyecto_kinesiologo.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -11,6 +14,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyecto_kinesiologo.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyecto_kinesiologo.settings_asgi')
 
 application = get_asgi_application()
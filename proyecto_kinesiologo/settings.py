@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'usuarios.middleware.ActorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +86,36 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# La disponibilidad diaria de cada kinesiólogo se cachea como mapa de bits
+# (citas/mapa_disponibilidad.py). Con varios procesos de servidor conviene el
+# backend de archivos, para que la invalidación por señales sea compartida:
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#   'LOCATION': BASE_DIR / 'cache',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'kinesiologo-default',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
+# Correo saliente (recordatorios de citas, citas/recordatorios.py). En
+# desarrollo los correos se muestran en la consola; para revisarlos como
+# archivos:
+#   EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+#   EMAIL_FILE_PATH = BASE_DIR / 'correos'
+# En producción, el backend SMTP con EMAIL_HOST, EMAIL_PORT, etc.
+
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'KineGestion <no-responder@kinegestion.cl>'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
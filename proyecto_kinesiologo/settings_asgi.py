@@ -0,0 +1,32 @@
+"""
+Perfil de despliegue ASGI de proyecto_kinesiologo.
+
+Se usa con un servidor ASGI con varios workers, por ejemplo:
+
+    uvicorn proyecto_kinesiologo.asgi:application --workers 4
+
+Hereda toda la configuración de `settings.py` y ajusta solo lo que cambia
+al servir las vistas asíncronas (disponibilidad, agenda, datos del dashboard).
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+
+ASGI_APPLICATION = 'proyecto_kinesiologo.asgi.application'
+
+# Con ASGI cada petición asíncrona consulta la BD desde un hilo del ORM: no
+# conviene mantener conexiones persistentes entre peticiones.
+CONN_MAX_AGE = 0
+
+# Con varios workers la caché debe ser compartida, así la invalidación de los
+# mapas de disponibilidad y plantillas (señales) llega a todos los procesos.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
@@ -0,0 +1,181 @@
+# usuarios/actor.py
+
+"""
+El "actor" de una petición: el perfil del usuario autenticado, su rol y su
+ficha de Paciente o de Kinesiólogo, según corresponda.
+
+ActorMiddleware (usuarios/middleware.py) lo expone como `request.actor`
+(perezoso) y `request.aactor()` (vistas asíncronas). Se resuelve así:
+
+1. Desde la sesión, sin tocar la BD, si la versión guardada junto al actor
+   coincide con la versión vigente del usuario en la caché.
+2. Si no, con una sola consulta (Perfil con su Paciente y su Kinesiologo
+   en el mismo JOIN), y se guarda en la sesión con la versión vigente.
+
+Guardar o eliminar un Perfil, Paciente o Kinesiologo cambia la versión del
+usuario (usuarios/signals.py), así la siguiente petición de cualquiera de
+sus sesiones lo vuelve a leer. Si la versión se pierde de la caché se
+genera una nueva, con lo que nunca se reutiliza un actor antiguo.
+
+La versión expira tras VIGENCIA_VERSION: con una caché por proceso (LocMem
+con varios workers) el cambio solo se ve en el proceso que lo hizo, y los
+demás releen el actor a lo más tras ese tiempo, cuando su versión expira y
+ya no coincide con la guardada en la sesión.
+
+En la sesión se guardan solo algunos campos de cada modelo; los demás se
+cargan de la BD la primera vez que se leen (campos diferidos).
+"""
+
+import time
+
+from django.core.cache import cache
+
+from .models import Perfil, Paciente, Kinesiologo, KINESIOLOGO, PACIENTE
+
+
+# Cambiar el sufijo si cambian los campos guardados: las sesiones antiguas se ignoran
+CLAVE_SESION = 'actor_v1'
+PREFIJO_CLAVE = 'actor'
+# Segundos que un proceso confía en el actor de la sesión sin ver la invalidación de otro
+VIGENCIA_VERSION = 60
+
+CAMPOS_PERFIL = ('id', 'user_id', 'nombre', 'apellido', 'rol')
+CAMPOS_PACIENTE = ('id', 'perfil_id', 'rut', 'nombre', 'apellido', 'telefono')
+CAMPOS_KINESIOLOGO = ('id', 'perfil_id', 'especialidad', 'licencia')
+
+
+class Actor:
+    """Perfil, rol y ficha (Paciente o Kinesiologo) del usuario de la petición."""
+
+    def __init__(self, perfil=None, paciente=None, kinesiologo=None):
+        self.perfil = perfil
+        self.paciente = paciente
+        self.kinesiologo = kinesiologo
+
+    @property
+    def rol(self):
+        return self.perfil.rol if self.perfil else None
+
+    @property
+    def es_kinesiologo(self):
+        return self.rol == KINESIOLOGO
+
+    @property
+    def es_paciente(self):
+        return self.rol == PACIENTE
+
+    def __bool__(self):
+        return self.perfil is not None
+
+    def __repr__(self):
+        return f"<Actor {self.perfil!r}>"
+
+
+ANONIMO = Actor()
+
+
+# ----------------------------------------------------------------------
+# Versión en caché
+# ----------------------------------------------------------------------
+
+def clave_version(user_id):
+    return f"{PREFIJO_CLAVE}:version:{user_id}"
+
+
+def version_actor(user_id):
+    clave = clave_version(user_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), VIGENCIA_VERSION)
+        version = cache.get(clave)
+    return version
+
+
+async def aversion_actor(user_id):
+    clave = clave_version(user_id)
+    version = await cache.aget(clave)
+    if version is None:
+        await cache.aadd(clave, time.time_ns(), VIGENCIA_VERSION)
+        version = await cache.aget(clave)
+    return version
+
+
+def invalidar_actor(user_id):
+    """Obliga a releer el actor del usuario en todas sus sesiones."""
+    if user_id:
+        cache.set(clave_version(user_id), time.time_ns(), VIGENCIA_VERSION)
+
+
+# ----------------------------------------------------------------------
+# Serialización en la sesión
+# ----------------------------------------------------------------------
+
+def _valores(instancia, campos):
+    return {campo: getattr(instancia, campo) for campo in campos} if instancia else None
+
+
+def _instancia(modelo, valores):
+    if not valores:
+        return None
+    # from_db deja como diferidos los campos que no vienen (se cargan solo si se leen)
+    # y espera los valores en el orden de los campos del modelo
+    campos = [campo.attname for campo in modelo._meta.concrete_fields if campo.attname in valores]
+    return modelo.from_db('default', campos, [valores[campo] for campo in campos])
+
+
+def _datos_sesion(user_id, perfil, version):
+    paciente = getattr(perfil, 'paciente', None) if perfil else None
+    kinesiologo = getattr(perfil, 'kinesiologo', None) if perfil else None
+    return {
+        'version': version,
+        'user_id': user_id,
+        'perfil': _valores(perfil, CAMPOS_PERFIL),
+        'paciente': _valores(paciente, CAMPOS_PACIENTE),
+        'kinesiologo': _valores(kinesiologo, CAMPOS_KINESIOLOGO),
+    }
+
+
+def _actor_desde_datos(user, datos):
+    perfil = _instancia(Perfil, datos['perfil'])
+    paciente = _instancia(Paciente, datos['paciente'])
+    kinesiologo = _instancia(Kinesiologo, datos['kinesiologo'])
+    # Las relaciones ya conocidas quedan en caché: actor.paciente.perfil.user no consulta la BD
+    if perfil:
+        perfil.user = user
+        for ficha in (paciente, kinesiologo):
+            if ficha:
+                ficha.perfil = perfil
+    return Actor(perfil, paciente, kinesiologo)
+
+
+def _consulta(user):
+    # Una sola consulta: el Perfil con su Paciente y su Kinesiologo (LEFT JOIN)
+    return Perfil.objects.select_related('paciente', 'kinesiologo').filter(user=user)
+
+
+def _vigentes(datos, user, version):
+    return bool(datos) and datos.get('version') == version and datos.get('user_id') == user.pk
+
+
+def obtener_actor(request):
+    user = request.user
+    if not user.is_authenticated:
+        return ANONIMO
+    version = version_actor(user.pk)
+    datos = request.session.get(CLAVE_SESION)
+    if not _vigentes(datos, user, version):
+        datos = _datos_sesion(user.pk, _consulta(user).first(), version)
+        request.session[CLAVE_SESION] = datos
+    return _actor_desde_datos(user, datos)
+
+
+async def aobtener_actor(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return ANONIMO
+    version = await aversion_actor(user.pk)
+    datos = await request.session.aget(CLAVE_SESION)
+    if not _vigentes(datos, user, version):
+        datos = _datos_sesion(user.pk, await _consulta(user).afirst(), version)
+        await request.session.aset(CLAVE_SESION, datos)
+    return _actor_desde_datos(user, datos)
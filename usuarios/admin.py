@@ -2,8 +2,25 @@
 
 from django.contrib import admin
 
-from .models import Perfil, Kinesiologo 
+from .models import Perfil, Kinesiologo
+from .rut import normalizar_rut, rut_valido
+
+
+class BusquedaRutMixin:
+    """
+    Si lo buscado es un RUT válido (con o sin puntos y guion), filtra por
+    igualdad sobre el RUT normalizado (índice único) en vez de recorrer los
+    search_fields con LIKE.
+    """
+    campo_rut_normalizado = 'rut_normalizado'
+
+    def get_search_results(self, request, queryset, search_term):
+        rut = normalizar_rut(search_term)
+        if rut_valido(rut):
+            return queryset.filter(**{self.campo_rut_normalizado: rut}), False
+        return super().get_search_results(request, queryset, search_term)
 
 
 admin.site.register(Perfil)
-admin.site.register(Kinesiologo)
\ No newline at end of file
+admin.site.register(Kinesiologo)
+
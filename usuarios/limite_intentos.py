@@ -0,0 +1,87 @@
+# usuarios/limite_intentos.py
+
+"""
+Límite de intentos fallidos de login, por identificador (RUT o usuario) y
+por IP del cliente, guardado en la caché de Django.
+
+Cada límite es una ventana deslizante aproximada con dos contadores de
+ventana fija (la actual y la anterior): el total estimado es el de la
+ventana actual más la parte de la anterior que aún cae dentro de los
+últimos VENTANA segundos. Los contadores se incrementan con cache.incr,
+atómico en los backends de memoria compartida (locmem dentro del proceso,
+memcached, redis).
+
+Al superar el límite se crea una clave de bloqueo con cache.add y un
+timeout fijo: mientras exista, los intentos se rechazan sin consultar la
+BD ni contar más fallos, y como add no renueva una clave existente el
+bloqueo dura a lo más BLOQUEO segundos. La verificación es una sola
+lectura (get_many) antes de cualquier consulta a la BD.
+"""
+
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+VENTANA = 15 * 60
+BLOQUEO = 15 * 60
+FALLOS_POR_IDENTIFICADOR = 5
+FALLOS_POR_IP = 20
+
+AMBITO_PACIENTE = 'paciente'
+AMBITO_KINESIOLOGO = 'kinesiologo'
+
+
+def ip_cliente(request):
+    """IP de la conexión. Detrás de un proxy, este debe fijar REMOTE_ADDR (no se confía en X-Forwarded-For)."""
+    return request.META.get('REMOTE_ADDR') or 'desconocida'
+
+
+def _clave(ambito, tipo, valor):
+    # Hash: los identificadores vienen del formulario y deben servir como clave en cualquier backend
+    return f"login:{ambito}:{tipo}:{hashlib.sha256(valor.encode()).hexdigest()[:32]}"
+
+
+def _limites(ambito, identificador, ip):
+    limites = [(_clave(ambito, 'ip', ip), FALLOS_POR_IP)]
+    if identificador:
+        limites.append((_clave(ambito, 'id', identificador), FALLOS_POR_IDENTIFICADOR))
+    return limites
+
+
+def segundos_bloqueado(ambito, identificador, ip):
+    """Segundos que faltan para que termine el bloqueo (0 si se puede intentar)."""
+    bloqueos = cache.get_many([f"{clave}:bloqueo" for clave, _ in _limites(ambito, identificador, ip)])
+    if not bloqueos:
+        return 0
+    return max(1, int(max(bloqueos.values()) - time.time()))
+
+
+def _incrementar(clave):
+    cache.add(clave, 0, 2 * VENTANA)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        # La clave expiró o fue desalojada entre add e incr
+        cache.set(clave, 1, 2 * VENTANA)
+        return 1
+
+
+def registrar_fallo(ambito, identificador, ip):
+    """Cuenta un intento fallido y bloquea los límites que quedaron excedidos."""
+    ahora = time.time()
+    ventana, transcurrido = divmod(ahora, VENTANA)
+    peso_anterior = 1 - transcurrido / VENTANA
+    for clave, maximo in _limites(ambito, identificador, ip):
+        actuales = _incrementar(f"{clave}:{int(ventana)}")
+        anteriores = cache.get(f"{clave}:{int(ventana) - 1}", 0)
+        if actuales + anteriores * peso_anterior >= maximo:
+            cache.add(f"{clave}:bloqueo", ahora + BLOQUEO, BLOQUEO)
+
+
+def limpiar_fallos(ambito, identificador):
+    """Tras un login exitoso, olvida los fallos del identificador (los de la IP se mantienen)."""
+    clave = _clave(ambito, 'id', identificador)
+    ventana = int(time.time() // VENTANA)
+    cache.delete_many([f"{clave}:{ventana}", f"{clave}:{ventana - 1}"])
@@ -0,0 +1,42 @@
+# usuarios/lotes_csv.py
+
+"""
+Lectura por lotes de los CSV de carga masiva, común a la importación de
+citas (citas/importacion.py) y a la incorporación de pacientes
+(pacientes/incorporacion.py): abre el archivo verificando las columnas,
+lo entrega en lotes numerados por fila y define el error de fila que
+ambos escriben en su archivo de rechazos.
+"""
+
+import csv
+
+
+class FilaInvalida(Exception):
+    """La fila no se puede importar; el mensaje va al archivo de rechazos."""
+
+
+def abrir_lector(archivo, obligatorias):
+    """DictReader del archivo; lanza ValueError si faltan columnas obligatorias."""
+    lector = csv.DictReader(archivo)
+    faltantes = [columna for columna in obligatorias if columna not in (lector.fieldnames or ())]
+    if faltantes:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltantes)}.")
+    return lector
+
+
+def leer_lotes(lector, tamano, desde_fila=0):
+    """
+    Genera listas de (numero_de_fila, fila) de a lo más `tamano` filas,
+    omitiendo las filas hasta `desde_fila` (ya importadas). La fila 1 es el
+    encabezado, así el número coincide con la línea que ve una planilla.
+    """
+    lote = []
+    for numero, fila in enumerate(lector, 2):
+        if numero <= desde_fila:
+            continue
+        lote.append((numero, fila))
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
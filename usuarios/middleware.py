@@ -0,0 +1,21 @@
+# usuarios/middleware.py
+
+from functools import partial
+
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .actor import obtener_actor, aobtener_actor
+
+
+class ActorMiddleware(MiddlewareMixin):
+    """
+    Expone `request.actor` (perfil, rol y ficha de Paciente o Kinesiólogo del
+    usuario; ver usuarios/actor.py) y `request.aactor()` para las vistas
+    asíncronas. Es perezoso: una petición que no lo usa no lo resuelve. Va
+    después de AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        request.actor = SimpleLazyObject(lambda: obtener_actor(request))
+        request.aactor = partial(aobtener_actor, request)
@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 17:45
+
+import re
+
+import usuarios.rut
+from django.db import migrations, models
+
+
+def normalizar_ruts(apps, schema_editor):
+    """
+    Rellena el RUT normalizado de los pacientes existentes. Si dos fichas
+    quedan con el mismo RUT (p. ej. '11111111-1' y '111111111'), solo la más
+    antigua lo recibe: la otra queda sin RUT normalizado para revisarla a mano.
+    """
+    Paciente = apps.get_model('usuarios', 'Paciente')
+    vistos = set()
+    lote = []
+    for paciente in Paciente.objects.only('pk', 'rut').order_by('pk').iterator(chunk_size=2000):
+        normalizado = re.sub(r'[^0-9K]', '', (paciente.rut or '').upper())
+        if not normalizado or normalizado in vistos:
+            continue
+        vistos.add(normalizado)
+        paciente.rut_normalizado = normalizado
+        lote.append(paciente)
+        if len(lote) >= 2000:
+            Paciente.objects.bulk_update(lote, ['rut_normalizado'])
+            lote = []
+    if lote:
+        Paciente.objects.bulk_update(lote, ['rut_normalizado'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0005_paginacion_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(normalizar_ruts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='paciente',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='paciente',
+            name='rut',
+            field=models.CharField(blank=True, max_length=12, null=True, validators=[usuarios.rut.validar_rut]),
+        ),
+    ]
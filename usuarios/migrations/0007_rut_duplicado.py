@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 20:10
+
+import re
+
+from django.db import migrations, models
+
+
+def marcar_duplicados(apps, schema_editor):
+    """
+    Marca las fichas que 0006_rut_normalizado dejó sin RUT normalizado por
+    repetir el RUT de otra más antigua: así Paciente.save() no intenta
+    normalizarlas (chocaría con el índice único) y el admin las lista para
+    corregirlas o fusionarlas.
+    """
+    Paciente = apps.get_model('usuarios', 'Paciente')
+    lote = []
+    for paciente in Paciente.objects.filter(rut_normalizado__isnull=True).only('pk', 'rut').iterator(chunk_size=2000):
+        if re.sub(r'[^0-9K]', '', (paciente.rut or '').upper()):
+            paciente.rut_duplicado = True
+            lote.append(paciente)
+    Paciente.objects.bulk_update(lote, ['rut_duplicado'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0006_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='rut_duplicado',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(marcar_duplicados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='paciente',
+            name='rut',
+            field=models.CharField(blank=True, max_length=12, null=True),
+        ),
+    ]
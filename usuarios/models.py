@@ -3,6 +3,8 @@
 from django.db import models
 from django.contrib.auth.models import User 
 
+from .rut import normalizar_rut
+
 
 KINESIOLOGO = 1
 PACIENTE = 2
@@ -39,7 +41,15 @@ class Kinesiologo(models.Model):
 
 class Paciente(models.Model):
     
-    rut = models.CharField(max_length=12, unique=True,null=True, blank=True)
+    # El dígito verificador se valida en el registro (RegistroPacienteForm), no aquí:
+    # las fichas antiguas con un RUT mal escrito deben poder editarse igual
+    rut = models.CharField(max_length=12, null=True, blank=True)
+    # Forma canónica del RUT ('12345678K'), mantenida en save(): login, registro y
+    # búsquedas consultan por igualdad esta columna (índice único)
+    rut_normalizado = models.CharField(max_length=12, unique=True, null=True, blank=True, editable=False)
+    # Ficha antigua cuyo RUT ya tiene otra ficha: queda sin RUT normalizado hasta
+    # que se corrija o se fusione (filtro "RUT duplicado" del admin)
+    rut_duplicado = models.BooleanField(default=False, editable=False)
     telefono = models.CharField(max_length=15)
     perfil = models.OneToOneField(Perfil, on_delete=models.CASCADE) 
 
@@ -62,8 +72,29 @@ class Paciente(models.Model):
         null=True, 
         verbose_name="Antecedentes Médicos Relevantes"
     )
+
+    class Meta:
+        # Listado de pacientes paginado por (apellido, id)
+        indexes = [
+            models.Index(fields=['apellido', 'id'], name='paciente_apellido_idx'),
+        ]
     
     
     
+    def save(self, *args, **kwargs):
+        normalizado = normalizar_rut(self.rut) or None
+        if self.rut_duplicado and normalizado and (
+            Paciente.objects.filter(rut_normalizado=normalizado).exclude(pk=self.pk).exists()
+        ):
+            # Sigue duplicada: se guarda sin RUT normalizado en vez de chocar con la otra ficha
+            normalizado = None
+        else:
+            self.rut_duplicado = False
+        self.rut_normalizado = normalizado
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rut' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'rut_normalizado', 'rut_duplicado'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.nombre} {self.apellido} ({self.rut})"
\ No newline at end of file
+        return f"{self.nombre} {self.apellido} ({self.rut})"
@@ -0,0 +1,47 @@
+# usuarios/rut.py
+
+"""
+RUT chileno: forma normalizada, dígito verificador y formato de despliegue.
+
+La forma normalizada (solo dígitos y la K mayúscula, sin puntos ni guion:
+'12345678K') es la que se guarda en Paciente.rut_normalizado, con índice
+único. Login, registro y búsquedas normalizan lo que escribe el usuario y
+consultan esa columna por igualdad.
+"""
+
+import re
+
+from django.core.exceptions import ValidationError
+
+
+RUT_NORMALIZADO = re.compile(r'^\d{7,8}[0-9K]$')
+
+
+def normalizar_rut(valor):
+    """'12.345.678-k' -> '12345678K'. Retorna '' si no hay nada que normalizar."""
+    if not valor:
+        return ''
+    return re.sub(r'[^0-9K]', '', valor.upper())
+
+
+def digito_verificador(cuerpo):
+    """Dígito verificador (módulo 11) del cuerpo numérico del RUT."""
+    suma = sum(int(digito) * (2 + posicion % 6) for posicion, digito in enumerate(reversed(cuerpo)))
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+def rut_valido(normalizado):
+    """True si el RUT normalizado tiene el largo correcto y su dígito verificador calza."""
+    return bool(RUT_NORMALIZADO.match(normalizado)) and digito_verificador(normalizado[:-1]) == normalizado[-1]
+
+
+def formatear_rut(normalizado):
+    """'12345678K' -> '12345678-K', el formato con que se registran los pacientes."""
+    return f"{normalizado[:-1]}-{normalizado[-1]}"
+
+
+def validar_rut(valor):
+    """Validador de campos de formulario (registro de pacientes nuevos)."""
+    if not rut_valido(normalizar_rut(valor)):
+        raise ValidationError("El RUT no es válido (revisa el dígito verificador).", code='rut_invalido')
@@ -0,0 +1,34 @@
+# usuarios/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .actor import invalidar_actor
+from .models import Perfil, Paciente, Kinesiologo
+
+
+# ----------------------------------------------------------------------
+# Actor de la petición (usuarios/actor.py)
+# ----------------------------------------------------------------------
+
+def _user_id(instancia):
+    if isinstance(instancia, Perfil):
+        return instancia.user_id
+    # La ficha casi siempre llega con su perfil ya cargado; si no, se lee solo el user_id
+    if type(instancia).perfil.is_cached(instancia):
+        return instancia.perfil.user_id
+    return Perfil.objects.filter(pk=instancia.perfil_id).values_list('user_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Perfil)
+@receiver([post_save, post_delete], sender=Paciente)
+@receiver([post_save, post_delete], sender=Kinesiologo)
+def invalidar_actor_usuario(sender, instance, **kwargs):
+    """
+    El actor guardado en las sesiones del usuario deja de ser válido. Se
+    invalida al confirmar la transacción: antes, otra petición podría releer
+    los datos antiguos y guardarlos con la versión nueva.
+    """
+    user_id = _user_id(instance)
+    transaction.on_commit(lambda: invalidar_actor(user_id))
@@ -1,3 +1,154 @@
+import time
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+
+from .models import Perfil, Paciente, KINESIOLOGO
+from .actor import VIGENCIA_VERSION
+from .limite_intentos import BLOQUEO, FALLOS_POR_IDENTIFICADOR
+from .rut import normalizar_rut, rut_valido
+
+
+class RutNormalizadoTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='11111111-1')
+        perfil = Perfil.objects.create(user=user, nombre='Ana', apellido='Rojas')
+        # RUT guardado tal como se escribió, con puntos
+        self.paciente = Paciente.objects.create(
+            perfil=perfil, rut='11.111.111-1', telefono='912345678', nombre='Ana', apellido='Rojas',
+        )
+
+    def test_normalizacion_y_digito_verificador(self):
+        self.assertEqual(self.paciente.rut_normalizado, '111111111')
+        self.assertEqual(normalizar_rut(' 12.345.678-k '), '12345678K')
+        self.assertTrue(rut_valido('123456785'))
+        self.assertTrue(rut_valido('10000013K'))
+        self.assertFalse(rut_valido('123456789'))
+        self.assertFalse(rut_valido('11'))
+
+    def test_login_con_cualquier_formato_en_una_consulta(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(reverse('usuarios:autenticar_paciente'), {'rut': '111111111', 'clave_celular': '5678'})
+        self.assertRedirects(respuesta, reverse('citas:agenda'), fetch_redirect_response=False)
+        consultas_paciente = [consulta['sql'] for consulta in consultas if 'usuarios_paciente' in consulta['sql']]
+        self.assertEqual(len(consultas_paciente), 1)
+        self.assertIn('rut_normalizado', consultas_paciente[0])
+
+    def test_registro_guarda_formato_canonico_y_rechaza_duplicados(self):
+        datos = {
+            'rut': '12.345.678-5', 'nombre': 'Luis', 'apellido': 'Soto', 'telefono': '987654321',
+            'email': 'luis@example.com', 'prevision': 'F',
+        }
+        respuesta = self.client.post(reverse('usuarios:registro_paciente'), datos)
+        self.assertRedirects(respuesta, reverse('usuarios:autenticar_paciente'), fetch_redirect_response=False)
+        paciente = Paciente.objects.get(rut_normalizado='123456785')
+        self.assertEqual((paciente.rut, paciente.perfil.user.username), ('12345678-5', '12345678-5'))
+
+        for rut in ('123456785', '11111111-1', '12.345.678-9'):
+            respuesta = self.client.post(reverse('usuarios:registro_paciente'), dict(datos, rut=rut))
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertTrue(respuesta.context['form'].errors['rut'])
+        self.assertEqual(Paciente.objects.count(), 2)
+
+    def test_ficha_antigua_duplicada_o_mal_escrita_se_puede_guardar(self):
+        # Como las deja 0006_rut_normalizado: el mismo RUT que otra ficha, sin RUT normalizado
+        perfil = Perfil.objects.create(user=User.objects.create_user(username='legado'), nombre='Ana', apellido='Rojas')
+        duplicada = Paciente.objects.create(perfil=perfil, rut='22222222-2', telefono='1', nombre='Ana', apellido='Rojas')
+        Paciente.objects.filter(pk=duplicada.pk).update(rut='111111111', rut_normalizado=None)
+        import_module('usuarios.migrations.0007_rut_duplicado').marcar_duplicados(apps, None)
+
+        duplicada = Paciente.objects.get(pk=duplicada.pk)
+        self.assertTrue(duplicada.rut_duplicado)
+        duplicada.telefono = '2'
+        duplicada.save()
+        self.assertEqual(Paciente.objects.filter(rut_duplicado=True, rut_normalizado__isnull=True).count(), 1)
+
+        # Al corregir el RUT deja de estar marcada
+        duplicada.rut = '12.345.678-5'
+        duplicada.save(update_fields=['rut'])
+        duplicada.refresh_from_db()
+        self.assertEqual((duplicada.rut_duplicado, duplicada.rut_normalizado), (False, '123456785'))
+
+        # Un RUT antiguo con dígito verificador erróneo no impide editar la ficha
+        duplicada.rut = '12.345.678-9'
+        duplicada.full_clean()
+
+
+class LimiteIntentosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for rut in ('11111111-1', '22222222-2'):
+            user = User.objects.create_user(username=rut)
+            perfil = Perfil.objects.create(user=user, nombre='Ana', apellido='Rojas')
+            Paciente.objects.create(perfil=perfil, rut=rut, telefono='912345678', nombre='Ana', apellido='Rojas')
+        user = User.objects.create_user(username='kine', password='secreta')
+        Perfil.objects.create(user=user, nombre='Kine', apellido='Prueba', rol=KINESIOLOGO)
+
+    def intentar(self, rut, clave):
+        return self.client.post(reverse('usuarios:autenticar_paciente'), {'rut': rut, 'clave_celular': clave})
+
+    def test_bloquea_el_rut_sin_consultar_la_bd_y_por_tiempo_acotado(self):
+        for _ in range(FALLOS_POR_IDENTIFICADOR):
+            self.assertEqual(self.intentar('11111111-1', '0000').status_code, 200)
+
+        with self.assertNumQueries(0):
+            respuesta = self.intentar('11.111.111-1', '5678')
+        self.assertEqual(respuesta.status_code, 429)
+        # Otro RUT desde la misma IP sigue pudiendo entrar
+        self.assertEqual(self.intentar('22222222-2', '5678').status_code, 302)
+
+        with mock.patch('usuarios.limite_intentos.time.time', return_value=time.time() + BLOQUEO + 1):
+            self.assertEqual(self.intentar('11111111-1', '5678').status_code, 302)
+
+    def test_login_de_kinesiologo(self):
+        url = reverse('usuarios:autenticar_kinesiologo')
+        for _ in range(FALLOS_POR_IDENTIFICADOR):
+            self.client.post(url, {'username': 'kine', 'password': 'otra'})
+        with self.assertNumQueries(0):
+            respuesta = self.client.post(url, {'username': 'KINE', 'password': 'secreta'})
+        self.assertEqual(respuesta.status_code, 429)
+
+
+class ActorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='11111111-1')
+        perfil = Perfil.objects.create(user=user, nombre='Ana', apellido='Rojas')
+        self.paciente = Paciente.objects.create(perfil=perfil, rut='11111111-1', telefono='912345678', nombre='Ana', apellido='Rojas')
+        self.client.force_login(user)
+
+    def consultas_actor(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('citas:lista_espera'))
+        self.assertEqual(respuesta.status_code, 200)
+        return [consulta['sql'] for consulta in consultas if 'FROM "usuarios_perfil"' in consulta['sql']]
+
+    def test_se_guarda_en_la_sesion_y_se_invalida_al_cambiar_la_ficha(self):
+        [consulta] = self.consultas_actor()
+        # Perfil, Paciente y Kinesiologo en una sola consulta
+        self.assertIn('usuarios_paciente', consulta)
+        self.assertIn('usuarios_kinesiologo', consulta)
+        self.assertEqual(self.consultas_actor(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paciente.telefono = '911112222'
+            self.paciente.save()
+        self.assertEqual(len(self.consultas_actor()), 1)
+        self.assertEqual(self.consultas_actor(), [])
+
+    def test_la_version_expira_y_otro_proceso_relee_el_actor(self):
+        self.assertEqual(len(self.consultas_actor()), 1)
+        # Otro worker cambia la ficha: su invalidación no llega a la caché de este proceso
+        Paciente.objects.filter(pk=self.paciente.pk).update(telefono='911112222')
+        self.assertEqual(self.consultas_actor(), [])
 
-# Create your tests here.
+        despues = time.time() + VIGENCIA_VERSION + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=despues):
+            self.assertEqual(len(self.consultas_actor()), 1)
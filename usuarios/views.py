@@ -5,25 +5,25 @@ from django.views.decorators.http import require_http_methods
 from django.views import View
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-import re 
+from django.db import IntegrityError, transaction
 
 
 # >>>>>>>>>>>>>>>>>> CORRECCIÓN AQUÍ <<<<<<<<<<<<<<<<<<<<
 # Importamos la constante KINESIOLOGO y el modelo Kinesiologo
 from .models import Paciente, Perfil, Kinesiologo, KINESIOLOGO, PACIENTE
 from citas.forms import RegistroPacienteForm
+from .rut import normalizar_rut
+from .limite_intentos import (
+    AMBITO_PACIENTE, AMBITO_KINESIOLOGO, ip_cliente, segundos_bloqueado, registrar_fallo, limpiar_fallos,
+)
 
 User = get_user_model()
 
 
-def clean_rut(rut_string):
-    """Limpia el RUT de puntos, guiones y espacios para la búsqueda en BD."""
-    if not rut_string:
-        return ""
-    
-    rut_string = rut_string.replace('.', '').replace('-', '').upper().strip()
-    
-    return re.sub(r'[^0-9K]', '', rut_string)
+def mensaje_bloqueo(request, segundos):
+    """Avisa que se excedieron los intentos; la respuesta va con estado 429."""
+    minutos = -(-segundos // 60)
+    messages.error(request, f"Demasiados intentos fallidos. Intenta nuevamente en {minutos} minuto(s).")
 
 
 def inicio_usuarios(request):
@@ -62,16 +62,24 @@ def autenticar_paciente(request):
         clave_celular = request.POST.get('clave_celular')
 
         
-        rut = clean_rut(rut_formato_sucio)
+        rut = normalizar_rut(rut_formato_sucio)
 
         if not rut or not clave_celular:
             messages.error(request, "Debe ingresar el RUT y la clave celular.")
             
             return render(request, 'usuarios_login.html', {'rut': rut_formato_sucio, 'clave_celular': clave_celular})
 
+        # Límite de intentos: se revisa en la caché, antes de tocar la BD
+        ip = ip_cliente(request)
+        espera = segundos_bloqueado(AMBITO_PACIENTE, rut, ip)
+        if espera:
+            mensaje_bloqueo(request, espera)
+            return render(request, 'usuarios_login.html', {'rut': rut_formato_sucio}, status=429)
+
         try:
             
-            paciente = Paciente.objects.get(rut=rut)
+            # Una sola consulta por el índice único del RUT normalizado (con el usuario, para el login)
+            paciente = Paciente.objects.select_related('perfil__user').get(rut_normalizado=rut)
 
             
             telefono = paciente.telefono if paciente.telefono else ""
@@ -81,6 +89,7 @@ def autenticar_paciente(request):
             if clave_celular == ultimos_4_digitos:
                 
                 login(request, paciente.perfil.user)
+                limpiar_fallos(AMBITO_PACIENTE, rut)
 
                 messages.success(request, f"¡Bienvenido/a, {paciente.nombre}!")
                 
@@ -88,9 +97,11 @@ def autenticar_paciente(request):
                 return redirect('citas:agenda') 
                 
             else:
+                registrar_fallo(AMBITO_PACIENTE, rut, ip)
                 messages.error(request, "RUT o clave celular incorrectos.")
 
         except Paciente.DoesNotExist:
+            registrar_fallo(AMBITO_PACIENTE, rut, ip)
             messages.error(request, "RUT no encontrado en el sistema. ¿Necesitas registrarte?")
         except AttributeError:
             messages.error(request, "Error de sistema: El paciente no tiene un usuario asociado.")
@@ -117,34 +128,40 @@ class RegistroPacienteView(View):
         form = RegistroPacienteForm(request.POST)
 
         if form.is_valid():
-            try:
-                
-                rut = form.cleaned_data['rut']
-                email = form.cleaned_data['email']
-                nombre = form.cleaned_data['nombre']
-                apellido = form.cleaned_data['apellido']
-                telefono = form.cleaned_data['telefono']
-
-                
-                clave_inicial = telefono[-4:] if len(telefono) >= 4 else "0000"
-
-                
-                user = User.objects.create_user(
-                    username=rut,
-                    email=email,
-                    first_name=nombre,
-                    last_name=apellido,
-                    password=clave_inicial
-                )
-
-                
-                perfil, created = Perfil.objects.get_or_create(user=user)
+            # El formulario entrega el RUT ya validado y en su formato canónico
+            rut = form.cleaned_data['rut']
+            email = form.cleaned_data['email']
+            nombre = form.cleaned_data['nombre']
+            apellido = form.cleaned_data['apellido']
+            telefono = form.cleaned_data['telefono']
 
-                
-                paciente = form.save(commit=False)
-                paciente.perfil = perfil
-                paciente.save()
+            
+            clave_inicial = telefono[-4:] if len(telefono) >= 4 else "0000"
 
+            try:
+                with transaction.atomic():
+                    user = User.objects.create_user(
+                        username=rut,
+                        email=email,
+                        first_name=nombre,
+                        last_name=apellido,
+                        password=clave_inicial
+                    )
+
+                    
+                    perfil, created = Perfil.objects.get_or_create(user=user)
+
+                    
+                    paciente = form.save(commit=False)
+                    paciente.perfil = perfil
+                    paciente.save()
+
+            except IntegrityError:
+                # El índice único del RUT (o del usuario) rechazó un registro concurrente con el mismo RUT
+                form.add_error('rut', "Ya existe un paciente registrado con este RUT.")
+            except Exception as e:
+                messages.error(request, f"Error al crear el perfil de paciente. Contacte a soporte. Error: {e}")
+            else:
                 messages.success(
                     request,
                     f"¡Registro exitoso! Ya puedes iniciar sesión con tu RUT y la clave **{clave_inicial}** (los 4 últimos dígitos de tu celular)."
@@ -153,12 +170,6 @@ class RegistroPacienteView(View):
                 
                 return redirect(reverse('usuarios:autenticar_paciente'))
 
-            except Exception as e:
-                
-                if 'user' in locals():
-                    user.delete()
-                messages.error(request, f"Error al crear el perfil de paciente. Contacte a soporte. Error: {e}")
-
         return render(request, self.template_name, {'form': form})
     
 # usuarios/views.py (PEGA ESTO AL FINAL DEL ARCHIVO)
@@ -173,6 +184,14 @@ def autenticar_kinesiologo(request):
         username = request.POST.get('username') # Asumimos que es el RUT
         password = request.POST.get('password')
 
+        # Límite de intentos antes de authenticate (que consulta la BD y calcula el hash)
+        identificador = (username or '').strip().lower()
+        ip = ip_cliente(request)
+        espera = segundos_bloqueado(AMBITO_KINESIOLOGO, identificador, ip)
+        if espera:
+            mensaje_bloqueo(request, espera)
+            return render(request, 'usuarios_login_kine.html', status=429)
+
         user = authenticate(request, username=username, password=password)
 
         if user is not None:
@@ -181,6 +200,7 @@ def autenticar_kinesiologo(request):
                 # La constante KINESIOLOGO ahora está definida gracias a la importación
                 if user.perfil.rol == KINESIOLOGO:
                     login(request, user)
+                    limpiar_fallos(AMBITO_KINESIOLOGO, identificador)
                     messages.success(request, f"Bienvenido/a Kine {user.first_name}.")
                     # Redirigir al Dashboard del Kinesiólogo
                     return redirect('citas:kinesiologo_dashboard')
@@ -192,6 +212,7 @@ def autenticar_kinesiologo(request):
                 messages.error(request, "Error de perfil. Contacte a soporte.")
                 return render(request, 'usuarios_login_kine.html')
         else:
+            registrar_fallo(AMBITO_KINESIOLOGO, identificador, ip)
             messages.error(request, "Credenciales incorrectas o usuario no activo.")
 
     # Renderizar el formulario de login (crea este template simple)